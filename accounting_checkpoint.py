@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import time
+import zlib
+from hotspot_logging import get_logger
+
+log = get_logger("checkpoint")
+
+# --- Configuration ---
+CHECKPOINT_FILE = 'hotspot_accounting.ckpt'
+CHECKPOINT_INTERVAL = 30     # Seconds between checkpoints while the hotspot is up (also written on shutdown)
+MAX_CHECKPOINT_AGE = 7 * 86400  # Older checkpoints are ignored
+
+# --- Binary layout (network byte order) ---
+# header: magic, version, saved_at, record count
+# record: key length, key (utf-8), flags, then the parts present in flags, in this order
+# trailer: CRC32 of everything before it
+_MAGIC = b'HSAC'
+_VERSION = 1
+_HEADER = struct.Struct('!4sHdI')
+_KEY = struct.Struct('!B')
+_FLAGS = struct.Struct('!B')
+_RAW = struct.Struct('!BHIIQQ')      # source, class id, ifindex (interface), ifindex (ifb), rx, tx
+_TRACKER = struct.Struct('!QQQQdd')  # last rx, last tx, total rx, total tx, first seen, last update
+_QUOTA = struct.Struct('!dQQB')      # period start, used dl, used ul, throttled
+_CRC = struct.Struct('!I')
+HAS_RAW, HAS_TC_TRACKER, HAS_IPT_TRACKER, HAS_QUOTA = 1, 2, 4, 8
+SOURCE_TC, SOURCE_IPTABLES = 1, 2
+
+
+def _ifindex(device):
+    """Kernel interface index (changes when the device is recreated, e.g. the IFB on a cold tc setup)."""
+    try:
+        with open(f"/sys/class/net/{device}/ifindex") as f: return int(f.read().strip())
+    except (OSError, ValueError): return 0
+
+
+def counter_identity(limiter, ip):
+    """Which kernel counter 'ip' is read from now: (source, class id, ifindex, ifb ifindex) on the device's interface."""
+    shaper = limiter.limiter_for(ip)
+    class_id = shaper.ip_to_class.get(ip)
+    if ip in shaper.limits and class_id is not None:
+        return (SOURCE_TC, class_id, _ifindex(shaper.interface), _ifindex(shaper.ifb_device))
+    return (SOURCE_IPTABLES, 0, _ifindex(shaper.interface), 0)
+
+
+def _clamp(value):
+    return min(max(int(value or 0), 0), 2 ** 64 - 1)
+
+
+def snapshot_accounting(manager):
+    """
+    Copies the accounting state into plain tuples: {key: {'raw', 'tc', 'ipt', 'quota'}}.
+    Cheap; call it from the thread that owns the state (the daemon's main loop),
+    then hand the result to write_checkpoint() in a worker thread.
+    """
+    limiter = manager.bandwidth_limiter
+    records = {}
+    for ip, raw in manager.last_raw_bytes.items():
+        records.setdefault(ip, {})['raw'] = (*counter_identity(limiter, ip), _clamp(raw.get('rx')), _clamp(raw.get('tx')))
+    for name, tracker in (('tc', manager.tc_tracker), ('ipt', manager.iptables_tracker)):
+        for ip, stats in list(tracker.device_stats.items()):
+            records.setdefault(ip, {})[name] = (_clamp(stats['last_rx_bytes']), _clamp(stats['last_tx_bytes']), _clamp(stats['total_rx_bytes']), _clamp(stats['total_tx_bytes']), float(stats['first_seen']), float(stats['last_update']))
+    for key, quota in manager.device_quotas.items():
+        records.setdefault(key, {})['quota'] = (float(quota['start_time']), _clamp(quota.get('used_dl_bytes')), _clamp(quota.get('used_ul_bytes')), 1 if quota.get('is_throttled') else 0)
+    return records
+
+
+def encode_checkpoint(records, saved_at=None):
+    parts = [_HEADER.pack(_MAGIC, _VERSION, saved_at or time.time(), len(records))]
+    for key, record in records.items():
+        encoded_key = key.encode()[:255]
+        flags = (HAS_RAW if 'raw' in record else 0) | (HAS_TC_TRACKER if 'tc' in record else 0) | (HAS_IPT_TRACKER if 'ipt' in record else 0) | (HAS_QUOTA if 'quota' in record else 0)
+        parts += [_KEY.pack(len(encoded_key)), encoded_key, _FLAGS.pack(flags)]
+        if 'raw' in record: parts.append(_RAW.pack(*record['raw']))
+        if 'tc' in record: parts.append(_TRACKER.pack(*record['tc']))
+        if 'ipt' in record: parts.append(_TRACKER.pack(*record['ipt']))
+        if 'quota' in record: parts.append(_QUOTA.pack(*record['quota']))
+    body = b''.join(parts)
+    return body + _CRC.pack(zlib.crc32(body))
+
+
+def decode_checkpoint(data):
+    """Returns (saved_at, records), or raises ValueError for a truncated, corrupt or foreign file."""
+    if len(data) < _HEADER.size + _CRC.size: raise ValueError("checkpoint too short")
+    body, (crc,) = data[:-_CRC.size], _CRC.unpack(data[-_CRC.size:])
+    if zlib.crc32(body) != crc: raise ValueError("checkpoint CRC mismatch")
+    magic, version, saved_at, count = _HEADER.unpack_from(body)
+    if magic != _MAGIC or version != _VERSION: raise ValueError(f"not a version {_VERSION} checkpoint")
+    offset = _HEADER.size; records = {}
+    try:
+        for _ in range(count):
+            (length,) = _KEY.unpack_from(body, offset); offset += _KEY.size
+            key = body[offset:offset + length].decode(); offset += length
+            (flags,) = _FLAGS.unpack_from(body, offset); offset += _FLAGS.size
+            record = records[key] = {}
+            for flag, name, layout in ((HAS_RAW, 'raw', _RAW), (HAS_TC_TRACKER, 'tc', _TRACKER), (HAS_IPT_TRACKER, 'ipt', _TRACKER), (HAS_QUOTA, 'quota', _QUOTA)):
+                if flags & flag: record[name] = layout.unpack_from(body, offset); offset += layout.size
+    except (struct.error, UnicodeDecodeError) as e: raise ValueError(f"checkpoint truncated: {e}")
+    if offset != len(body): raise ValueError("checkpoint has trailing data")
+    return saved_at, records
+
+
+def write_checkpoint(records, path=CHECKPOINT_FILE):
+    """Atomically replaces the checkpoint file (temp file, fsync, rename): a crash leaves the old or the new one."""
+    data = encode_checkpoint(records)
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data); f.flush(); os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        return True
+    except OSError as e:
+        log.warning(f"⚠️ Accounting checkpoint not written: {e}")
+        return False
+
+
+def read_checkpoint(path=CHECKPOINT_FILE):
+    """(saved_at, records) from the checkpoint file, or None if there is no usable one."""
+    try:
+        with open(path, 'rb') as f: saved_at, records = decode_checkpoint(f.read())
+    except FileNotFoundError: return None
+    except (OSError, ValueError) as e:
+        log.warning(f"⚠️ Ignoring accounting checkpoint {path}: {e}"); return None
+    if not 0 <= time.time() - saved_at <= MAX_CHECKPOINT_AGE:
+        log.info(f"ℹ️ Ignoring accounting checkpoint from {time.ctime(saved_at)} (too old)"); return None
+    return saved_at, records
+
+
+def restore_accounting(manager, networks, checkpoint):
+    """
+    Sets the per-device counter baselines from the live kernel counters and, where
+    the checkpoint is still valid, continues from it:
+      - raw counters: the saved value is kept as the baseline only if the device is
+        still counted by the same kernel object (tc class on the same devices, or
+        the iptables chain) and the live counter has not gone backwards. Then the
+        next delta includes the traffic seen while the daemon was down; otherwise
+        the live value becomes the baseline, so nothing is counted twice.
+      - trackers: session totals and first-seen times carry over.
+      - quotas: usage of the same period (same start time) continues from the
+        larger of the checkpoint and the database.
+    Works without a checkpoint too (checkpoint=None): just the live baselines.
+    Returns {'continued', 'rebased', 'quotas'} counts.
+    """
+    limiter = manager.bandwidth_limiter
+    records = checkpoint[1] if checkpoint else {}
+    live = {ip: {'rx': c['rx'], 'tx': c['tx']} for ip, c in manager.get_iptables_stats(networks).items() if ip not in limiter.limits}
+    live.update(limiter.get_tc_stats()) # Limited devices are counted by their tc class
+    counts = {'continued': 0, 'rebased': 0, 'quotas': 0}
+    for ip in set(live) | {key for key, record in records.items() if 'raw' in record}:
+        current = live.get(ip, {'rx': 0, 'tx': 0})
+        saved = records.get(ip, {}).get('raw')
+        identity = counter_identity(limiter, ip)
+        if saved and tuple(saved[:4]) == identity and current['rx'] >= saved[4] and current['tx'] >= saved[5]:
+            baseline = {'rx': saved[4], 'tx': saved[5]}; counts['continued'] += 1
+        else:
+            baseline = dict(current); counts['rebased'] += 1
+        manager.last_raw_bytes[ip] = baseline
+        record = records.get(ip, {})
+        for name, tracker in (('tc', manager.tc_tracker), ('ipt', manager.iptables_tracker)):
+            saved_stats = record.get(name)
+            active = (name == 'tc') == (identity[0] == SOURCE_TC)
+            if not saved_stats and not active: continue
+            stats = tracker.device_stats[ip]
+            if saved_stats:
+                last_rx, last_tx, stats['total_rx_bytes'], stats['total_tx_bytes'], stats['first_seen'], stats['last_update'] = saved_stats
+                stats['last_rx_bytes'], stats['last_tx_bytes'] = last_rx, last_tx
+            if active: stats['last_rx_bytes'], stats['last_tx_bytes'] = baseline['rx'], baseline['tx'] # Same baseline as the quota deltas
+    for key, quota in manager.device_quotas.items():
+        saved = records.get(key, {}).get('quota')
+        if not saved or saved[0] != quota['start_time']: continue # Different period: the database is authoritative
+        quota['used_dl_bytes'] = max(quota.get('used_dl_bytes', 0), saved[1])
+        quota['used_ul_bytes'] = max(quota.get('used_ul_bytes', 0), saved[2])
+        quota['is_throttled'] = bool(quota.get('is_throttled') or saved[3])
+        counts['quotas'] += 1
+    manager.refresh_quota_policy()
+    log.info(f"♻️ Accounting restored: {counts['continued']} counter(s) continued, {counts['rebased']} rebased, {counts['quotas']} quota(s) merged")
+    return counts
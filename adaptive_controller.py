@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import time
+from hotspot_logging import get_logger
+
+log = get_logger("adaptive")
+
+# --- Configuration ---
+ENGAGE_UTILIZATION = 0.90     # Start sharing when measured load stays above this...
+RELEASE_UTILIZATION = 0.70    # ...and stop once it stays below this (hysteresis band)
+FORECAST_ENGAGE = 0.85        # Predicted congestion that lets us engage early (at RELEASE_UTILIZATION)
+DWELL_SECONDS = 10            # A condition must hold this long before the state flips
+UPDATE_DWELL_SECONDS = 5      # Minimum time between rate changes of one device
+CHANGE_TOLERANCE = 0.15       # Ignore rate changes smaller than 15%
+DEMAND_HEADROOM = 1.25        # Let devices probe for more than they currently use
+MIN_SHARE_KBPS = 256          # Never squeeze an active device below this
+ADAPTIVE_PRIORITY = 7         # Low HTB priority for adaptive classes
+
+
+def max_min_fair_share(capacity, demands):
+    """
+    Water-filling: returns {key: allocation} for {key: demand}. Devices asking
+    for less than the fair share get their demand; the rest split what is left
+    equally, so nobody can starve anybody else. O(n log n).
+    """
+    allocations = {}
+    remaining = max(capacity, 0.0)
+    ordered = sorted(demands.items(), key=lambda item: item[1])
+    for index, (key, demand) in enumerate(ordered):
+        share = remaining / (len(ordered) - index)
+        if demand <= share:
+            allocations[key] = demand
+            remaining -= demand
+        else:
+            # Every remaining device wants at least 'share': the water level is reached
+            for other, _ in ordered[index:]: allocations[other] = share
+            break
+    return allocations
+
+
+class AdaptiveController:
+    """
+    Closed-loop congestion controller. Each tick it takes the measured per-device
+    rates and the current ISP capacity; while the link is congested it caps the
+    unmanaged devices at their max-min fair share of what the managed devices
+    leave over. Engaging/releasing uses a hysteresis band with dwell times, and
+    per-device changes are rate limited so tc is not churned every second.
+    """
+    def __init__(self):
+        self.engaged = False
+        self.condition_since = None   # When the opposite condition started holding
+        self.forecast_congestion = 0.0
+        self.limits = {}              # {ip: {'download', 'upload', 'priority'}} currently granted
+        self.last_change = {}         # {ip: monotonic time of the last rate change}
+
+    def _update_state(self, utilization, now):
+        if self.engaged:
+            flip = utilization < RELEASE_UTILIZATION
+        else:
+            threshold = RELEASE_UTILIZATION if self.forecast_congestion > FORECAST_ENGAGE else ENGAGE_UTILIZATION
+            flip = utilization > threshold
+        if not flip:
+            self.condition_since = None
+            return
+        if self.condition_since is None: self.condition_since = now
+        if now - self.condition_since >= DWELL_SECONDS:
+            self.engaged = not self.engaged
+            self.condition_since = None
+            log.info(f"🚦 Link {'congested' if self.engaged else 'clear'} (load {utilization*100:.0f}%). "
+                     f"{'Sharing capacity fairly.' if self.engaged else 'Releasing fair-share limits.'}")
+
+    def _significant(self, old, new):
+        return old is None or abs(new - old) > CHANGE_TOLERANCE * max(old, 1)
+
+    def update(self, rates, capacity_dl_kbps, capacity_ul_kbps, managed_ips, now=None):
+        """
+        rates: {ip: (download_kbps, upload_kbps)} measured this tick for active devices.
+        managed_ips: devices a higher policy layer controls, or that cannot be given
+        a tc class (left out of the split, but their traffic still uses up capacity).
+        Returns the new {ip: limit} map for the adaptive layer, or None if unchanged.
+        """
+        now = time.monotonic() if now is None else now
+        total_dl = sum(dl for dl, _ in rates.values())
+        total_ul = sum(ul for _, ul in rates.values())
+        utilization = max(total_dl / capacity_dl_kbps if capacity_dl_kbps > 0 else 0.0,
+                          total_ul / capacity_ul_kbps if capacity_ul_kbps > 0 else 0.0)
+        was_engaged = self.engaged
+        self._update_state(utilization, now)
+
+        if not self.engaged:
+            if not was_engaged and not self.limits: return None
+            self.limits = {}; self.last_change = {}
+            return {}
+
+        eligible = {ip: r for ip, r in rates.items() if ip not in managed_ips}
+        managed_dl = sum(r[0] for ip, r in rates.items() if ip in managed_ips)
+        managed_ul = sum(r[1] for ip, r in rates.items() if ip in managed_ips)
+        shares_dl = max_min_fair_share(capacity_dl_kbps - managed_dl, {ip: r[0] * DEMAND_HEADROOM + MIN_SHARE_KBPS for ip, r in eligible.items()})
+        shares_ul = max_min_fair_share(capacity_ul_kbps - managed_ul, {ip: r[1] * DEMAND_HEADROOM + MIN_SHARE_KBPS for ip, r in eligible.items()})
+
+        # Capacity nobody is asking for is handed out equally, so the link stays saturated
+        spare_dl = max(capacity_dl_kbps - managed_dl - sum(shares_dl.values()), 0) / max(len(eligible), 1)
+        spare_ul = max(capacity_ul_kbps - managed_ul - sum(shares_ul.values()), 0) / max(len(eligible), 1)
+
+        new_limits = {}
+        for ip in eligible:
+            target_dl = int(max(shares_dl.get(ip, 0) + spare_dl, MIN_SHARE_KBPS))
+            target_ul = int(max(shares_ul.get(ip, 0) + spare_ul, MIN_SHARE_KBPS))
+            current = self.limits.get(ip)
+            if current is not None:
+                recently_changed = now - self.last_change.get(ip, 0) < UPDATE_DWELL_SECONDS
+                if recently_changed or not (self._significant(current['download'], target_dl) or self._significant(current['upload'], target_ul)):
+                    new_limits[ip] = current
+                    continue
+            new_limits[ip] = {'download': target_dl, 'upload': target_ul, 'priority': ADAPTIVE_PRIORITY}
+            self.last_change[ip] = now
+        for ip in list(self.last_change):
+            if ip not in new_limits: self.last_change.pop(ip, None)
+
+        if new_limits == self.limits: return None
+        self.limits = new_limits
+        return dict(new_limits)
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -72,14 +74,29 @@ TEMPLATES = [
 WSGI_APPLICATION = 'bandwidth_dashboard.wsgi.application'
 ASGI_APPLICATION = 'bandwidth_dashboard.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        'CONFIG': {
-            "hosts": [('127.0.0.1', 6379)],
+# 'redis' (default, also works across hosts) or 'unix' (single host, no Redis server).
+# Must match HOTSPOT_CHANNEL_LAYER of web_daemon.py, which hosts the Unix socket.
+HOTSPOT_CHANNEL_LAYER = os.environ.get('HOTSPOT_CHANNEL_LAYER', 'redis')
+sys.path.append(str(BASE_DIR.parent)) # uds_channel_layer.py and hotspot_logging.py live next to web_daemon.py
+
+if HOTSPOT_CHANNEL_LAYER == 'unix':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'uds_channel_layer.UnixSocketChannelLayer',
+            'CONFIG': {
+                "path": os.environ.get('HOTSPOT_CHANNEL_SOCKET', '/tmp/hotspot_channels.sock'),
+            },
         },
-    },
-}
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                "hosts": [('127.0.0.1', 6379)],
+            },
+        },
+    }
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -132,3 +149,22 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Logging: the consumers log through a bounded queue (see monitor/log_queue.py, built on hotspot_logging.py).
+# HOTSPOT_LOG_LEVEL=DEBUG shows every forwarded command and received message.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'queued': {
+            '()': 'monitor.log_queue.queued_stdout_handler',
+        },
+    },
+    'loggers': {
+        'monitor': {
+            'handlers': ['queued'],
+            'level': os.environ.get('HOTSPOT_LOG_LEVEL', 'INFO').upper(),
+            'propagate': False,
+        },
+    },
+}
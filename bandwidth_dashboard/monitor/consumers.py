@@ -1,164 +1,435 @@
 # monitor/consumers.py
 import json
+import time
+import asyncio
+import logging
+from collections import deque
 from channels.generic.websocket import AsyncWebsocketConsumer # type: ignore
-import traceback 
+from django.conf import settings # type: ignore
+
+log = logging.getLogger("monitor.consumers") # Queued to a writer thread, see LOGGING in settings.py
+
+# --- Live topics (must match live_topics.py in the daemon) ---
+LIVE_INTERVALS = (1, 2, 5, 10, 30)
+LIVE_TOPICS = ('summary', 'devices', 'security', 'forecast') # Plus 'device:<ip>'
+EVENT_TOPICS = ('security', 'forecast')
+
+def live_stream(topic, interval):
+    """ Stream name of a topic at a requested interval (rounded up like the daemon does). """
+    if topic in EVENT_TOPICS: return topic
+    try: interval = next((i for i in LIVE_INTERVALS if float(interval) <= i), LIVE_INTERVALS[-1])
+    except (TypeError, ValueError): interval = LIVE_INTERVALS[0]
+    return f"{topic}@{interval}"
+
+def live_group(stream):
+    return "live." + stream.replace(':', '-').replace('@', '.')
+
+# --- Read models (must match read_models.py in the daemon) ---
+READ_MODEL_PREFIX = "hotspot:read:"
+_read_model_redis = None
+
+def read_model_redis():
+    """ One Redis client per worker process, on the channel layer's host. None without Redis (Unix socket layer). """
+    global _read_model_redis
+    if settings.HOTSPOT_CHANNEL_LAYER != 'redis': return None
+    if _read_model_redis is None:
+        import redis.asyncio as aioredis # type: ignore # Ships with channels_redis
+        host, port = settings.CHANNEL_LAYERS['default']['CONFIG']['hosts'][0]
+        _read_model_redis = aioredis.Redis(host=host, port=port)
+    return _read_model_redis
+
+# --- Outbound queue ---
+RELIABLE_QUEUE_MAX = 100   # Notifications/replies waiting for a client; beyond this it is hopeless, disconnect it
+MAX_IN_FLIGHT = 3          # Live frames per stream sent but not acked yet before we hold off
 
 class NetworkConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.group_name = 'network_data'
         await self.channel_layer.group_add( self.group_name, self.channel_name )
-        print(f"WS connected: {self.channel_name}, joined {self.group_name}")
+        log.info(f"WS connected: {self.channel_name}, joined {self.group_name}")
         await self.accept()
+        self.topics = {}          # { topic: stream } this client subscribed to
+        self.streams = {}         # { stream: (epoch, seq) } last frame sent (absent = waiting for a snapshot)
+        self.daemon_epoch = None  # From the daemon heartbeat; a change means it restarted
+        # Outbound queue: reliable messages keep their order, live frames keep only the newest per stream
+        self.reliable = deque()
+        self.live_pending = {}    # { stream: (frame, seq) } one slot per stream
+        self.stale = set()        # Streams whose pending frames were superseded: resync once the client keeps up
+        self.sent_seq = {}        # { stream: seq of the last frame sent }
+        self.acked_seq = {}       # { stream: last seq the client acknowledged }
+        self.sent_at = {}         # { stream: {seq: monotonic} } for lag measurement
+        self.acks_seen = False    # Clients that never ack (old script) are not flow controlled
+        self.stats = {"sent": 0, "dropped": 0, "resyncs": 0, "reliable_max": 0, "lag_ms": 0.0}
+        self.outbox_ready = asyncio.Event()
+        self.sender_task = asyncio.create_task(self.sender())
 
     async def disconnect(self, close_code):
+        if getattr(self, 'sender_task', None): self.sender_task.cancel()
         await self.channel_layer.group_discard( self.group_name, self.channel_name )
-        print(f"WS disconnected: {self.channel_name}, left {self.group_name}. Code: {close_code}")
+        for stream in self.topics.values(): await self.channel_layer.group_discard( live_group(stream), self.channel_name )
+        if self.topics:
+            self.topics = {}
+            await self.send_subscriptions()
+        log.info(f"WS disconnected: {self.channel_name}, left {self.group_name}. Code: {close_code}")
+
+    # --- Live topic subscriptions ---
+    async def set_subscription(self, topic, interval):
+        """ Subscribes (interval given) or unsubscribes (None) this client to a topic. """
+        if not isinstance(topic, str) or not (topic in LIVE_TOPICS or (topic.startswith('device:') and len(topic) > 7)):
+            log.warning(f"Warning: Consumer ignoring subscription to unknown topic: {topic}"); return
+        old = self.topics.get(topic)
+        new = live_stream(topic, interval) if interval is not None else None
+        if old == new: return
+        if old:
+            await self.channel_layer.group_discard( live_group(old), self.channel_name )
+            self.topics.pop(topic); self.streams.pop(old, None); self.forget_stream(old)
+        if new:
+            await self.channel_layer.group_add( live_group(new), self.channel_name )
+            self.topics[topic] = new
+        await self.send_subscriptions() # The daemon answers new streams with a snapshot
+        if new and not old:
+            # Event topics have no snapshot: fetch their current state once
+            if topic == 'security' and not await self.cached_reply('security'): await self.channel_layer.group_send( "hotspot_commands", {"type": "command.request_security_state", "channel_name": self.channel_name} )
+            elif topic == 'forecast' and not await self.cached_reply('forecast'): await self.channel_layer.group_send( "hotspot_commands", {"type": "command.request_forecast", "channel_name": self.channel_name} )
+
+    async def send_subscriptions(self):
+        topics = {topic: 0 if stream in EVENT_TOPICS else int(stream.rpartition('@')[2]) for topic, stream in self.topics.items()}
+        await self.channel_layer.group_send( "hotspot_commands", {"type": "command.live_subscriptions", "channel_name": self.channel_name, "topics": topics, "stats": self.client_stats()} )
+
+    # --- Outbound queue ---
+    def client_stats(self):
+        """ Lag/drop metrics of this client, reported to the daemon with every subscription renewal. """
+        in_flight = max((self.sent_seq[s] - self.acked_seq.get(s, self.sent_seq[s]) for s in self.sent_seq), default=0)
+        return dict(self.stats, reliable_depth=len(self.reliable), live_pending=len(self.live_pending), stale=len(self.stale), in_flight=in_flight)
+
+    def in_flight(self, stream):
+        if not self.acks_seen or stream not in self.acked_seq: return 0
+        return self.sent_seq.get(stream, 0) - self.acked_seq[stream]
+
+    def forget_stream(self, stream):
+        for state in (self.live_pending, self.sent_seq, self.acked_seq, self.sent_at): state.pop(stream, None)
+        self.stale.discard(stream)
+
+    async def send_reliable(self, text_data):
+        """ Queues a notification/reply. These are never dropped; a client too slow for them is disconnected. """
+        if len(self.reliable) >= RELIABLE_QUEUE_MAX:
+            log.warning(f"Consumer {self.channel_name}: {len(self.reliable)} messages backed up, disconnecting slow client")
+            await self.close(code=4008)
+            return
+        self.reliable.append(text_data)
+        self.stats["reliable_max"] = max(self.stats["reliable_max"], len(self.reliable))
+        self.outbox_ready.set()
+
+    def queue_live(self, stream, frame, seq, snapshot=False):
+        """ Puts a live frame in its stream's slot. A delta that finds the slot taken supersedes the chain: both go, resync later. """
+        if snapshot:
+            self.stale.discard(stream)
+            self.live_pending[stream] = (frame, seq)
+        elif stream in self.stale:
+            self.stats["dropped"] += 1
+            return
+        elif stream in self.live_pending:
+            del self.live_pending[stream]
+            self.stale.add(stream)
+            self.stats["dropped"] += 2
+            return
+        else:
+            self.live_pending[stream] = (frame, seq)
+        self.outbox_ready.set()
+
+    def handle_ack(self, topic, seq):
+        stream = self.topics.get(topic)
+        if stream is None or not isinstance(seq, int): return
+        self.acks_seen = True
+        self.acked_seq[stream] = max(seq, self.acked_seq.get(stream, 0))
+        sent_at = self.sent_at.get(stream, {})
+        if seq in sent_at: self.stats["lag_ms"] = round((time.monotonic() - sent_at[seq]) * 1000, 1)
+        for old in [s for s in sent_at if s <= seq]: del sent_at[old]
+        self.outbox_ready.set() # Credit freed
+
+    async def sender(self):
+        """ Drains the outbound queue: reliable messages in order, then the newest frame of each stream the client can take. """
+        try:
+            while True:
+                await self.outbox_ready.wait()
+                self.outbox_ready.clear()
+                while self.reliable:
+                    await self.send(text_data=self.reliable.popleft())
+                for stream in list(self.live_pending):
+                    if self.in_flight(stream) >= MAX_IN_FLIGHT: continue # Client lagging: keep only the newest
+                    frame, seq = self.live_pending.pop(stream)
+                    await self.send(bytes_data=frame)
+                    self.stats["sent"] += 1
+                    self.sent_seq[stream] = seq
+                    self.acked_seq.setdefault(stream, seq - 1)
+                    self.sent_at.setdefault(stream, {})[seq] = time.monotonic()
+                for stream in list(self.stale):
+                    if self.in_flight(stream) < MAX_IN_FLIGHT and stream in self.topics.values():
+                        self.stale.discard(stream); self.stats["resyncs"] += 1
+                        await self.request_snapshot(stream)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            log.exception(f"Consumer {self.channel_name} sender error: {e}")
+
+    async def cached_reply(self, name):
+        """ Answers a request_* message from the daemon's read model. False if there is none (daemon down, Redis error). """
+        redis = read_model_redis()
+        if redis is None: return False
+        try: text = await redis.hget(READ_MODEL_PREFIX + name, 'message')
+        except Exception as e:
+            log.warning(f"Read model '{name}' unavailable: {e}"); return False
+        if text is None: return False
+        await self.send_reliable(text_data=text.decode())
+        return True
+
+    async def request_snapshot(self, stream):
+        """ Asks the daemon for a stream's full state; its deltas are dropped until it arrives. """
+        self.streams.pop(stream, None)
+        await self.channel_layer.group_send( "hotspot_commands", {"type": "command.request_snapshot", "channel_name": self.channel_name, "stream": stream} )
+
+    async def live_heartbeat(self, event):
+        """ Renews our subscriptions (they expire otherwise); after a daemon restart this also resubscribes. """
+        epoch = event.get('epoch')
+        if self.daemon_epoch is not None and epoch != self.daemon_epoch: self.streams.clear()
+        self.daemon_epoch = epoch
+        if self.topics: await self.send_subscriptions()
 
     async def receive(self, text_data):
-        print(f"\n>>> Consumer RX from client: {text_data}\n")
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
+            if message_type != 'ack': log.debug("Consumer RX from client: %s", text_data) # Acks come with every live frame
 
             if message_type == 'hotspot_toggle':
-                print(f"Consumer fwd hotspot_toggle: {data}")
+                log.debug("Consumer fwd hotspot_toggle: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.toggle", "state": data.get('state', False)} )
             elif message_type == 'set_usage_period':
-                print(f"Consumer fwd set_usage_period: {data}")
+                log.debug("Consumer fwd set_usage_period: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.set_period", "period": data.get('period', '24h')} )
             elif message_type == 'set_hotspot_settings':
-                print(f"Consumer fwd set_hotspot_settings: {data}")
+                log.debug("Consumer fwd set_hotspot_settings: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.set_settings", "ssid": data.get('ssid'), "password": data.get('password')} )
             elif message_type == 'set_limit':
-                print(f"Consumer fwd set_limit: {data}")
+                log.debug("Consumer fwd set_limit: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.set_limit", "ip": data.get('ip'), "download": data.get('download'), "upload": data.get('upload'), "priority": data.get('priority')} )
             elif message_type == 'set_quota':
-                print(f"Consumer fwd set_quota: {data}")
+                log.debug("Consumer fwd set_quota: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.set_quota", "ip": data.get('ip'), "download_mb": data.get('download_mb'), "upload_mb": data.get('upload_mb'), "period": data.get('period')} )
             elif message_type == 'remove_limit':
-                print(f"Consumer fwd remove_limit: {data}")
+                log.debug("Consumer fwd remove_limit: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.remove_limit", "ip": data.get('ip')} )
             elif message_type == 'remove_quota':
-                print(f"Consumer fwd remove_quota: {data}")
+                log.debug("Consumer fwd remove_quota: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.remove_quota", "ip": data.get('ip')} )
 
             # --- Schedule Messages ---
             elif message_type == 'save_schedule':
-                 print(f"Consumer fwd save_schedule") # Don't log full data potentially
+                 log.debug("Consumer fwd save_schedule") # Don't log full data potentially
                  await self.channel_layer.group_send( "hotspot_commands", {"type": "command.save_schedule", "schedule": data.get('schedule')} )
             elif message_type == 'delete_schedule':
-                 print(f"Consumer fwd delete_schedule: {data}")
+                 log.debug("Consumer fwd delete_schedule: %s", data)
                  await self.channel_layer.group_send( "hotspot_commands", {"type": "command.delete_schedule", "id": data.get('id')} )
             elif message_type == 'toggle_schedule':
-                 print(f"Consumer fwd toggle_schedule: {data}")
+                 log.debug("Consumer fwd toggle_schedule: %s", data)
                  await self.channel_layer.group_send( "hotspot_commands", {"type": "command.toggle_schedule", "id": data.get('id'), "enabled": data.get('enabled')} )
 
+            # --- Device Group Messages ---
+            elif message_type == 'save_group':
+                 log.debug("Consumer fwd save_group: %s", data)
+                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.save_group", "group": data.get('group')} )
+            elif message_type == 'delete_group':
+                 log.debug("Consumer fwd delete_group: %s", data)
+                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.delete_group", "id": data.get('id')} )
+            elif message_type == 'request_groups':
+                 if await self.cached_reply('groups'): return
+                 log.debug("Consumer fwd request_groups")
+                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.request_groups"} )
+
             # --- Request Messages (Modified) ---
+            # Answered from the daemon's read models in Redis; the daemon is only asked when there is none
             elif message_type == 'request_schedules':
-                 print(f"Consumer fwd request_schedules")
+                 if await self.cached_reply('schedules'): return
+                 log.debug("Consumer fwd request_schedules")
                  await self.channel_layer.group_send( "hotspot_commands", {"type": "command.request_schedules"} )
             elif message_type == 'request_devices':
-                 print(f"Consumer fwd request_devices")
+                 if await self.cached_reply('devices'): return
+                 log.debug("Consumer fwd request_devices")
                  # Send to daemon, which will reply directly to our channel_name
                  await self.channel_layer.group_send( "hotspot_commands", {"type": "command.request_devices", "channel_name": self.channel_name} )
             
             # --- *** NEW: Forecast Handler *** ---
             elif message_type == 'request_forecast':
-                 print(f"Consumer fwd request_forecast")
+                 if await self.cached_reply('forecast'): return
+                 log.debug("Consumer fwd request_forecast")
                  await self.channel_layer.group_send( 
                     "hotspot_commands", 
                     {"type": "command.request_forecast", "channel_name": self.channel_name} 
                  )
 
+            elif message_type == 'subscribe':
+                 await self.set_subscription(data.get('topic'), data.get('interval', 1))
+            elif message_type == 'unsubscribe':
+                 await self.set_subscription(data.get('topic'), None)
+            elif message_type == 'ack':
+                 self.handle_ack(data.get('topic'), data.get('seq'))
+            elif message_type == 'request_snapshot':
+                 stream = self.topics.get(data.get('topic'))
+                 log.debug(f"Consumer resync of {stream} requested by client")
+                 if stream and stream not in EVENT_TOPICS: await self.request_snapshot(stream)
+            elif message_type == 'profile_dump':
+                 log.debug("Consumer fwd profile_dump")
+                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.profile_dump"} )
+            elif message_type == 'request_command_stats':
+                 log.debug("Consumer fwd request_command_stats")
+                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.request_command_stats", "channel_name": self.channel_name} )
+
             # --- NEW: Security Messages ---
             elif message_type == 'request_security_state':
-                print(f"Consumer fwd request_security_state")
+                if await self.cached_reply('security'): return
+                log.debug("Consumer fwd request_security_state")
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.request_security_state", "channel_name": self.channel_name} )
             
             elif message_type == 'set_client_isolation':
-                print(f"Consumer fwd set_client_isolation: {data}")
+                log.debug("Consumer fwd set_client_isolation: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.set_client_isolation", "enabled": data.get('enabled')} )
 
             elif message_type == 'set_ac_mode':
-                print(f"Consumer fwd set_ac_mode: {data}")
+                log.debug("Consumer fwd set_ac_mode: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.set_ac_mode", "mode": data.get('mode')} )
             
             elif message_type == 'add_mac':
-                print(f"Consumer fwd add_mac: {data}")
+                log.debug("Consumer fwd add_mac: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.add_mac", "mac": data.get('mac'), "list_type": data.get('list_type')} )
             
             elif message_type == 'remove_mac':
-                print(f"Consumer fwd remove_mac: {data}")
+                log.debug("Consumer fwd remove_mac: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.remove_mac", "mac": data.get('mac')} )
             
             # --- *** NEW: IP Block Handlers *** ---
             elif message_type == 'add_ip_block':
-                print(f"Consumer fwd add_ip_block: {data}")
+                log.debug("Consumer fwd add_ip_block: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.add_ip_block", "ip_range": data.get('ip_range')} )
             
             elif message_type == 'remove_ip_block':
-                print(f"Consumer fwd remove_ip_block: {data}")
+                log.debug("Consumer fwd remove_ip_block: %s", data)
                 await self.channel_layer.group_send( "hotspot_commands", {"type": "command.remove_ip_block", "ip_range": data.get('ip_range')} )
+
+            elif message_type == 'import_ip_blocks':
+                # One chunk of an upload; the client waits for its progress ack before sending the next
+                log.debug("Consumer fwd import_ip_blocks: %s #%s (%s chars)", data.get('name'), data.get('seq'), len(data.get('text') or ''))
+                await self.channel_layer.group_send( "hotspot_commands", {"type": "command.import_ip_blocks", "import_id": data.get('import_id'), "name": data.get('name'), "seq": data.get('seq'), "text": data.get('text'), "final": bool(data.get('final'))} )
+
+            elif message_type == 'request_ip_block_page':
+                log.debug("Consumer fwd request_ip_block_page: %s", data.get('offset'))
+                await self.channel_layer.group_send( "hotspot_commands", {"type": "command.request_ip_block_page", "channel_name": self.channel_name, "offset": data.get('offset', 0)} )
             # --- *** End of NEW *** ---
 
             else:
-                 print(f"Warning: Consumer RX unknown type: {message_type}")
+                 log.warning(f"Warning: Consumer RX unknown type: {message_type}")
 
-        except json.JSONDecodeError: print(f"Error: RX invalid JSON: {text_data}")
-        except Exception as e: print(f"Error processing RX message: {e}"); traceback.print_exc()
+        except json.JSONDecodeError: log.error(f"Error: RX invalid JSON: {text_data}")
+        except Exception as e: log.exception(f"Error processing RX message: {e}")
 
     # --- Standard Handlers (from daemon to frontend) ---
-    async def network_data_message(self, event):
-        try: await self.send(text_data=json.dumps(event['data']))
-        except Exception as e: print(f"Error sending network_data_message: {e}")
+    async def network_data_snapshot(self, event):
+        """ Full state of one stream (reply to a subscription or resync). Stale or unwanted ones are ignored. """
+        stream = event.get('stream'); seq = event.get('seq', 0); epoch = event.get('epoch')
+        if stream not in self.topics.values(): return
+        last = self.streams.get(stream)
+        if last and last[0] == epoch and seq <= last[1]: return
+        self.streams[stream] = (epoch, seq)
+        self.sent_seq.pop(stream, None); self.acked_seq.pop(stream, None); self.sent_at.pop(stream, None) # New chain
+        # The frame was encoded once by the daemon: pass the bytes straight through
+        self.queue_live(stream, event['frame'], seq, snapshot=True)
+
+    async def network_data_delta(self, event):
+        """ Live update patch. Forwarded only if it follows the last frame of its stream; a gap triggers a resync. """
+        stream = event.get('stream'); seq = event.get('seq', 0); epoch = event.get('epoch')
+        last = self.streams.get(stream)
+        if last is None: return # Not subscribed, or waiting for a snapshot
+        if epoch != last[0]:
+            log.debug(f"Consumer {self.channel_name}: {stream} restarted, resyncing")
+            await self.request_snapshot(stream)
+            return
+        if seq <= last[1]: return # Already covered by the snapshot
+        if seq != last[1] + 1:
+            log.debug(f"Consumer {self.channel_name}: {stream} gap ({last[1]} -> {seq}), resyncing")
+            await self.request_snapshot(stream)
+            return
+        self.streams[stream] = (epoch, seq)
+        self.queue_live(stream, event['frame'], seq)
 
     async def notification_message(self, event):
-        print(f"Consumer sending notification: {event}")
-        try: await self.send(text_data=json.dumps({"type": "notification", "status": event.get('status'), "message": event.get('message')}))
-        except Exception as e: print(f"Error sending notification_message: {e}")
+        log.debug("Consumer sending notification: %s", event)
+        try: await self.send_reliable(text_data=json.dumps({"type": "notification", "status": event.get('status'), "message": event.get('message')}))
+        except Exception as e: log.error(f"Error sending notification_message: {e}")
 
     # --- Handlers for Schedule/Device Lists ---
     async def schedules_list(self, event):
         """ Sends the list of schedules directly back to the requesting client. (Likely unused, but kept for compatibility) """
-        print(f"Consumer sending schedules.list ({len(event.get('schedules', []))} items)")
-        try: await self.send(text_data=json.dumps({"type": "schedules_list", "schedules": event.get('schedules', [])}))
-        except Exception as e: print(f"Error sending schedules.list: {e}")
+        log.debug(f"Consumer sending schedules.list ({len(event.get('schedules', []))} items)")
+        try: await self.send_reliable(text_data=json.dumps({"type": "schedules_list", "schedules": event.get('schedules', [])}))
+        except Exception as e: log.error(f"Error sending schedules.list: {e}")
     
     async def schedules_update(self, event):
         """ Sends updated schedules list to ALL clients (broadcast). """
-        print(f"Consumer broadcasting schedules.update ({len(event.get('schedules', []))} items)")
+        log.debug(f"Consumer broadcasting schedules.update ({len(event.get('schedules', []))} items)")
         try: 
             # Note: The JS client expects 'schedules_list' as the type
-            await self.send(text_data=json.dumps({"type": "schedules_list", "schedules": event.get('schedules', [])}))
+            await self.send_reliable(text_data=json.dumps({"type": "schedules_list", "schedules": event.get('schedules', [])}))
         except Exception as e: 
-            print(f"Error sending schedules.update: {e}")
+            log.error(f"Error sending schedules.update: {e}")
+
+    async def groups_update(self, event):
+        """ Sends the device group definitions to ALL clients (broadcast). """
+        log.debug(f"Consumer broadcasting groups.update ({len(event.get('groups', []))} items)")
+        try: await self.send_reliable(text_data=json.dumps({"type": "groups_list", "groups": event.get('groups', [])}))
+        except Exception as e: log.error(f"Error sending groups.update: {e}")
 
     async def devices_list(self, event):
         """ Sends the list of devices directly back to the requesting client. """
-        print(f"Consumer sending devices.list ({len(event.get('devices', []))} items)")
-        try: await self.send(text_data=json.dumps({"type": "devices_list", "devices": event.get('devices', [])}))
-        except Exception as e: print(f"Error sending devices.list: {e}")
+        log.debug(f"Consumer sending devices.list ({len(event.get('devices', []))} items)")
+        try: await self.send_reliable(text_data=json.dumps({"type": "devices_list", "devices": event.get('devices', [])}))
+        except Exception as e: log.error(f"Error sending devices.list: {e}")
     
     # --- *** NEW: Forecast Data Handler *** ---
     async def forecast_data(self, event):
         """ Sends the forecast data directly back to the requesting client. """
-        print(f"Consumer sending forecast.data ({len(event.get('forecast', []))} items)")
+        log.debug(f"Consumer sending forecast.data ({len(event.get('forecast', []))} items)")
         try: 
-            await self.send(text_data=json.dumps({
+            await self.send_reliable(text_data=json.dumps({
                 "type": "forecast_data", 
                 "forecast": event.get('forecast', [])
             }))
         except Exception as e: 
-            print(f"Error sending forecast.data: {e}")
+            log.error(f"Error sending forecast.data: {e}")
     
+    async def command_stats(self, event):
+        """ Sends the daemon's command latency / queue depth stats back to the requesting client. """
+        try: await self.send_reliable(text_data=json.dumps({"type": "command_stats", "stats": event.get('stats', {})}))
+        except Exception as e: log.error(f"Error sending command.stats: {e}")
+    
+    async def ip_block_import_progress(self, event):
+        """ Progress of a block list import (parsing, applying, done/failed) to ALL clients. """
+        event_data = event.copy(); event_data['type'] = 'ip_block_import_progress'
+        try: await self.send_reliable(text_data=json.dumps(event_data))
+        except Exception as e: log.error(f"Error sending ip_block.import.progress: {e}")
+
+    async def ip_block_page(self, event):
+        """ A page of the IP block list, back to the client that asked for it. """
+        event_data = event.copy(); event_data['type'] = 'ip_block_page'
+        try: await self.send_reliable(text_data=json.dumps(event_data))
+        except Exception as e: log.error(f"Error sending ip_block.page: {e}")
+
     # --- NEW: Security State Handler ---
     async def security_state_update(self, event):
-        """ Sends the full security state (broadcast or direct reply). """
-        print(f"Consumer sending security.state.update")
+        """ Sends the security state (broadcast or direct reply); the IP block list is its first page plus ipBlockCount. """
+        log.debug(f"Consumer sending security.state.update")
         # Remove 'type' from event before sending, as the JS client expects the type to be the key
         event_data = event.copy()
         event_data['type'] = 'security_state_update'
         try:
-            await self.send(text_data=json.dumps(event_data))
+            await self.send_reliable(text_data=json.dumps(event_data))
         except Exception as e:
-            print(f"Error sending security.state.update: {e}")
\ No newline at end of file
+            log.error(f"Error sending security.state.update: {e}")
\ No newline at end of file
@@ -0,0 +1,23 @@
+import logging
+import logging.handlers
+import queue
+import sys
+
+from hotspot_logging import LOG_FORMAT, LOG_QUEUE_SIZE, DroppingQueueHandler, StructuredFormatter # Next to web_daemon.py (on sys.path, see settings.py)
+
+
+def queued_stdout_handler(maxsize=LOG_QUEUE_SIZE):
+    """
+    Handler factory for LOGGING in settings.py: consumers only enqueue, a
+    QueueListener thread does the writing, so a slow terminal never stalls
+    the event loop. Same handler and line format as the daemon's logs
+    (HOTSPOT_LOG_FORMAT), overflow included ('dropped=N').
+    """
+    log_queue = queue.Queue(maxsize)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(as_json=LOG_FORMAT == "json"))
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    handler = DroppingQueueHandler(log_queue)
+    handler.listener = listener
+    return handler
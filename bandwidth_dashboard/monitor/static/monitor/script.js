@@ -11,6 +11,13 @@ let socket = null;
 let currentHotspotSSID = "MyBandwidthManager";
 let isToggleProcessing = false;
 
+// Live data state, patched by 'delta' messages (see applyLiveDelta)
+let liveTopics = {}; // topic -> interval (s) we are subscribed to
+let liveSeqs = {}; // topic -> last applied seq (absent = waiting for a snapshot)
+let liveFields = {};
+let liveDevices = new Map(); // ip -> device, in first-seen order
+let liveFrameChain = Promise.resolve(); // Serializes binary frame decoding
+
 // Scheduler state
 let currentScheduleId = null;
 let currentMonth = new Date().getMonth();
@@ -24,8 +31,11 @@ let currentSecurityState = {
     acMode: 'allow_all',
     blockList: [],
     allowList: [],
-    ipBlockList: [] // <-- ADDED
+    ipBlockList: [], // <-- ADDED (loaded a page at a time)
+    ipBlockCount: 0
 };
+const IP_IMPORT_CHUNK_BYTES = 256 * 1024; // Upload slice; whole lines only, the next one is sent when the daemon acks this one
+let pendingIpImport = null; // { id, file, offset, seq, decoder, carry } while an upload is running
 
 // -------------------------------------------------------------------
 // HELPER FUNCTIONS
@@ -171,6 +181,8 @@ function updateDashboardData(data) {
 
     // --- Update Stat Cards ---
     const dlSpeedEl = document.getElementById('download-speed'); const ulSpeedEl = document.getElementById('upload-speed'); const deviceCountEl = document.getElementById('device-count'); const dataUsageEl = document.getElementById('data-usage'); if (dlSpeedEl) dlSpeedEl.textContent = data.total_download_speed || "-"; if (ulSpeedEl) ulSpeedEl.textContent = data.total_upload_speed || "-"; if (deviceCountEl) deviceCountEl.textContent = data.device_count || "0"; if (dataUsageEl) dataUsageEl.textContent = data.total_data_usage || "0.0 MB";
+    // Per-interface device counts (only shown when the daemon manages more than one interface)
+    const breakdownEl = document.getElementById('interface-breakdown'); if (breakdownEl && data.interfaces !== undefined) { const interfaces = data.interfaces || []; breakdownEl.textContent = interfaces.length > 1 ? interfaces.map(i => `${i.interface}: ${i.up ? i.active_devices : 'down'}`).join(' · ') : ''; breakdownEl.title = interfaces.map(i => `${i.interface}: ${i.devices} device(s), ↓ ${((i.download_Bps * 8) / 1e6).toFixed(1)} Mbps ↑ ${((i.upload_Bps * 8) / 1e6).toFixed(1)} Mbps`).join('\n'); }
 
     // --- Update Device List & Table ---
     const previousDeviceList = lastDeviceList; // Keep track for comparison
@@ -337,6 +349,92 @@ function renderForecastChart(forecastData) {
 }
 
 
+// -------------------------------------------------------------------
+// LIVE DATA (snapshot + deltas)
+// -------------------------------------------------------------------
+function renderLiveState(topic) {
+    // Only a summary frame adds a point to the speed chart (device frames arrive separately)
+    updateDashboardData({ ...liveFields, timestamp: topic === 'summary' ? liveFields.timestamp : null, devices: Array.from(liveDevices.values()) });
+}
+
+function applyLivePatch(topic, fields, devices, removed) {
+    if (topic === 'summary') Object.assign(liveFields, fields || {});
+    for (const [ip, patch] of Object.entries(devices || {})) {
+        liveDevices.set(ip, { ...(liveDevices.get(ip) || {}), ...patch }); // New devices arrive in full
+    }
+    for (const ip of (removed || [])) liveDevices.delete(ip);
+}
+
+function applyLiveSnapshot(msg) {
+    const topic = msg.topic; const data = msg.data || {};
+    if (!(topic in liveTopics)) return;
+    if (topic === 'summary') { liveFields = { ...data }; delete liveFields.devices; }
+    else if (topic === 'devices') liveDevices = new Map((data.devices || []).map(d => [d.ip, d]));
+    else applyLivePatch(topic, null, Object.fromEntries((data.devices || []).map(d => [d.ip, d])), null); // device:<ip>
+    liveSeqs[topic] = msg.seq;
+    ackLiveFrame(topic, msg.seq);
+    renderLiveState(topic);
+}
+
+function applyLiveDelta(msg) {
+    const topic = msg.topic;
+    if (liveSeqs[topic] == null) return; // Not subscribed, or snapshot still on its way
+    if (msg.seq !== liveSeqs[topic] + 1) {
+        console.warn(`Live data gap on ${topic} (${liveSeqs[topic]} -> ${msg.seq}), requesting snapshot`);
+        delete liveSeqs[topic];
+        if (socket && socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify({ type: 'request_snapshot', topic }));
+        return;
+    }
+    applyLivePatch(topic, msg.fields, msg.devices, msg.removed);
+    liveSeqs[topic] = msg.seq;
+    ackLiveFrame(topic, msg.seq);
+    renderLiveState(topic);
+}
+
+// Tells the consumer we kept up; it holds back frames (newest only) while too many are unacknowledged
+function ackLiveFrame(topic, seq) {
+    if (socket && socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify({ type: 'ack', topic, seq }));
+}
+
+// What this tab wants to see, and how often (seconds). Hidden tabs only follow the status bar.
+function desiredLiveTopics() {
+    if (document.hidden) return { summary: 10 };
+    const page = document.querySelector('.nav-item.active')?.dataset.page || 'dashboard';
+    const topics = { summary: 1 };
+    if (page === 'dashboard') topics.devices = 1;
+    else if (page === 'scheduler') topics.devices = 10; // Device dropdown only
+    else if (page === 'security') { topics.devices = 5; topics.security = 0; }
+    else if (page === 'ai') topics.forecast = 0;
+    return topics;
+}
+
+function updateLiveSubscriptions() {
+    if (!socket || socket.readyState !== WebSocket.OPEN) return;
+    const wanted = desiredLiveTopics();
+    for (const topic of Object.keys(liveTopics)) {
+        if (!(topic in wanted)) { socket.send(JSON.stringify({ type: 'unsubscribe', topic })); delete liveSeqs[topic]; }
+    }
+    for (const [topic, interval] of Object.entries(wanted)) {
+        if (liveTopics[topic] !== interval) { socket.send(JSON.stringify({ type: 'subscribe', topic, interval })); delete liveSeqs[topic]; }
+    }
+    liveTopics = wanted;
+}
+
+function resetLiveState() {
+    liveTopics = {}; liveSeqs = {}; liveFields = {}; liveDevices = new Map(); liveFrameChain = Promise.resolve();
+}
+
+// Frame = 1 flag byte (0 = msgpack, 1 = zlib-deflated msgpack) + body, encoded once by the daemon
+async function decodeLiveFrame(buffer) {
+    const bytes = new Uint8Array(buffer);
+    let body = bytes.subarray(1);
+    if (bytes[0] === 1) {
+        const stream = new Blob([body]).stream().pipeThrough(new DecompressionStream('deflate'));
+        body = new Uint8Array(await new Response(stream).arrayBuffer());
+    }
+    return MessagePack.decode(body);
+}
+
 // -------------------------------------------------------------------
 // WEBSOCKET CLIENT
 // -------------------------------------------------------------------
@@ -345,49 +443,24 @@ function connectWebSocket() {
     const wsURL = `${wsProtocol}//${window.location.host}/ws/network/`;
     console.log('Connecting to WebSocket at:', wsURL);
     socket = new WebSocket(wsURL);
+    socket.binaryType = 'arraybuffer'; // Live data arrives as binary frames
 
     socket.onopen = () => {
         console.log('WebSocket connected successfully.');
         // Request initial data when connection opens
         requestInitialData();
+        updateLiveSubscriptions(); // Live data only flows for subscribed topics
     };
 
     socket.onmessage = (event) => {
+    if (event.data instanceof ArrayBuffer) {
+        // Chain so frames are applied in arrival order even when one needs async inflating
+        liveFrameChain = liveFrameChain.then(() => decodeLiveFrame(event.data)).then(handleSocketMessage)
+            .catch(e => console.error("Failed to decode live data frame:", e));
+        return;
+    }
     try {
-        const data = JSON.parse(event.data);
-
-        // Check message type
-        if (data.type === 'notification') {
-            showNotification(data.message, data.status);
-        } else if (data.type === 'schedules_list' || data.type === 'schedules.update') { 
-            // Handle schedule list updates (both message types)
-            console.log("Received schedules update:", data.schedules?.length, "schedules");
-            schedules = data.schedules || [];
-            renderCalendar();
-            renderSchedulesList();
-        } else if (data.type === 'devices_list' || data.type === 'devices.list') { 
-            // Handle device list for dropdown (both message types)
-            lastDeviceList = data.devices || [];
-            populateDeviceDropdown();
-        } else if (data.type === 'security_state_update') { 
-            // --- Handle Security State (MODIFIED) ---
-            currentSecurityState = {
-                isolation: data.isolation,
-                acMode: data.acMode,
-                blockList: data.blockList || [],
-                allowList: data.allowList || [],
-                ipBlockList: data.ipBlockList || []
-            };
-            // Render the security page UI
-            renderSecurityPage(currentSecurityState);
-            // Re-render the device list on the security page
-            renderSecurityDeviceList(lastDeviceList, currentSecurityState);
-        } else if (data.type === 'forecast_data') { 
-            renderForecastChart(data.forecast);
-        }
-        else { // Assume it's the regular dashboard update
-            updateDashboardData(data);
-        }
+        handleSocketMessage(JSON.parse(event.data));
     } catch (e) {
         console.error("Failed to parse incoming WebSocket message:", event.data, e);
     }
@@ -395,6 +468,7 @@ function connectWebSocket() {
 
     socket.onclose = (event) => {
         console.error('WebSocket closed. Reconnecting in 3s.', event.reason);
+        resetLiveState(); // The consumer sends a fresh snapshot on reconnect
         updateDashboardData({ hotspot_status: "OFF", hotspot_ssid: "", total_download_speed: "-", total_upload_speed: "-", device_count: "-", total_data_usage: "-", devices: [] });
         schedules = []; // Clear schedules on disconnect
         renderCalendar();
@@ -410,7 +484,7 @@ function connectWebSocket() {
         }
         
         // --- Clear security data (MODIFIED) ---
-        currentSecurityState = { isolation: false, acMode: 'allow_all', blockList: [], allowList: [], ipBlockList: [] };
+        currentSecurityState = { isolation: false, acMode: 'allow_all', blockList: [], allowList: [], ipBlockList: [], ipBlockCount: 0 };
         renderSecurityPage(currentSecurityState);
         renderSecurityDeviceList(lastDeviceList, currentSecurityState);
 
@@ -423,6 +497,54 @@ function connectWebSocket() {
     };
 }
 
+function handleSocketMessage(data) {
+    // Check message type
+    if (data.type === 'notification') {
+        showNotification(data.message, data.status);
+    } else if (data.type === 'schedules_list' || data.type === 'schedules.update') { 
+        // Handle schedule list updates (both message types)
+        console.log("Received schedules update:", data.schedules?.length, "schedules");
+        schedules = data.schedules || [];
+        renderCalendar();
+        renderSchedulesList();
+    } else if (data.type === 'devices_list' || data.type === 'devices.list') { 
+        // Handle device list for dropdown (both message types)
+        lastDeviceList = data.devices || [];
+        populateDeviceDropdown();
+    } else if (data.type === 'security_state_update') { 
+        // --- Handle Security State (MODIFIED) ---
+        currentSecurityState = {
+            isolation: data.isolation,
+            acMode: data.acMode,
+            blockList: data.blockList || [],
+            allowList: data.allowList || [],
+            ipBlockList: data.ipBlockList || [],
+            ipBlockCount: data.ipBlockCount ?? (data.ipBlockList || []).length
+        };
+        // Render the security page UI
+        renderSecurityPage(currentSecurityState);
+        // Re-render the device list on the security page
+        renderSecurityDeviceList(lastDeviceList, currentSecurityState);
+    } else if (data.type === 'ip_block_import_progress') {
+        renderIpBlockImportProgress(data);
+    } else if (data.type === 'ip_block_page') {
+        // Only append the page that continues what is shown (a broadcast may have reset the list meanwhile)
+        if (data.offset === currentSecurityState.ipBlockList.length) {
+            currentSecurityState.ipBlockList = currentSecurityState.ipBlockList.concat(data.entries || []);
+            currentSecurityState.ipBlockCount = data.count;
+            renderIpBlockList('#ip-block-list-ul', currentSecurityState.ipBlockList, data.count);
+        }
+    } else if (data.type === 'forecast_data') { 
+        renderForecastChart(data.forecast);
+    } else if (data.type === 'snapshot') {
+        applyLiveSnapshot(data);
+    } else if (data.type === 'delta') {
+        applyLiveDelta(data);
+    } else {
+        console.debug("Unhandled WebSocket message type:", data.type);
+    }
+}
+
 // Function to request initial data
 function requestInitialData() {
     if (socket && socket.readyState === WebSocket.OPEN) {
@@ -946,7 +1068,7 @@ function renderSecurityPage(state) {
     renderMacList('#allow-list-ul', state.allowList, 'allow');
     
     // --- NEW: Render IP Block List ---
-    renderIpBlockList('#ip-block-list-ul', state.ipBlockList);
+    renderIpBlockList('#ip-block-list-ul', state.ipBlockList, state.ipBlockCount);
 }
 
 /**
@@ -1032,6 +1154,7 @@ function renderSecurityDeviceList(devices, securityState) {
 document.addEventListener('DOMContentLoaded', () => {
     initCharts();
     connectWebSocket(); // WebSocket connection now requests initial data
+    document.addEventListener('visibilitychange', updateLiveSubscriptions);
 
     document.querySelectorAll('.nav-item').forEach(item => {
     item.addEventListener('click', (e) => {
@@ -1042,6 +1165,7 @@ document.addEventListener('DOMContentLoaded', () => {
         item.classList.add('active');
         const targetPage = document.getElementById(page + '-page');
         if (targetPage) targetPage.classList.add('active');
+        updateLiveSubscriptions();
 
         // If switching to scheduler, ensure data is fresh (or request it)
         if (page === 'scheduler') {
@@ -1215,10 +1339,21 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
     
+    // --- IP Block List Import (plain text or CSV threat list) ---
+    const ipBlockImportBtn = document.getElementById('ip-block-import-btn');
+    if (ipBlockImportBtn) {
+        ipBlockImportBtn.addEventListener('click', () => {
+            const file = document.getElementById('ip-block-import-file')?.files[0];
+            if (!file) { showNotification("Choose a list file first.", "error"); return; }
+            sendImportIpBlocks(file);
+        });
+    }
+    
     // --- NEW: IP Block List UL (for removal) ---
     const ipBlockListUl = document.getElementById('ip-block-list-ul');
     if (ipBlockListUl) {
         ipBlockListUl.addEventListener('click', (e) => {
+            if (e.target.closest('.btn-more-ip-blocks')) { sendRequestIpBlockPage(currentSecurityState.ipBlockList.length); return; }
             const button = e.target.closest('.btn-remove-mac'); // Using same class as MAC lists
             if (button) {
                 const ipRange = button.dataset.ipRange;
@@ -1278,9 +1413,9 @@ function handleRemoveMacClick(e) {
 // --- NEW: IP Block List Helper Functions ---
 
 /**
- * Renders a list of IPs/CIDRs into a <ul>.
+ * Renders a list of IPs/CIDRs into a <ul>; 'total' is the size of the whole list when only part of it is loaded.
  */
-function renderIpBlockList(ulSelector, ipList) {
+function renderIpBlockList(ulSelector, ipList, total = ipList ? ipList.length : 0) {
     const ul = document.getElementById(ulSelector.substring(1));
     if (!ul) return;
 
@@ -1294,7 +1429,22 @@ function renderIpBlockList(ulSelector, ipList) {
             <span>${ipRange}</span>
             <button class="btn-remove-mac" data-ip-range="${ipRange}" title="Unblock IP/Range">&times;</button>
         </li>
-    `).join('');
+    `).join('') + (total > ipList.length ? `
+        <li class="mac-list-empty">
+            <span>Showing ${ipList.length.toLocaleString()} of ${total.toLocaleString()}</span>
+            <button class="btn-more-ip-blocks" title="Load more">Show more</button>
+        </li>` : '');
+}
+
+/**
+ * Asks for the next page of the IP block list (sorted), starting at 'offset'.
+ */
+function sendRequestIpBlockPage(offset) {
+    if (socket && socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({ type: 'request_ip_block_page', offset }));
+    } else {
+        showNotification("Error: WebSocket not connected.", "error");
+    }
 }
 
 /**
@@ -1329,6 +1479,50 @@ function sendAddIpBlock(ipRange) {
     }
 }
 
+/**
+ * Uploads a threat list file in slices of whole lines; the daemon parses each one and acks it
+ * with a progress message, which sends the next (see renderIpBlockImportProgress).
+ */
+function sendImportIpBlocks(file) {
+    if (!(socket && socket.readyState === WebSocket.OPEN)) { showNotification("Error: WebSocket not connected.", "error"); return; }
+    if (pendingIpImport) { showNotification(`Still importing ${pendingIpImport.file.name}.`, "error"); return; }
+    pendingIpImport = { id: `${Date.now()}-${Math.random().toString(36).slice(2)}`, file, offset: 0, seq: 0, decoder: new TextDecoder(), carry: '' };
+    showNotification(`Importing ${file.name}...`);
+    sendNextIpImportChunk();
+}
+
+async function sendNextIpImportChunk() {
+    const job = pendingIpImport;
+    if (!job) return;
+    if (!(socket && socket.readyState === WebSocket.OPEN)) { pendingIpImport = null; showNotification("Import stopped: WebSocket disconnected.", "error"); return; }
+    const end = Math.min(job.offset + IP_IMPORT_CHUNK_BYTES, job.file.size);
+    let text;
+    try { text = job.carry + job.decoder.decode(await job.file.slice(job.offset, end).arrayBuffer(), { stream: end < job.file.size }); }
+    catch (e) { pendingIpImport = null; showNotification(`Could not read ${job.file.name}.`, "error"); return; }
+    job.offset = end;
+    const final = end >= job.file.size;
+    const cut = final ? text.length : text.lastIndexOf('\n') + 1; // A line split by the slice goes with the next one
+    job.carry = text.slice(cut);
+    socket.send(JSON.stringify({ type: 'import_ip_blocks', import_id: job.id, name: job.file.name, seq: job.seq++, text: text.slice(0, cut), final }));
+}
+
+/**
+ * Shows the progress of a block list import next to the import button.
+ */
+function renderIpBlockImportProgress(data) {
+    const status = document.getElementById('ip-block-import-status');
+    if (!status) return;
+    const counts = `${data.entries.toLocaleString()} ranges from ${data.lines.toLocaleString()} lines`;
+    const own = pendingIpImport && data.import_id === pendingIpImport.id;
+    if (own && data.stage === 'parsing' && data.seq === pendingIpImport.seq - 1) sendNextIpImportChunk(); // Ack of our last chunk
+    else if (own && (data.stage === 'done' || data.stage === 'failed')) pendingIpImport = null;
+    const sent = own && pendingIpImport.file.size ? ` (${Math.round(100 * pendingIpImport.offset / pendingIpImport.file.size)}% uploaded)` : '';
+    if (data.stage === 'parsing') status.textContent = `Parsing ${data.source}: ${counts}${sent}...`;
+    else if (data.stage === 'applying') status.textContent = `Applying ${counts}...`;
+    else if (data.stage === 'done') status.textContent = `${data.source}: ${data.added.toLocaleString()} new of ${counts} (${data.skipped} skipped, ${data.duplicates} duplicates) in ${data.seconds}s`;
+    else if (data.stage === 'failed') status.textContent = `${data.source}: import failed (${data.error})`;
+}
+
 /**
  * Sends request to remove an IP/CIDR from the block list.
  */
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import ipaddress
+import re
+
+# --- Configuration ---
+CHUNK_SIZE = 5000                       # Entries per chunk (one progress report each)
+_FIELD_SPLIT = re.compile(r'[,;|\s]+')  # CSV, Spamhaus-style "net ; SBL123", whitespace separated columns
+
+
+def normalize_entry(value):
+    """'10.0.0.7/24' -> '10.0.0.0/24', '10.0.0.7/32' -> '10.0.0.7'; None if 'value' is not an IP/CIDR."""
+    value = value.strip().strip('"\'')
+    if '.' not in value and ':' not in value: return None # ip_network('12') would be 0.0.0.12
+    try: network = ipaddress.ip_network(value, strict=False)
+    except ValueError: return None
+    return str(network.network_address) if network.num_addresses == 1 else str(network)
+
+
+class BlockListParser:
+    """
+    Streaming parser for threat lists: one entry per line, plain text or CSV.
+    Comments (#) and blank lines are ignored; on other lines the first field
+    that is an IP or CIDR is taken (so headers, ids and trailing annotations
+    are skipped). Entries are normalized and de-duplicated across the whole
+    input, and handed out in chunks so the caller can report progress and
+    never holds more than the result set.
+    """
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.seen = set()
+        self.lines = 0
+        self.skipped = 0        # Lines with no IP/CIDR field (headers, garbage)
+        self.duplicates = 0
+
+    def parse_line(self, line):
+        line = line.split('#', 1)[0].lstrip('\ufeff')
+        if not line.strip(): return None
+        for field in _FIELD_SPLIT.split(line):
+            entry = normalize_entry(field) if field else None
+            if entry: return entry
+        self.skipped += 1
+        return None
+
+    def chunks(self, lines):
+        """Yields lists of new normalized entries (at most chunk_size each) from an iterable of lines."""
+        chunk = []
+        for line in lines:
+            self.lines += 1
+            entry = self.parse_line(line)
+            if entry is None: continue
+            if entry in self.seen: self.duplicates += 1; continue
+            self.seen.add(entry); chunk.append(entry)
+            if len(chunk) >= self.chunk_size: yield chunk; chunk = []
+        if chunk: yield chunk
+
+    def stats(self):
+        return {'lines': self.lines, 'entries': len(self.seen), 'skipped': self.skipped, 'duplicates': self.duplicates}
@@ -1,10 +1,14 @@
-from hotspot_manager_core import BandwidthTracker, HotspotManager
+from sampling_profiler import SamplingProfiler, profiling_requested
+from hotspot_logging import setup_logging, shutdown_logging
 import subprocess
 import re
 import sys
 
 
 def main():
+    setup_logging()
+    profiler = SamplingProfiler() if profiling_requested() else None # --profile: dump with SIGUSR2, and on exit
+    if profiler: profiler.start(); profiler.install_signal_handler()
     print("\n" + "=" * 100)
     print("    🔥 WiFi Hotspot Manager with HYBRID Bandwidth Limiting, Priority & Quotas") # QUOTA: Updated title
     print("=" * 100)
@@ -21,6 +25,7 @@ def main():
         else: print("⚠️ Could not list interfaces.")
         sys.exit(1)
 
+    from hotspot_manager_core import BandwidthTracker, HotspotManager # After the interface check: a wrong interface fails fast
     manager = HotspotManager(interface=default_interface, ssid="MyBandwidthManager", password="12345678")
     manager.check_sudo(); manager.check_dependencies()
 
@@ -76,6 +81,8 @@ def main():
         manager.cleanup_iptables_monitoring()
         manager.bandwidth_limiter.cleanup_tc()
         print("✅ Cleanup complete.")
+        if profiler: profiler.stop(); profiler.dump()
+        shutdown_logging()
         sys.exit(0)
 
 if __name__ == "__main__":
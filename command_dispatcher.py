@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
+from metrics import REGISTRY
+from hotspot_logging import get_logger
+
+log = get_logger("commands")
+
+# --- Configuration ---
+SLOW_COMMAND_SECONDS = 5.0   # Commands slower than this (queue wait + run) are logged
+
+COMMAND_SECONDS = REGISTRY.histogram("hotspot_command_seconds", "Command latency from arrival to completion (wait + run), by command.", ("command",))
+COMMAND_WAIT_SECONDS = REGISTRY.histogram("hotspot_command_wait_seconds", "Time commands spent queued in their lane, by command.", ("command",))
+COMMANDS_COALESCED = REGISTRY.counter("hotspot_commands_coalesced_total", "Queued commands replaced by a newer one, by command.", ("command",))
+COMMAND_ERRORS = REGISTRY.counter("hotspot_command_errors_total", "Commands whose handler raised, by command.", ("command",))
+COMMAND_QUEUE_DEPTH = REGISTRY.gauge("hotspot_command_queue_depth", "Commands waiting in all lanes.")
+
+
+class LifecycleLock:
+    """
+    Shared/exclusive lock for the hotspot lifecycle. Ordinary commands hold it
+    shared and run side by side; toggling the hotspot holds it exclusively.
+    A waiting exclusive holder blocks new shared holders so it cannot starve.
+    """
+    def __init__(self):
+        self._cond = asyncio.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._waiting_exclusive = 0
+
+    @asynccontextmanager
+    async def shared(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._exclusive and not self._waiting_exclusive)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._shared -= 1
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def exclusive(self):
+        async with self._cond:
+            self._waiting_exclusive += 1
+            try:
+                await self._cond.wait_for(lambda: not self._exclusive and self._shared == 0)
+            finally:
+                self._waiting_exclusive -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+class CommandStats:
+    """Per-command-type counters: runs, coalesced, errors, latency (wait + run)."""
+    __slots__ = ('count', 'coalesced', 'errors', 'total_seconds', 'max_seconds', 'last_seconds', 'total_wait_seconds')
+
+    def __init__(self):
+        self.count = 0; self.coalesced = 0; self.errors = 0
+        self.total_seconds = 0.0; self.max_seconds = 0.0; self.last_seconds = 0.0; self.total_wait_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "count": self.count, "coalesced": self.coalesced, "errors": self.errors,
+            "avg_ms": round(self.total_seconds / self.count * 1000, 1) if self.count else 0.0,
+            "avg_wait_ms": round(self.total_wait_seconds / self.count * 1000, 1) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 1), "last_ms": round(self.last_seconds * 1000, 1),
+        }
+
+
+class CommandDispatcher:
+    """
+    Runs commands concurrently. route(message) returns (lane, coalesce_key, exclusive):
+    commands in the same lane (e.g. one device IP) run one at a time in arrival
+    order, different lanes run in parallel. A queued command is replaced by a
+    newer one with the same coalesce_key (latest wins, keeping its place in the
+    lane); None never coalesces. Exclusive commands wait for everything else to
+    finish and hold off new commands while they run.
+    """
+    def __init__(self, handler, route):
+        self.handler = handler    # async handler(message)
+        self.route = route
+        self.lifecycle = LifecycleLock()
+        self.lanes = {}           # { lane: {coalesce_key: (message, enqueued_at)} }  (dicts keep order)
+        self.workers = {}         # { lane: asyncio.Task }
+        self.stats = {}           # { msg_type: CommandStats }
+        self.max_depth = 0
+        self._unique = itertools.count()
+
+    def _stats_for(self, msg_type):
+        stats = self.stats.get(msg_type)
+        if stats is None: stats = self.stats[msg_type] = CommandStats()
+        return stats
+
+    def queue_depth(self):
+        return sum(len(pending) for pending in self.lanes.values())
+
+    def submit(self, message):
+        """Queues a message without blocking the receiver."""
+        lane, coalesce_key, exclusive = self.route(message)
+        pending = self.lanes.setdefault(lane, {})
+        key = coalesce_key if coalesce_key is not None else ('unique', next(self._unique))
+        if key in pending:
+            self._stats_for(message.get("type")).coalesced += 1; COMMANDS_COALESCED.inc(command=message.get("type"))
+            log.debug("⏩ Coalesced superseded %s in lane %s", message.get('type'), lane)
+            pending[key] = (message, pending[key][1]) # Latest payload, original place and wait time
+        else:
+            pending[key] = (message, time.monotonic())
+        self.max_depth = max(self.max_depth, self.queue_depth()); COMMAND_QUEUE_DEPTH.set(self.queue_depth())
+        if lane not in self.workers:
+            self.workers[lane] = asyncio.create_task(self._drain(lane, exclusive))
+
+    async def _drain(self, lane, exclusive):
+        pending = self.lanes[lane]
+        try:
+            while pending:
+                key = next(iter(pending))
+                message, enqueued_at = pending.pop(key)
+                COMMAND_QUEUE_DEPTH.set(self.queue_depth())
+                # A lane is either always exclusive or never (route() decides by command type)
+                lock = self.lifecycle.exclusive() if exclusive else self.lifecycle.shared()
+                async with lock:
+                    started = time.monotonic()
+                    failed = False
+                    try:
+                        await self.handler(message)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        failed = True
+                        log.exception(f"❌ Command {message.get('type')} failed: {e}")
+                finished = time.monotonic()
+                stats = self._stats_for(message.get("type"))
+                stats.count += 1; stats.errors += failed
+                stats.last_seconds = finished - enqueued_at
+                stats.total_seconds += stats.last_seconds
+                stats.total_wait_seconds += started - enqueued_at
+                stats.max_seconds = max(stats.max_seconds, stats.last_seconds)
+                COMMAND_SECONDS.observe(stats.last_seconds, command=message.get("type")); COMMAND_WAIT_SECONDS.observe(started - enqueued_at, command=message.get("type"))
+                if failed: COMMAND_ERRORS.inc(command=message.get("type"))
+                if stats.last_seconds > SLOW_COMMAND_SECONDS:
+                    log.warning(f"🐢 {message.get('type')} took {stats.last_seconds:.1f}s (waited {started - enqueued_at:.1f}s)")
+        finally:
+            self.workers.pop(lane, None)
+            if not pending: self.lanes.pop(lane, None)
+
+    def snapshot(self):
+        """Latency/queue-depth summary for the dashboard."""
+        return {
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self.max_depth,
+            "active_lanes": len(self.workers),
+            "commands": {msg_type: stats.as_dict() for msg_type, stats in sorted(self.stats.items())},
+        }
+
+    async def shutdown(self):
+        for task in list(self.workers.values()): task.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import time
+import zlib
+import msgpack # Ships with channels_redis
+
+# --- Configuration ---
+COMPRESS_MIN_BYTES = 1024   # Frames at least this big are deflated (once, here); None = never
+FRAME_RAW = 0               # First byte of every frame: how the msgpack body is stored
+FRAME_DEFLATE = 1
+
+_MISSING = object()
+
+
+def encode_frame(message, compress_min_bytes=COMPRESS_MIN_BYTES):
+    """
+    Encodes a message once into the binary frame every dashboard receives:
+    one flag byte, then the msgpack body, zlib-deflated if that makes it smaller.
+    """
+    body = msgpack.packb(message, use_bin_type=True)
+    if compress_min_bytes is not None and len(body) >= compress_min_bytes:
+        packed = zlib.compress(body, 6)
+        if len(packed) < len(body): return bytes((FRAME_DEFLATE,)) + packed
+    return bytes((FRAME_RAW,)) + body
+
+
+def decode_frame(frame):
+    """Inverse of encode_frame() (used by tools and tests; the dashboard decodes in script.js)."""
+    body = zlib.decompress(frame[1:]) if frame[0] == FRAME_DEFLATE else frame[1:]
+    return msgpack.unpackb(body, raw=False, strict_map_key=False)
+
+
+class DeltaPublisher:
+    """
+    Keeps the last published dashboard state and turns every new payload into a
+    versioned delta: changed top-level fields, changed fields of each device
+    (new devices in full) and removed device IPs. Sequence numbers are strictly
+    increasing, so a receiver that sees a gap knows to ask for a snapshot().
+    The epoch changes on every daemon start, when the numbering starts over.
+    """
+    def __init__(self, key='ip', topic=None, stream=None):
+        self.key = key
+        self.topic = topic      # What the dashboard applies the frames to
+        self.stream = stream    # Which (topic, rate) stream this is, for the consumers
+        self.epoch = time.time_ns()
+        self.seq = 0
+        self.fields = {}    # Top-level payload fields (everything except 'devices')
+        self.devices = {}   # { ip: device dict } in first-seen order
+
+    def publish(self, payload):
+        """Returns the delta for 'payload' and makes it the current state, or None if nothing changed."""
+        fields = {k: v for k, v in payload.items() if k != 'devices'}
+        changed_fields = {k: v for k, v in fields.items() if self.fields.get(k, _MISSING) != v}
+
+        current = {}
+        changed_devices = {}
+        for device in payload.get('devices') or []:
+            ip = device.get(self.key)
+            if ip is None: continue
+            current[ip] = device
+            previous = self.devices.get(ip)
+            if previous is None:
+                changed_devices[ip] = device
+                continue
+            patch = {k: v for k, v in device.items() if previous.get(k, _MISSING) != v}
+            if patch: changed_devices[ip] = patch
+        removed = [ip for ip in self.devices if ip not in current]
+
+        if not (changed_fields or changed_devices or removed): return None
+        self.seq += 1
+        self.fields = fields
+        # Keep first-seen order so the client's list does not jump around
+        devices = {ip: current[ip] for ip in self.devices if ip in current}
+        devices.update((ip, device) for ip, device in current.items() if ip not in devices)
+        self.devices = devices
+
+        delta = {"epoch": self.epoch, "seq": self.seq}
+        if changed_fields: delta["fields"] = changed_fields
+        if changed_devices: delta["devices"] = changed_devices
+        if removed: delta["removed"] = removed
+        return delta
+
+    def snapshot(self):
+        """The full current state, tagged with the sequence number it corresponds to."""
+        return {"epoch": self.epoch, "seq": self.seq, "data": dict(self.fields, devices=list(self.devices.values()))}
+
+    # --- Channel layer events: epoch/seq in clear for the consumer, payload pre-encoded ---
+    def delta_event(self, delta):
+        return {"type": "network.data.delta", "stream": self.stream, "epoch": delta["epoch"], "seq": delta["seq"],
+                "frame": encode_frame(dict(delta, type="delta", topic=self.topic))}
+
+    def snapshot_event(self):
+        snapshot = self.snapshot()
+        return {"type": "network.data.snapshot", "stream": self.stream, "epoch": snapshot["epoch"], "seq": snapshot["seq"],
+                "frame": encode_frame(dict(snapshot, type="snapshot", topic=self.topic))}
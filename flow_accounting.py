@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import heapq
+import itertools
+import os
+import subprocess
+import time
+from metrics import REGISTRY
+from hotspot_logging import get_logger
+
+log = get_logger("flows")
+
+# --- Configuration ---
+CONNTRACK_PROC = '/proc/net/nf_conntrack'
+CONNTRACK_ACCT = '/proc/sys/net/netfilter/nf_conntrack_acct'
+CONNTRACK_DUMP = ['conntrack', '-L', '-o', 'extended']  # Netlink dump, if the kernel has no /proc/net/nf_conntrack
+SKETCH_CAPACITY = 64         # Counters per device: the top talkers are exact once they hold more than 1/64 of its bytes
+TOP_N = 5                    # Talkers per device in the live payload
+FLOW_POLL_INTERVAL = 5       # Seconds between conntrack reads
+FLOW_WINDOW_SECONDS = 300    # Top talkers of each window go to the usage store
+
+CONNTRACK_FLOWS = REGISTRY.gauge("hotspot_conntrack_flows", "Conntrack entries with a hotspot device, last poll.")
+FLOW_POLL_SECONDS = REGISTRY.gauge("hotspot_conntrack_poll_seconds", "Time the last conntrack read and aggregation took.")
+
+
+class SpaceSaving:
+    """
+    Weighted Space-Saving heavy-hitter sketch (Metwally et al.): at most
+    'capacity' counters. A new key takes over the smallest counter and
+    inherits its count as its error bound, so every reported count is an
+    overestimate by at most 'error', and any key with more than
+    total/capacity of the weight is guaranteed to be in the sketch.
+    """
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}    # { key: count }
+        self.errors = {}    # { key: overestimate bound }
+        self.heap = []      # (count, seq, key), lazily updated: stale entries are skipped on pop
+        self.seq = itertools.count() # Ties never compare keys
+        self.total = 0
+
+    def add(self, key, weight):
+        if weight <= 0: return
+        self.total += weight
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = weight; self.errors[key] = 0
+        else:
+            smallest, evicted = self._pop_min()
+            del self.counts[evicted], self.errors[evicted]
+            self.counts[key] = smallest + weight; self.errors[key] = smallest
+        heapq.heappush(self.heap, (self.counts[key], next(self.seq), key))
+        if len(self.heap) > 4 * self.capacity: self.heap = [(c, next(self.seq), k) for k, c in self.counts.items()]; heapq.heapify(self.heap)
+
+    def _pop_min(self):
+        while True:
+            count, _, key = heapq.heappop(self.heap)
+            if self.counts.get(key) == count: return count, key
+
+    def top(self, n=TOP_N):
+        """[(key, count, error)], largest first."""
+        return [(key, count, self.errors[key]) for key, count in heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])]
+
+    def __len__(self):
+        return len(self.counts)
+
+
+def parse_conntrack(lines):
+    """
+    Streams conntrack entries ('/proc/net/nf_conntrack' or 'conntrack -L -o
+    extended' lines) as (proto, src, dst, sport, dport, orig bytes, reply bytes)
+    of the original direction (ICMP: the echo id as sport, no dport). Entries
+    without byte counters (accounting off) are skipped.
+    """
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 4: continue
+        if fields[0] in ('ipv4', 'ipv6'): fields = fields[2:]
+        orig = {}; reply = {}
+        for field in fields[2:]:
+            key, sep, value = field.partition('=')
+            if not sep: continue
+            if key not in orig: orig[key] = value
+            elif key not in reply:
+                reply[key] = value
+                if key == 'bytes': break # The rest (flags, mark, zone, use) is not needed
+        if 'bytes' not in orig or 'src' not in orig: continue
+        yield fields[0], orig['src'], orig['dst'], orig.get('sport', orig.get('id')), orig.get('dport'), int(orig['bytes']), int(reply.get('bytes', 0))
+
+
+class FlowAccounting:
+    """
+    Per-flow accounting from conntrack: each poll reads the table as a
+    stream, turns the cumulative per-connection byte counters into deltas
+    (connections gone since the last poll are dropped from the baseline) and
+    charges them to the hotspot device on the connection, keyed by
+    (remote address, remote port, protocol). The first poll only records the
+    baseline: connections already open at start are charged from then on, not
+    for their whole lifetime. Memory is bounded by one
+    Space-Saving sketch per device for the session and one for the current
+    persistence window, whatever the number of flows.
+    """
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.sessions = {}   # { device ip: SpaceSaving } since start (live payload)
+        self.windows = {}    # { device ip: SpaceSaving } since the last drain_window() (usage store)
+        self.last_bytes = {} # { conntrack orig tuple: orig + reply bytes at the last poll }
+        self.baselined = False # Set by the first poll, which charges nothing
+        self.source = None   # 'proc' or 'netlink', once a read worked
+
+    @staticmethod
+    def enable_kernel_accounting():
+        """Turns on conntrack byte counters (connections opened before this are counted from zero)."""
+        try:
+            with open(CONNTRACK_ACCT, 'w') as f: f.write('1')
+            return True
+        except OSError as e:
+            log.warning(f"⚠️ Could not enable conntrack accounting: {e}"); return False
+
+    def _read(self, consume):
+        """Runs 'consume' over the conntrack lines from /proc, or from a netlink dump."""
+        if os.path.exists(CONNTRACK_PROC):
+            with open(CONNTRACK_PROC) as f: self.source = 'proc'; return consume(f)
+        try: dump = subprocess.Popen(CONNTRACK_DUMP, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        except OSError:
+            if self.source != 'none': log.warning("⚠️ No conntrack table: neither /proc/net/nf_conntrack nor the conntrack tool is available.")
+            self.source = 'none'; return 0
+        with dump: self.source = 'netlink'; return consume(dump.stdout)
+
+    def poll(self, networks):
+        """Reads conntrack once and charges the new bytes to the devices in 'networks' (a PrefixIndex). Returns the flows seen."""
+        charge = self.baselined
+        started = time.perf_counter()
+        def consume(lines):
+            seen = {}; local = {} # { address: in 'networks' }, the same few devices are on most flows
+            for proto, src, dst, sport, dport, orig_bytes, reply_bytes in parse_conntrack(lines):
+                src_local = local.get(src)
+                if src_local is None: src_local = local[src] = src in networks
+                if src_local: device, remote = src, dst
+                else:
+                    dst_local = local.get(dst)
+                    if dst_local is None: dst_local = local[dst] = dst in networks
+                    if not dst_local: continue # Not hotspot traffic (e.g. the host's own connections)
+                    device, remote = dst, src
+                flow = (proto, src, dst, sport, dport); total = orig_bytes + reply_bytes
+                last = self.last_bytes.get(flow, 0)
+                delta = total - last if total >= last else total # Counter went back: a new connection reused the tuple
+                seen[flow] = total
+                if delta and charge:
+                    key = (remote, int(dport) if dport else None, proto) # The service port (the device's own on inbound connections)
+                    self._sketch(self.sessions, device).add(key, delta); self._sketch(self.windows, device).add(key, delta)
+            self.last_bytes = seen; self.baselined = True
+            return len(seen)
+        flows = self._read(consume)
+        CONNTRACK_FLOWS.set(flows); FLOW_POLL_SECONDS.set(time.perf_counter() - started)
+        return flows
+
+    def _sketch(self, sketches, device):
+        sketch = sketches.get(device)
+        if sketch is None: sketch = sketches[device] = SpaceSaving(self.capacity)
+        return sketch
+
+    def top(self, device, n=TOP_N):
+        """Top-N remote endpoints of 'device' this session, as payload rows."""
+        sketch = self.sessions.get(device)
+        if sketch is None: return []
+        return [{"remote": remote, "port": port, "proto": proto, "bytes": count, "error": error} for (remote, port, proto), count, error in sketch.top(n)]
+
+    def drain_window(self, n=TOP_N):
+        """[(device, remote, port, proto, bytes)] of the window just ended (top-N per device); starts a new window."""
+        windows, self.windows = self.windows, {}
+        return [(device, remote, port, proto, count) for device, sketch in windows.items() for (remote, port, proto), count, _ in sketch.top(n)]
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Forecast backtesting and trainer benchmark harness.
+
+Generates synthetic multi-week hotspot usage (diurnal + weekly seasonality +
+bursts) into a scratch hotspot_usage.db, runs model_trainer.aggregate_data()
+and every forecasting engine under rolling-origin evaluation, and reports
+MAPE / interval coverage next to wall time and peak RSS.
+
+Example:
+    python3 forecast_benchmark.py --weeks 2 4 --engines naive online prophet
+    python3 forecast_benchmark.py --max-mape 40 --min-coverage 60   # exits 1 on regression
+"""
+
+import argparse
+import importlib.util
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import model_trainer
+from forecaster import OnlineForecaster, AGGREGATION_MINUTES, SLOTS_PER_DAY
+
+# --- Configuration ---
+DEFAULT_WEEKS = [3]
+DEFAULT_DEVICES = 6
+DEFAULT_RESOLUTION_SECONDS = 60   # One data_log row per device per minute
+DEFAULT_ORIGINS = 7               # Rolling origins, one per day at the end of the data
+DEFAULT_HORIZON_HOURS = 24
+ENGINES = ['naive', 'online', 'prophet']
+ENGINE_REQUIREMENTS = {'prophet': ('pandas', 'prophet')}  # Optional engines: skipped (not failed) without these
+
+# --- Synthetic Traffic Generator ---
+def diurnal_factor(dt):
+    """Relative activity by time of day: quiet nights, a midday bump and an evening peak."""
+    hour = dt.hour + dt.minute / 60.0
+    evening = math.exp(-((hour - 21.0) ** 2) / 8.0)
+    midday = 0.5 * math.exp(-((hour - 13.0) ** 2) / 6.0)
+    return 0.05 + evening + midday
+
+def weekly_factor(dt):
+    """Weekends are busier, Mondays a little quieter."""
+    return {5: 1.4, 6: 1.5, 0: 0.85}.get(dt.weekday(), 1.0)
+
+def generate_synthetic_rows(weeks, devices, resolution_s, seed, end=None):
+    """
+    Yields data_log rows (timestamp, ip, rx_bytes, tx_bytes) covering 'weeks'
+    weeks up to 'end'. Each device has its own scale, multiplicative noise and
+    occasional multi-minute bursts (downloads, video calls).
+    """
+    rng = random.Random(seed)
+    end = end or datetime.now().replace(second=0, microsecond=0)
+    start = end - timedelta(weeks=weeks)
+    profiles = [
+        {'ip': f'10.42.0.{10 + n}', 'scale': rng.uniform(20e3, 150e3), 'burst_left': 0, 'burst_mult': 1.0}
+        for n in range(devices)
+    ]
+    step = timedelta(seconds=resolution_s)
+    ts = start
+    while ts < end:
+        ts_str = ts.strftime('%Y-%m-%d %H:%M:%S')
+        base = diurnal_factor(ts) * weekly_factor(ts)
+        for prof in profiles:
+            if prof['burst_left'] > 0:
+                prof['burst_left'] -= 1
+            elif rng.random() < 0.002:
+                prof['burst_left'] = rng.randint(3, 30)
+                prof['burst_mult'] = rng.uniform(4.0, 15.0)
+            mult = prof['burst_mult'] if prof['burst_left'] > 0 else 1.0
+            rate = prof['scale'] * base * mult * rng.lognormvariate(0, 0.35)  # bytes/sec
+            rx = int(rate * resolution_s)
+            yield (ts_str, prof['ip'], rx, int(rx * rng.uniform(0.05, 0.2)))
+        ts += step
+
+def populate_scratch_db(db_file, weeks, devices, resolution_s, seed):
+    """Creates a scratch DB with the daemon's data_log schema and fills it. Returns the row count."""
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.execute('CREATE TABLE IF NOT EXISTS data_log ( timestamp TEXT, ip_address TEXT, rx_bytes INTEGER, tx_bytes INTEGER )')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON data_log (timestamp)')
+        count = 0; chunk = []
+        for row in generate_synthetic_rows(weeks, devices, resolution_s, seed):
+            chunk.append(row)
+            if len(chunk) >= 50000:
+                conn.executemany("INSERT INTO data_log VALUES (?,?,?,?)", chunk); count += len(chunk); chunk = []
+        if chunk:
+            conn.executemany("INSERT INTO data_log VALUES (?,?,?,?)", chunk); count += len(chunk)
+        conn.commit()
+        return count
+    finally:
+        conn.close()
+
+def load_summary(db_file):
+    """Returns the aggregated usage_summary as an ordered list of (timestamp_str, total_rx)."""
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute("SELECT timestamp, total_rx_bytes FROM usage_summary ORDER BY timestamp").fetchall()
+    finally:
+        conn.close()
+
+# --- Forecasting Engines ---
+# Each engine: (train_rows, origin_dt, horizon_hours) -> [(timestamp_str, predicted, lower, upper), ...]
+def engine_naive(train_rows, origin, horizon_hours):
+    """Seasonal naive: same slot one week earlier (falls back to one day earlier)."""
+    history = {ts: y for ts, y in train_rows}
+    step = timedelta(minutes=AGGREGATION_MINUTES)
+    # Interval width from the naive model's own one-week-back residuals on the training data
+    residuals = []
+    for ts, y in train_rows:
+        prev = history.get((datetime.strptime(ts, '%Y-%m-%d %H:%M:%S') - timedelta(weeks=1)).strftime('%Y-%m-%d %H:%M:%S'))
+        if prev is not None: residuals.append(y - prev)
+    spread = 1.96 * math.sqrt(sum(r * r for r in residuals) / len(residuals)) if residuals else 0.0
+    points = []
+    ts = origin + step
+    for _ in range(int(horizon_hours * 60 / AGGREGATION_MINUTES)):
+        pred = None
+        for back in (timedelta(weeks=1), timedelta(days=1)):
+            pred = history.get((ts - back).strftime('%Y-%m-%d %H:%M:%S'))
+            if pred is not None: break
+        if pred is not None:
+            points.append((ts.strftime('%Y-%m-%d %H:%M:%S'), pred, max(0.0, pred - spread), pred + spread))
+        ts += step
+    return points
+
+def engine_online(train_rows, origin, horizon_hours):
+    """The daemon's OnlineForecaster, seeded from the training window."""
+    model = OnlineForecaster()
+    model.seed(train_rows, now=origin + timedelta(minutes=AGGREGATION_MINUTES))
+    store = model.build_forecast(origin, hours=horizon_hours)
+    return list(zip(store.timestamps, store.predicted, store.lower, store.upper))
+
+def engine_prophet(train_rows, origin, horizon_hours):
+    """model_trainer's Prophet model (requires pandas + prophet)."""
+    import pandas as pd
+    df = pd.DataFrame(train_rows, columns=['ds', 'y'])
+    periods = int(horizon_hours * 60 / AGGREGATION_MINUTES)
+    forecast_df = model_trainer.fit_prophet_forecast(df, periods)
+    origin_str = origin.strftime('%Y-%m-%d %H:%M:%S')
+    forecast_df = forecast_df[forecast_df['ds'] > origin_str]
+    return [
+        (row.ds.strftime('%Y-%m-%d %H:%M:%S'), max(0.0, row.yhat), max(0.0, row.yhat_lower), max(0.0, row.yhat_upper))
+        for row in forecast_df.itertuples()
+    ]
+
+ENGINE_FUNCS = {'naive': engine_naive, 'online': engine_online, 'prophet': engine_prophet}
+
+def missing_requirements(engine):
+    """Modules 'engine' needs that are not installed (found without importing them)."""
+    return [name for name in ENGINE_REQUIREMENTS.get(engine, ()) if importlib.util.find_spec(name) is None]
+
+# --- Measurement ---
+def _measured_child(conn, func, args):
+    try:
+        start = time.perf_counter()
+        result = func(*args)
+        wall = time.perf_counter() - start
+        # ru_maxrss is in KiB on Linux
+        conn.send(('ok', result, wall, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}", 0.0, 0.0))
+    finally:
+        conn.close()
+
+def run_measured(func, *args):
+    """
+    Runs func(*args) in a forked child so each stage gets its own peak RSS.
+    Returns (result, wall_seconds, peak_rss_mb). Raises RuntimeError if the stage failed.
+    """
+    ctx = multiprocessing.get_context('fork')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_measured_child, args=(child_conn, func, args))
+    proc.start(); child_conn.close()
+    try:
+        status, result, wall, rss = parent_conn.recv()
+    except EOFError:
+        status, result, wall, rss = 'error', f"stage crashed (exit code {proc.exitcode})", 0.0, 0.0
+    proc.join()
+    if status != 'ok': raise RuntimeError(result)
+    return result, wall, rss
+
+# --- Rolling-Origin Evaluation ---
+def rolling_origin_backtest(engine_func, summary_rows, origins, horizon_hours):
+    """
+    Fits the engine at 'origins' cut points (one per day, ending one horizon before
+    the last observation) and returns per-origin forecasts and fit times.
+    Runs inside a measured child process.
+    """
+    last = datetime.strptime(summary_rows[-1][0], '%Y-%m-%d %H:%M:%S')
+    results = []
+    for n in range(origins, 0, -1):
+        origin = last - timedelta(hours=horizon_hours) - timedelta(days=n - 1)
+        origin_str = origin.strftime('%Y-%m-%d %H:%M:%S')
+        train_rows = [(ts, y) for ts, y in summary_rows if ts <= origin_str]
+        if len(train_rows) < SLOTS_PER_DAY: continue   # Need at least a day of history
+        start = time.perf_counter()
+        forecast = engine_func(train_rows, origin, horizon_hours)
+        results.append({'origin': origin_str, 'train_points': len(train_rows), 'fit_seconds': time.perf_counter() - start, 'forecast': forecast})
+    return results
+
+def score_backtest(results, actuals):
+    """Returns MAPE (%) and 95% interval coverage (%) over buckets with non-zero actual usage."""
+    abs_pct_errors = []; covered = 0
+    for res in results:
+        for ts, pred, lower, upper in res['forecast']:
+            actual = actuals.get(ts)
+            if not actual: continue
+            abs_pct_errors.append(abs(actual - pred) / actual)
+            if lower <= actual <= upper: covered += 1
+    if not abs_pct_errors: return None, None, 0
+    n = len(abs_pct_errors)
+    return 100.0 * sum(abs_pct_errors) / n, 100.0 * covered / n, n
+
+# --- Benchmark Driver ---
+def benchmark_scenario(weeks, args, workdir):
+    """Runs generation, aggregation and all engines for one history length. Returns report rows."""
+    db_file = os.path.join(workdir, f'hotspot_usage_{weeks}w.db')
+    if os.path.exists(db_file): os.remove(db_file)
+    rows = []
+
+    print(f"\n=== Scenario: {weeks} week(s), {args.devices} devices, {args.resolution}s resolution ===")
+    count, wall, rss = run_measured(populate_scratch_db, db_file, weeks, args.devices, args.resolution, args.seed)
+    print(f"Generated {count} raw rows in {wall:.2f}s")
+    rows.append({'weeks': weeks, 'stage': 'generate', 'wall_s': wall, 'peak_rss_mb': rss, 'points': count})
+
+    # model_trainer works on module-level config: point it at the scratch DB
+    model_trainer.DB_FILE = db_file
+    model_trainer.TRAIN_DAYS = weeks * 7 + 1
+    model_trainer.init_db()
+    _, wall, rss = run_measured(model_trainer.aggregate_data)
+    summary_rows = load_summary(db_file)
+    rows.append({'weeks': weeks, 'stage': 'aggregate_data', 'wall_s': wall, 'peak_rss_mb': rss, 'points': len(summary_rows)})
+    if not summary_rows:
+        print("❌ Aggregation produced no rows; skipping engines.")
+        return rows
+    actuals = dict(summary_rows)
+
+    for engine in args.engines:
+        missing = missing_requirements(engine)
+        if missing:
+            print(f"ℹ️  Engine '{engine}' skipped: {', '.join(missing)} not installed")
+            rows.append({'weeks': weeks, 'stage': engine, 'skipped': f"{', '.join(missing)} not installed"})
+            continue
+        try:
+            results, wall, rss = run_measured(rolling_origin_backtest, ENGINE_FUNCS[engine], summary_rows, args.origins, args.horizon)
+        except RuntimeError as e:
+            print(f"⚠️ Engine '{engine}' failed: {e}")
+            rows.append({'weeks': weeks, 'stage': engine, 'error': str(e)})
+            continue
+        mape, coverage, scored = score_backtest(results, actuals)
+        fit_times = [r['fit_seconds'] for r in results]
+        rows.append({
+            'weeks': weeks, 'stage': engine, 'wall_s': wall, 'peak_rss_mb': rss, 'points': scored,
+            'origins': len(results), 'fit_s_mean': sum(fit_times) / len(fit_times) if fit_times else None,
+            'fit_s_max': max(fit_times) if fit_times else None, 'mape': mape, 'coverage': coverage,
+        })
+    return rows
+
+def fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+def print_report(report):
+    print("\n" + "=" * 110)
+    print(f"{'Weeks':<6} {'Stage':<16} {'Wall s':>9} {'Fit s/origin':>13} {'Fit s max':>10} {'Peak RSS MB':>12} {'MAPE %':>8} {'Cover %':>8} {'Points':>9}")
+    print("-" * 110)
+    for row in report:
+        if 'error' in row:
+            print(f"{row['weeks']:<6} {row['stage']:<16} ERROR: {row['error']}"); continue
+        if 'skipped' in row:
+            print(f"{row['weeks']:<6} {row['stage']:<16} skipped ({row['skipped']})"); continue
+        print(f"{row['weeks']:<6} {row['stage']:<16} {fmt(row.get('wall_s'), '.2f'):>9} {fmt(row.get('fit_s_mean'), '.3f'):>13} "
+              f"{fmt(row.get('fit_s_max'), '.3f'):>10} {fmt(row.get('peak_rss_mb'), '.1f'):>12} {fmt(row.get('mape'), '.1f'):>8} "
+              f"{fmt(row.get('coverage'), '.1f'):>8} {fmt(row.get('points'), 'd'):>9}")
+    print("=" * 110)
+
+def check_budgets(report, args):
+    """Returns a list of budget violations (empty if everything is within budget)."""
+    failures = []
+    for row in report:
+        if row['stage'] not in ENGINE_FUNCS or 'skipped' in row: continue
+        name = f"{row['stage']} @ {row['weeks']}w"
+        if 'error' in row:
+            failures.append(f"{name}: failed ({row['error']})"); continue
+        if args.max_mape is not None and row['mape'] is not None and row['mape'] > args.max_mape:
+            failures.append(f"{name}: MAPE {row['mape']:.1f}% > {args.max_mape}%")
+        if args.min_coverage is not None and row['coverage'] is not None and row['coverage'] < args.min_coverage:
+            failures.append(f"{name}: coverage {row['coverage']:.1f}% < {args.min_coverage}%")
+        if args.max_fit_seconds is not None and row['fit_s_max'] is not None and row['fit_s_max'] > args.max_fit_seconds:
+            failures.append(f"{name}: fit time {row['fit_s_max']:.2f}s > {args.max_fit_seconds}s")
+        if args.max_rss_mb is not None and row['peak_rss_mb'] > args.max_rss_mb:
+            failures.append(f"{name}: peak RSS {row['peak_rss_mb']:.0f}MB > {args.max_rss_mb}MB")
+    return failures
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest and benchmark the hotspot usage forecasters on synthetic traffic.")
+    parser.add_argument('--weeks', type=int, nargs='+', default=DEFAULT_WEEKS, help="History lengths to benchmark (weeks)")
+    parser.add_argument('--devices', type=int, default=DEFAULT_DEVICES)
+    parser.add_argument('--resolution', type=int, default=DEFAULT_RESOLUTION_SECONDS, help="Seconds between synthetic data_log rows per device")
+    parser.add_argument('--origins', type=int, default=DEFAULT_ORIGINS, help="Number of rolling forecast origins (one per day)")
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON_HOURS, help="Forecast horizon in hours")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, help="Engines to run (default: all whose dependencies are installed)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', help="Directory for the scratch DBs (default: a temp dir, removed afterwards)")
+    parser.add_argument('--json', dest='json_out', help="Also write the report as JSON to this file")
+    parser.add_argument('--max-mape', type=float, help="Fail if any engine's MAPE (%%) exceeds this")
+    parser.add_argument('--min-coverage', type=float, help="Fail if any engine's interval coverage (%%) is below this")
+    parser.add_argument('--max-fit-seconds', type=float, help="Fail if any single fit takes longer than this")
+    parser.add_argument('--max-rss-mb', type=float, help="Fail if any engine's peak RSS exceeds this")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.engines is None: args.engines = [engine for engine in ENGINES if not missing_requirements(engine)]
+    workdir = args.workdir or tempfile.mkdtemp(prefix='hotspot_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    report = []
+    try:
+        for weeks in args.weeks:
+            report.extend(benchmark_scenario(weeks, args, workdir))
+    except Exception as e:
+        print(f"🚨 Benchmark failed: {e}"); traceback.print_exc()
+        return 2
+    finally:
+        if not args.workdir: shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, 'w') as f: json.dump(report, f, indent=2)
+        print(f"Report written to {args.json_out}")
+
+    failures = check_budgets(report, args)
+    if failures:
+        print("\n❌ Budget violations:")
+        for failure in failures: print(f"  - {failure}")
+        return 1
+    print("\n✅ All engines within budget.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
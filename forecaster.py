@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import math
+import sqlite3
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from hotspot_logging import get_logger
+
+log = get_logger("forecast")
+
+# --- Configuration ---
+# Must match model_trainer.py so the dashboard chart maths stays the same
+AGGREGATION_MINUTES = 15
+AGGREGATION_SECONDS = AGGREGATION_MINUTES * 60
+TRAIN_DAYS = 14
+PREDICT_HOURS = 48
+
+SLOTS_PER_DAY = (24 * 60) // AGGREGATION_MINUTES   # 96
+SLOTS_PER_WEEK = SLOTS_PER_DAY * 7                  # 672
+
+# Smoothing factors for the online model
+SEASON_ALPHA = 0.3   # How fast a weekly slot follows new observations
+DAILY_ALPHA = 0.15   # Daily profile, used while a weekly slot has no history yet
+LEVEL_BETA = 0.1     # Multiplicative level correction (tracks slow trends)
+Z_95 = 1.96          # Width of the confidence interval
+MIN_WEEKLY_OBSERVATIONS = 2  # A weekly slot's own variance is used from this many observations on (one gives 0)
+MIN_SPREAD_FRACTION = 0.2    # Standard deviation floor, as a fraction of the expected value
+
+
+def bucket_start(dt):
+    """Floors a datetime to the start of its aggregation bucket."""
+    return dt.replace(minute=(dt.minute // AGGREGATION_MINUTES) * AGGREGATION_MINUTES, second=0, microsecond=0)
+
+
+def slot_of(dt):
+    """Returns (weekly_slot, daily_slot) for a bucket start."""
+    daily_slot = (dt.hour * 60 + dt.minute) // AGGREGATION_MINUTES
+    return dt.weekday() * SLOTS_PER_DAY + daily_slot, daily_slot
+
+
+class ForecastStore:
+    """
+    Immutable, time-indexed forecast. Points are kept in parallel arrays sorted by
+    epoch seconds so window lookups are a bisect, and a sparse table of range
+    maxima answers "peak predicted bytes in (start, end]" in O(1).
+    """
+    def __init__(self, points=()):
+        # points: iterable of (timestamp_str, predicted, lower, upper), ascending
+        self.epochs = array('d')
+        self.predicted = array('d')
+        self.lower = array('d')
+        self.upper = array('d')
+        self.timestamps = []
+        for ts, pred, lower, upper in points:
+            self.epochs.append(datetime.strptime(ts, '%Y-%m-%d %H:%M:%S').timestamp())
+            self.predicted.append(pred); self.lower.append(lower); self.upper.append(upper)
+            self.timestamps.append(ts)
+        # _max_table[k][i] = max(predicted[i : i + 2**k])
+        self._max_table = [self.predicted]
+        width = 1
+        while width * 2 <= len(self.predicted):
+            prev = self._max_table[-1]
+            self._max_table.append(array('d', (max(prev[i], prev[i + width]) for i in range(len(prev) - width))))
+            width *= 2
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def window(self, start_epoch, end_epoch):
+        """Returns the index range (i, j) of points with start < epoch <= end."""
+        return bisect_right(self.epochs, start_epoch), bisect_right(self.epochs, end_epoch)
+
+    def peak(self, start_epoch, end_epoch):
+        """Highest predicted bytes per bucket in (start, end], or None if no points."""
+        i, j = self.window(start_epoch, end_epoch)
+        if i >= j: return None
+        k = (j - i).bit_length() - 1
+        level = self._max_table[k]
+        return max(level[i], level[j - (1 << k)])
+
+    def peak_next(self, minutes, now=None):
+        """Peak predicted bytes per bucket in the next 'minutes' minutes."""
+        start = (now or datetime.now()).timestamp()
+        return self.peak(start, start + minutes * 60)
+
+    def rows(self, start_epoch, end_epoch):
+        """Forecast points in (start, end] as the dicts the dashboard chart expects."""
+        i, j = self.window(start_epoch, end_epoch)
+        return [
+            {"timestamp": self.timestamps[n], "predicted_bytes": self.predicted[n],
+             "predicted_lower": self.lower[n], "predicted_upper": self.upper[n]}
+            for n in range(i, j)
+        ]
+
+    def rows_next(self, hours=24, now=None):
+        start = (now or datetime.now()).timestamp()
+        return self.rows(start, start + hours * 3600)
+
+
+class OnlineForecaster:
+    """
+    Seasonal online model for total hotspot usage per 15-minute bucket.
+
+    Keeps an exponentially smoothed value (and variance) for every slot of the
+    week, a daily profile as a fallback for slots not seen yet, and a level
+    factor that follows trends. Every closed bucket updates the model in O(1).
+    """
+    def __init__(self):
+        self.weekly = [None] * SLOTS_PER_WEEK       # EWMA of bytes per weekly slot
+        self.weekly_var = [0.0] * SLOTS_PER_WEEK    # EW variance per weekly slot
+        self.weekly_count = [0] * SLOTS_PER_WEEK    # Observations per weekly slot
+        self.daily = [None] * SLOTS_PER_DAY         # EWMA of bytes per daily slot
+        self.daily_var = [0.0] * SLOTS_PER_DAY
+        self.level = 1.0
+        self.buckets_seen = 0
+        self.current_bucket = None   # datetime of the bucket being filled
+        self.current_bytes = 0
+
+    def _baseline(self, weekly_slot, daily_slot):
+        """
+        Returns (expected_bytes, variance) before the level correction, or (None, None).
+        A weekly slot seen fewer than MIN_WEEKLY_OBSERVATIONS times borrows the daily
+        slot's variance; the spread never drops below MIN_SPREAD_FRACTION of the value.
+        """
+        if self.weekly[weekly_slot] is not None:
+            expected = self.weekly[weekly_slot]
+            if self.weekly_count[weekly_slot] >= MIN_WEEKLY_OBSERVATIONS: var = self.weekly_var[weekly_slot]
+            else: var = self.daily_var[daily_slot] if self.daily[daily_slot] is not None else 0.0
+        elif self.daily[daily_slot] is not None:
+            expected, var = self.daily[daily_slot], self.daily_var[daily_slot]
+        else:
+            return None, None
+        return expected, max(var, (MIN_SPREAD_FRACTION * expected) ** 2)
+
+    def update(self, bucket_dt, value):
+        """Feeds one completed bucket (total bytes) into the model."""
+        weekly_slot, daily_slot = slot_of(bucket_dt)
+        expected, _ = self._baseline(weekly_slot, daily_slot)
+        if expected is not None and expected > 0:
+            ratio = min(max(value / (expected * self.level), 0.5), 2.0)
+            self.level = min(max((1 - LEVEL_BETA) * self.level + LEVEL_BETA * self.level * ratio, 0.25), 4.0)
+
+        for series, var, slot, alpha in ((self.weekly, self.weekly_var, weekly_slot, SEASON_ALPHA),
+                                          (self.daily, self.daily_var, daily_slot, DAILY_ALPHA)):
+            if series[slot] is None:
+                series[slot] = float(value)
+                var[slot] = 0.0
+            else:
+                diff = value - series[slot]
+                series[slot] += alpha * diff
+                var[slot] = (1 - alpha) * (var[slot] + alpha * diff * diff)
+        self.weekly_count[weekly_slot] += 1
+        self.buckets_seen += 1
+
+    def observe(self, timestamp, nbytes):
+        """
+        Adds live usage (bytes seen at 'timestamp', a datetime) to the current bucket.
+        Returns True when a bucket was closed and the model changed.
+        """
+        bucket = bucket_start(timestamp)
+        if self.current_bucket is None:
+            self.current_bucket = bucket
+        if bucket == self.current_bucket:
+            self.current_bytes += nbytes
+            return False
+        # A new bucket started: close the previous one. Gaps (hotspot OFF) are not
+        # learned as zero traffic, which matches the trainer's HAVING > 0 filter.
+        closed = False
+        if bucket > self.current_bucket and self.current_bytes > 0:
+            self.update(self.current_bucket, self.current_bytes)
+            closed = True
+        self.current_bucket = bucket
+        self.current_bytes = nbytes
+        return closed
+
+    def seed(self, rows, now=None):
+        """Trains the model from historical (timestamp_str, bytes) rows, oldest first."""
+        current = bucket_start(now or datetime.now())
+        for ts, value in rows:
+            try:
+                bucket = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S')
+            except (ValueError, TypeError):
+                continue
+            if bucket >= current:
+                # Still filling: carry it over so live observations add to it
+                self.current_bucket = current
+                self.current_bytes = value or 0
+                continue
+            self.update(bucket, value or 0)
+
+    def build_forecast(self, now=None, hours=PREDICT_HOURS):
+        """
+        Returns a new ForecastStore covering every bucket after 'now'.
+        Empty until the model has seen any data.
+        """
+        if self.buckets_seen == 0:
+            return ForecastStore()
+        now = now or datetime.now()
+        step = timedelta(minutes=AGGREGATION_MINUTES)
+        ts = bucket_start(now) + step
+        points = []
+        for _ in range(int(hours * 60 / AGGREGATION_MINUTES)):
+            weekly_slot, daily_slot = slot_of(ts)
+            expected, var = self._baseline(weekly_slot, daily_slot)
+            if expected is not None:
+                predicted = max(0.0, expected * self.level)
+                spread = Z_95 * math.sqrt(max(var, 0.0)) * self.level
+                points.append((ts.strftime('%Y-%m-%d %H:%M:%S'), predicted, max(0.0, predicted - spread), predicted + spread))
+            ts += step
+        return ForecastStore(points)
+
+
+def load_usage_history(db_file, days=TRAIN_DAYS):
+    """
+    Aggregates the raw 'data_log' into (timeslot, total_rx) rows once, to seed the
+    online model on startup. Same bucketing as model_trainer.aggregate_data().
+    """
+    rows = []
+    conn = None
+    try:
+        conn = sqlite3.connect(db_file)
+        start_str = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        rows = conn.execute(f"""
+            SELECT
+                strftime('%Y-%m-%d %H:', timestamp) ||
+                PRINTF('%02d', (CAST(strftime('%M', timestamp) AS INTEGER) / {AGGREGATION_MINUTES}) * {AGGREGATION_MINUTES}) ||
+                ':00' AS timeslot,
+                SUM(rx_bytes) AS total_rx
+            FROM data_log
+            WHERE timestamp > ?
+            GROUP BY timeslot
+            HAVING total_rx > 0
+            ORDER BY timeslot
+        """, (start_str,)).fetchall()
+        log.info(f"Loaded {len(rows)} usage buckets to seed the forecaster.")
+    except Exception as e:
+        log.exception(f"❌ Error loading usage history: {e}")
+    finally:
+        if conn: conn.close()
+    return rows
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# --- Configuration ---
+LOG_LEVEL = os.environ.get("HOTSPOT_LOG_LEVEL", "INFO").upper()   # DEBUG shows per-operation detail (tc commands, consumer RX)
+LOG_FORMAT = os.environ.get("HOTSPOT_LOG_FORMAT", "text")         # 'text' or 'json' (one object per line)
+LOG_QUEUE_SIZE = 10000       # Records waiting for the writer thread; beyond this they are dropped and counted
+REPEAT_WINDOW = 10.0         # Seconds over which identical messages are rate limited
+REPEAT_LIMIT = 5             # Identical messages let through per window (per logger + message template)
+
+_listener = None
+
+
+def get_logger(subsystem):
+    """Per-subsystem logger ('tc', 'iptables', 'daemon', 'consumer', ...) under the 'hotspot' hierarchy."""
+    return logging.getLogger(f"hotspot.{subsystem}")
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most REPEAT_LIMIT records with the same logger and message template
+    through per REPEAT_WINDOW. When a window with drops ends, its last dropped
+    record goes out with 'repeated=N' (or the next record carries it, if one
+    arrives first), so a burst that never recurs does not disappear silently.
+    """
+    def __init__(self, window=REPEAT_WINDOW, limit=REPEAT_LIMIT):
+        super().__init__()
+        self.window = window
+        self.limit = limit
+        self.seen = {}   # { (logger, template): [window start, passed, suppressed, last suppressed record] }
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if getattr(record, 'rate_limit_summary', False): return True
+        key = (record.name, record.msg if record.args else record.getMessage()[:200])
+        now = time.monotonic()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                if len(self.seen) > 5000: self.seen.clear() # f-string messages are all distinct; don't grow forever
+                suppressed = entry[2] if entry else 0
+                if entry: entry[2] = 0; entry[3] = None # Reported here, the window's timer finds nothing
+                self.seen[key] = [now, 1, 0, None]
+                if suppressed: record.repeated = suppressed
+                return True
+            if entry[1] < self.limit:
+                entry[1] += 1; return True
+            entry[2] += 1; entry[3] = record
+            if entry[2] == 1: # First drop in this window: report the count when it ends
+                timer = threading.Timer(max(0.0, entry[0] + self.window - now), self._summarize, (entry,))
+                timer.daemon = True; timer.start()
+            return False
+
+    def _summarize(self, entry):
+        with self.lock:
+            suppressed, last = entry[2], entry[3]
+            entry[2] = 0; entry[3] = None
+        if not suppressed: return
+        summary = logging.makeLogRecord(last.__dict__)
+        summary.repeated = suppressed; summary.rate_limit_summary = True
+        logging.getLogger(last.name).handle(summary) # Outside self.lock: the summary passes this filter again
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler on a bounded queue: the caller never blocks on I/O, overflow is dropped and counted."""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try: self.queue.put_nowait(record)
+        except queue.Full: self.dropped += 1
+
+    def prepare(self, record):
+        # Format the message here (arguments may change later), but leave the rest to the writer thread
+        record = super().prepare(record)
+        if self.dropped:
+            record.dropped = self.dropped; self.dropped = 0
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """'time LEVEL subsystem message key=value...' or one JSON object per line; extra fields come from extra={'fields': {...}}."""
+    def __init__(self, as_json=False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = dict(getattr(record, 'fields', None) or {})
+        for name in ('repeated', 'dropped'):
+            if getattr(record, name, None): fields[name] = getattr(record, name)
+        subsystem = record.name.partition('.')[2] or record.name
+        if self.as_json:
+            entry = {"ts": round(record.created, 3), "level": record.levelname.lower(), "subsystem": subsystem, "msg": record.getMessage(), **fields}
+            if record.exc_info: entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str, ensure_ascii=False)
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {subsystem:<9} {record.getMessage()}"
+        if fields: line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info: line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """
+    Routes the 'hotspot' loggers through a bounded queue to a writer thread, so
+    log calls on the hot path cost an enqueue, not a write. Safe to call twice.
+    Returns the QueueListener (stop it to flush on exit).
+    """
+    global _listener
+    if _listener is not None: return _listener
+    root = logging.getLogger("hotspot")
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    root.propagate = False
+    output = logging.StreamHandler(stream or sys.stdout) # Launchers watch stdout for the startup lines
+    output.setFormatter(StructuredFormatter(as_json=fmt == "json"))
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter())
+    root.addHandler(handler)
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Flushes queued records (call on exit)."""
+    global _listener
+    if _listener is not None: _listener.stop(); _listener = None
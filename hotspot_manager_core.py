@@ -6,9 +6,35 @@ import sys
 import time
 import os
 import json # NEW: For parsing speedtest-cli output
+import logging
+import ipaddress
 from datetime import datetime, timedelta # QUOTA: Added timedelta
 from threading import Thread, Event, Lock # NEW: Added Lock
-from collections import defaultdict
+from collections import ChainMap, defaultdict
+from metrics import REGISTRY, SUBPROCESS_SECONDS, SUBPROCESS_FAILURES
+from hotspot_logging import get_logger
+from prefix_index import PrefixIndex, collapse_networks
+
+log = get_logger("hotspot")       # Hotspot lifecycle, devices
+tc_log = get_logger("tc")         # Traffic control classes/filters
+fw_log = get_logger("iptables")   # Monitoring and security chains
+quota_log = get_logger("quota")
+speed_log = get_logger("speedtest")
+
+SPEEDTEST_RUNNING = REGISTRY.gauge("hotspot_speedtest_running", "1 while speedtest-cli is running.")
+SPEEDTEST_LAST_SUCCESS = REGISTRY.gauge("hotspot_speedtest_last_success_timestamp_seconds", "Unix time of the last successful speed test.")
+SPEEDTEST_FAILURES = REGISTRY.counter("hotspot_speedtest_failures_total", "Speed tests that failed or returned no bandwidth.")
+AVAILABLE_BANDWIDTH = REGISTRY.gauge("hotspot_available_bandwidth_kbps", "Link capacity used for the root tc classes.", ("direction",))
+
+def run_subprocess(command, **kwargs):
+    """subprocess.run() that records run time and failures per binary (tc, iptables, ip, nmcli, ping...)."""
+    binary = os.path.basename((command.split() or ['sh'])[0] if isinstance(command, str) else command[0])
+    started = time.perf_counter()
+    try: result = subprocess.run(command, **kwargs)
+    except Exception: SUBPROCESS_FAILURES.inc(binary=binary); raise
+    finally: SUBPROCESS_SECONDS.observe(time.perf_counter() - started, binary=binary)
+    if result.returncode != 0: SUBPROCESS_FAILURES.inc(binary=binary)
+    return result
 
 # QUOTA: Helper to parse simple time strings like "1h", "30m", "2d"
 def parse_time_string(time_str):
@@ -87,9 +113,7 @@ class BandwidthTracker:
             stats['total_tx_bytes'] += tx_delta
             
         elif stats['last_rx_bytes'] == 0:
-        
-            stats['total_rx_bytes'] = 0 
-            stats['total_tx_bytes'] = 0 # Start session total from 0
+            # Session totals start at 0 for new (or reset_device) entries; restored ones carry on
             stats['rx_speed'] = 0
             stats['tx_speed'] = 0
             
@@ -130,115 +154,184 @@ class BandwidthTracker:
             stats['last_update'] = time.time()
             # Keep 'first_seen' to track overall connection time
 
+# --- Device group class layout (minors are parsed by tc as hex, like the device classes) ---
+GROUP_CLASS_BASE = 3000        # Inner class per group:  1:3<id> / 2:3<id>
+GROUP_LEAF_BASE = 4000         # Shared leaf per group:  1:4<id> / 2:4<id>
+GROUP_FILTER_PRIO_BASE = 300   # Evaluated after the per-device filters (prio 10-253)
+MAX_GROUPS = 999
+DEVICE_CLASS_MIN, DEVICE_CLASS_MAX = 10, 253   # Per-device class minors (= their filter prio)
+
+# --- Parsers for 'tc ... show' output (warm start adopts the tree a previous run left) ---
+TC_RATE_SCALE = {'': 0.001, 'K': 1, 'M': 1000, 'G': 1000000, 'T': 1000000000}
+
+def parse_tc_rate(text):
+    """'1500Kbit' / '12Mbit' as printed by tc -> kbit/s (int), or None."""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMGT]?)bit', text or '')
+    return round(float(match.group(1)) * TC_RATE_SCALE[match.group(2)]) if match else None
+
+def parse_tc_classes(output):
+    """
+    'tc class show' -> {minor: {'parent': minor or None, 'leaf': bool, 'prio', 'rate', 'ceil'}}
+    for the htb classes. Minors are keyed as printed (read as decimal, like the ids we create);
+    classes we could not have created (hex letters) are skipped.
+    """
+    classes = {}
+    for line in output.splitlines():
+        tokens = line.split()
+        if len(tokens) < 3 or tokens[:2] != ['class', 'htb']: continue
+        minor = tokens[2].partition(':')[2]
+        if not minor.isdigit(): continue
+        info = {'parent': None, 'leaf': False, 'prio': None, 'rate': None, 'ceil': None}
+        for key, value in zip(tokens[3:], tokens[4:]):
+            if key == 'parent': info['parent'] = int(value.partition(':')[2]) if value.partition(':')[2].isdigit() else -1
+            elif key == 'leaf': info['leaf'] = True
+            elif key == 'prio' and value.isdigit(): info['prio'] = int(value)
+            elif key in ('rate', 'ceil'): info[key] = parse_tc_rate(value)
+        classes[int(minor)] = info
+    return classes
+
+def parse_tc_filters(output):
+    """
+    'tc filter show' (u32) -> [{'pref': int, 'flowid': 'M:m', 'matches': [('src'|'dst', 'a.b.c.d/n')]}].
+    Only IPv4 source/destination matches are decoded; other keys show up as ('other', hex).
+    """
+    filters = []; current = None
+    for line in output.splitlines():
+        tokens = line.split()
+        if tokens[:1] == ['filter']:
+            current = None
+            if 'flowid' in tokens and 'pref' in tokens:
+                current = {'pref': int(tokens[tokens.index('pref') + 1]), 'flowid': tokens[tokens.index('flowid') + 1], 'matches': []}
+                filters.append(current)
+        elif tokens[:1] == ['match'] and current is not None:
+            match = re.fullmatch(r'([0-9a-f]{8})/([0-9a-f]{8}) at (\d+)', " ".join(tokens[1:4]))
+            if match and match.group(3) in ('12', '16'):
+                prefix = bin(int(match.group(2), 16)).count('1')
+                network = ipaddress.ip_network((int(match.group(1), 16), prefix), strict=False)
+                current['matches'].append(('src' if match.group(3) == '12' else 'dst', str(network)))
+            else: current['matches'].append(('other', " ".join(tokens[1:4])))
+    return filters
+
 class BandwidthLimiter:
     """Manage per-device bandwidth limits using tc (traffic control)"""
-    def __init__(self, interface):
+    def __init__(self, interface, ifb_device='ifb0'):
         self.interface = interface
         self.limits = {}  # {ip: {'download': kbps, 'upload': kbps, 'priority': prio}}
         self.ip_to_class = {}  # {ip: class_id}
-        self.ifb_device = f'ifb0'  # Use fixed IFB device name
+        self.ifb_device = ifb_device  # One IFB per interface (ifb0 for the hotspot interface)
         self.tc_initialized = False
+        self.total_down_kbps = 100000
+        self.total_up_kbps = 100000
+        # --- Device groups: {group_id: {'subnet', 'members', 'limit', 'created'}} ---
+        # Each group is an inner HTB class (GROUP_CLASS_BASE + id) under the root with
+        # one shared leaf (GROUP_LEAF_BASE + id) for members without their own limit.
+        self.groups = {}
+        self.ip_to_parent = {}  # {ip: parent class minor} for classes living inside a group
 
     def setup_tc_qdisc(self, total_bandwidth_down_kbps=100000, total_bandwidth_up_kbps=100000):
         """Setup tc queueing disciplines for bandwidth control - FIXED"""
-        print(f"🔧 Setting up traffic control on {self.interface}...")
+        tc_log.info(f"🔧 Setting up traffic control on {self.interface}...")
         self.cleanup_tc()
-        print("      Setting up DOWNLOAD (egress) control...")
+        self.total_down_kbps = total_bandwidth_down_kbps; self.total_up_kbps = total_bandwidth_up_kbps
+        tc_log.debug("Setting up DOWNLOAD (egress) control...")
         stdout, stderr, code = self.run_command([
             'tc', 'qdisc', 'add', 'dev', self.interface,
             'root', 'handle', '1:', 'htb', 'default', '9999'
         ])
-        if code != 0: print(f"      ⚠️  Warning: {stderr}")
-        print(f"      Setting default root download rate to {total_bandwidth_down_kbps}kbit (will be updated by speedtest)")
+        if code != 0: tc_log.warning(f"⚠️  Warning: {stderr}")
+        tc_log.debug(f"Setting default root download rate to {total_bandwidth_down_kbps}kbit (will be updated by speedtest)")
         self.run_command(['tc', 'class', 'add', 'dev', self.interface,'parent', '1:', 'classid', '1:1', 'htb','rate', f'{total_bandwidth_down_kbps}kbit', 'burst', '15k'])
         self.run_command(['tc', 'class', 'add', 'dev', self.interface,'parent', '1:1', 'classid', '1:9999', 'htb','rate', '1kbit', 'ceil', f'{total_bandwidth_down_kbps}kbit','burst', '15k', 'prio', '7'])
         self.run_command(['tc', 'qdisc', 'add', 'dev', self.interface,'parent', '1:9999', 'handle', '9999:', 'sfq', 'perturb', '10'])
-        print("      Setting up UPLOAD (ingress) control...")
+        tc_log.debug("Setting up UPLOAD (ingress) control...")
         self.run_command(['modprobe', 'ifb', 'numifbs=1'], check=False)
         self.run_command(['ip', 'link', 'del', self.ifb_device], check=False)
         stdout, stderr, code = self.run_command(['ip', 'link', 'add', self.ifb_device, 'type', 'ifb'])
-        if code != 0: print(f"      ℹ️  IFB device already exists or created")
+        if code != 0: tc_log.debug(f"ℹ️  IFB device already exists or created")
         self.run_command(['ip', 'link', 'set', 'dev', self.ifb_device, 'up'])
         self.run_command(['tc', 'qdisc', 'add', 'dev', self.interface,'handle', 'ffff:', 'ingress'], check=False)
         self.run_command(['tc', 'filter', 'add', 'dev', self.interface,'parent', 'ffff:', 'protocol', 'all', 'u32','match', 'u32', '0', '0','action', 'mirred', 'egress', 'redirect', 'dev', self.ifb_device])
         self.run_command(['tc', 'qdisc', 'add', 'dev', self.ifb_device,'root', 'handle', '2:', 'htb', 'default', '9999'])
-        print(f"      Setting default root upload rate to {total_bandwidth_up_kbps}kbit (will be updated by speedtest)")
+        tc_log.debug(f"Setting default root upload rate to {total_bandwidth_up_kbps}kbit (will be updated by speedtest)")
         self.run_command(['tc', 'class', 'add', 'dev', self.ifb_device,'parent', '2:', 'classid', '2:1', 'htb','rate', f'{total_bandwidth_up_kbps}kbit', 'burst', '15k'])
         self.run_command(['tc', 'class', 'add', 'dev', self.ifb_device,'parent', '2:1', 'classid', '2:9999', 'htb','rate', '1kbit', 'ceil', f'{total_bandwidth_up_kbps}kbit','burst', '15k', 'prio', '7'])
         self.run_command(['tc', 'qdisc', 'add', 'dev', self.ifb_device,'parent', '2:9999', 'handle', '9999:', 'sfq', 'perturb', '10'])
         self.tc_initialized = True
-        print(f"✅ Traffic control initialized successfully (IFB: {self.ifb_device})")
+        tc_log.info(f"✅ Traffic control initialized successfully (IFB: {self.ifb_device})")
 
         self.verify_tc_setup()
 
     def verify_tc_setup(self):
         """Verify that TC is set up correctly"""
-        print("      🔍 Verifying TC setup...")
+        tc_log.debug("🔍 Verifying TC setup...")
         stdout, _, code = self.run_command(['tc', 'qdisc', 'show', 'dev', self.interface])
-        if 'htb' in stdout: print(f"      ✓ Egress (download) HTB qdisc on {self.interface}: OK")
-        else: print(f"      ✗ Egress (download) HTB qdisc on {self.interface}: FAILED"); return False
+        if 'htb' in stdout: tc_log.debug(f"✓ Egress (download) HTB qdisc on {self.interface}: OK")
+        else: tc_log.debug(f"✗ Egress (download) HTB qdisc on {self.interface}: FAILED"); return False
         stdout, _, code = self.run_command(['ip', 'link', 'show', self.ifb_device])
-        if 'UP' in stdout: print("      ✓ IFB device status: UP")
-        else: print("      ✗ IFB device status: DOWN"); return False
+        if 'UP' in stdout: tc_log.debug("✓ IFB device status: UP")
+        else: tc_log.debug("✗ IFB device status: DOWN"); return False
         stdout, _, code = self.run_command(['tc', 'filter', 'show', 'dev', self.interface, 'parent', 'ffff:'])
-        if 'mirred' in stdout and self.ifb_device in stdout: print("      ✓ Ingress redirection: OK")
-        else: print("      ✗ Ingress redirection: FAILED"); return False
+        if 'mirred' in stdout and self.ifb_device in stdout: tc_log.debug("✓ Ingress redirection: OK")
+        else: tc_log.debug("✗ Ingress redirection: FAILED"); return False
         stdout, _, code = self.run_command(['tc', 'qdisc', 'show', 'dev', self.ifb_device])
-        if 'htb' in stdout: print(f"      ✓ IFB (upload) HTB qdisc on {self.ifb_device}: OK")
-        else: print(f"      ✗ IFB (upload) HTB qdisc on {self.ifb_device}: FAILED"); return False
+        if 'htb' in stdout: tc_log.debug(f"✓ IFB (upload) HTB qdisc on {self.ifb_device}: OK")
+        else: tc_log.debug(f"✗ IFB (upload) HTB qdisc on {self.ifb_device}: FAILED"); return False
         return True
 
     def add_device_limit(self, ip, download_kbps, upload_kbps, priority=5):
         """Add bandwidth limit for a specific device - UNIQUE FILTER PRIO"""
         if not self.tc_initialized:
-            print("⚠️  Traffic control not initialized. Initializing now...")
+            tc_log.warning("⚠️  Traffic control not initialized. Initializing now...")
             self.setup_tc_qdisc()
         self.remove_device_limit(ip)
-        ip_parts = ip.split('.')
-        class_id = int(ip_parts[-1])
-        if class_id < 10: class_id = 10 + class_id
-        if class_id > 253: class_id = 253
-        
-        # --- MODIFIED: Check against self.ip_to_class, not self.limits ---
-        while class_id in self.ip_to_class.values():
-        # --- End of MODIFIED ---
-            class_id += 1
-            if class_id > 253: class_id = 10
+        free = self.free_class_ids()
+        if not free:
+            tc_log.error(f"❌ No free device class on {self.interface} for {ip} ({len(self.ip_to_class)} in use)"); return False
+        # Prefer the last octet (stable ids across restarts), else the next free minor after it
+        octet = int(ip.split('.')[-1]) if '.' in ip else 0
+        preferred = min(octet + DEVICE_CLASS_MIN if octet < DEVICE_CLASS_MIN else octet, DEVICE_CLASS_MAX)
+        class_id = min(free, key=lambda minor: (minor - preferred) % (DEVICE_CLASS_MAX + 1))
         self.ip_to_class[ip] = class_id
+        parent_minor = self.device_parent(ip)
+        if parent_minor != 1: self.ip_to_parent[ip] = parent_minor
         class_prio = priority
         filter_prio = class_id
-        print(f"      🔧 Adding/Updating limit for {ip} (class {class_id}): ↓ {download_kbps} Kbps | ↑ {upload_kbps} Kbps | ClassPrio: {class_prio}")
+        tc_log.debug(f"🔧 Adding/Updating limit for {ip} (class {class_id}): ↓ {download_kbps} Kbps | ↑ {upload_kbps} Kbps | ClassPrio: {class_prio}")
         download_burst_kb = 15
-        cmd_add_dl = ['tc', 'class', 'add', 'dev', self.interface,'parent', '1:1', 'classid', f'1:{class_id}', 'htb','rate', f'{download_kbps}kbit','ceil', f'{download_kbps}kbit','burst', f'{download_burst_kb}k','cburst', f'{download_burst_kb}k','prio', str(class_prio)]
+        cmd_add_dl = ['tc', 'class', 'add', 'dev', self.interface,'parent', f'1:{parent_minor}', 'classid', f'1:{class_id}', 'htb','rate', f'{download_kbps}kbit','ceil', f'{download_kbps}kbit','burst', f'{download_burst_kb}k','cburst', f'{download_burst_kb}k','prio', str(class_prio)]
         stdout, stderr, code = self.run_command(cmd_add_dl)
         if code == 2 and ("File exists" in stderr or "RTNETLINK" in stderr):
-            print(f"      ℹ️  Class 1:{class_id} exists. Changing...")
-            cmd_change_dl = ['tc', 'class', 'change', 'dev', self.interface,'parent', '1:1', 'classid', f'1:{class_id}', 'htb','rate', f'{download_kbps}kbit','ceil', f'{download_kbps}kbit','burst', f'{download_burst_kb}k','cburst', f'{download_burst_kb}k','prio', str(class_prio)]
+            tc_log.debug(f"ℹ️  Class 1:{class_id} exists. Changing...")
+            cmd_change_dl = ['tc', 'class', 'change', 'dev', self.interface,'parent', f'1:{parent_minor}', 'classid', f'1:{class_id}', 'htb','rate', f'{download_kbps}kbit','ceil', f'{download_kbps}kbit','burst', f'{download_burst_kb}k','cburst', f'{download_burst_kb}k','prio', str(class_prio)]
             stdout, stderr, code = self.run_command(cmd_change_dl)
-        if code != 0: print(f"      ❌ Failed to add/change download class: {stderr}"); return False
+        if code != 0: tc_log.error(f"❌ Failed to add/change download class: {stderr}"); return False
         self.run_command(['tc', 'qdisc', 'del', 'dev', self.interface, 'parent', f'1:{class_id}'], check=False)
         self.run_command(['tc', 'qdisc', 'add', 'dev', self.interface,'parent', f'1:{class_id}', 'handle', f'{class_id}:', 'sfq', 'perturb', '10'])
         stdout, stderr, code = self.run_command(['tc', 'filter', 'add', 'dev', self.interface,'protocol', 'ip', 'parent', '1:','prio', str(filter_prio), 'u32','match', 'ip', 'dst', f'{ip}/32','flowid', f'1:{class_id}'])
-        if code != 0: print(f"      ❌ Failed to add download filter: {stderr}")
+        if code != 0: tc_log.error(f"❌ Failed to add download filter: {stderr}")
         upload_burst_kb = 15
-        cmd_add_ul = ['tc', 'class', 'add', 'dev', self.ifb_device,'parent', '2:1', 'classid', f'2:{class_id}', 'htb','rate', f'{upload_kbps}kbit','ceil', f'{upload_kbps}kbit','burst', f'{upload_burst_kb}k','cburst', f'{upload_burst_kb}k','prio', str(class_prio)]
+        cmd_add_ul = ['tc', 'class', 'add', 'dev', self.ifb_device,'parent', f'2:{parent_minor}', 'classid', f'2:{class_id}', 'htb','rate', f'{upload_kbps}kbit','ceil', f'{upload_kbps}kbit','burst', f'{upload_burst_kb}k','cburst', f'{upload_burst_kb}k','prio', str(class_prio)]
         stdout, stderr, code = self.run_command(cmd_add_ul)
         if code == 2 and ("File exists" in stderr or "RTNETLINK" in stderr):
-            print(f"      ℹ️  Class 2:{class_id} exists. Changing...")
-            cmd_change_ul = ['tc', 'class', 'change', 'dev', self.ifb_device,'parent', '2:1', 'classid', f'2:{class_id}', 'htb','rate', f'{upload_kbps}kbit','ceil', f'{upload_kbps}kbit','burst', f'{upload_burst_kb}k','cburst', f'{upload_burst_kb}k','prio', str(class_prio)]
+            tc_log.debug(f"ℹ️  Class 2:{class_id} exists. Changing...")
+            cmd_change_ul = ['tc', 'class', 'change', 'dev', self.ifb_device,'parent', f'2:{parent_minor}', 'classid', f'2:{class_id}', 'htb','rate', f'{upload_kbps}kbit','ceil', f'{upload_kbps}kbit','burst', f'{upload_burst_kb}k','cburst', f'{upload_burst_kb}k','prio', str(class_prio)]
             stdout, stderr, code = self.run_command(cmd_change_ul)
-        if code != 0: print(f"      ❌ Failed to add/change upload class: {stderr}"); return False
+        if code != 0: tc_log.error(f"❌ Failed to add/change upload class: {stderr}"); return False
         self.run_command(['tc', 'qdisc', 'del', 'dev', self.ifb_device, 'parent', f'2:{class_id}'], check=False)
         self.run_command(['tc', 'qdisc', 'add', 'dev', self.ifb_device,'parent', f'2:{class_id}', 'handle', f'{class_id + 1000}:', 'sfq', 'perturb', '10'])
         stdout, stderr, code = self.run_command(['tc', 'filter', 'add', 'dev', self.ifb_device,'protocol', 'ip', 'parent', '2:','prio', str(filter_prio), 'u32','match', 'ip', 'src', f'{ip}/32','flowid', f'2:{class_id}'])
-        if code != 0: print(f"      ❌ Failed to add upload filter: {stderr}")
+        if code != 0: tc_log.error(f"❌ Failed to add upload filter: {stderr}")
         
         # --- MODIFIED: Update the 'current state' limits dict ---
         self.limits[ip] = {'download': download_kbps,'upload': upload_kbps,'class_id': class_id,'priority': class_prio}
         # --- End of MODIFIED ---
         
-        if self.verify_device_limit(ip, class_id): print(f"      ✅ Limit successfully applied for {ip}"); return True
-        else: print(f"      ⚠️  Limit applied for {ip}, but filter verification failed (check tc filter show)"); return True
+        if self.verify_device_limit(ip, class_id): tc_log.info(f"✅ Limit successfully applied for {ip}"); return True
+        else: tc_log.warning(f"⚠️  Limit applied for {ip}, but filter verification failed (check tc filter show)"); return True
+
+    def free_class_ids(self):
+        """Device class minors not in use on this interface (DEVICE_CLASS_MIN..DEVICE_CLASS_MAX)."""
+        return set(range(DEVICE_CLASS_MIN, DEVICE_CLASS_MAX + 1)).difference(self.ip_to_class.values())
 
     def verify_device_limit(self, ip, class_id):
         """Verify that the limit is actually applied - BLOCK BASED CHECK"""
@@ -262,15 +355,11 @@ class BandwidthLimiter:
                 if re.search(fr'pref {filter_prio}\b', block) and re.search(fr'flowid 2:{class_id}\b', block):
                     results['upload_filter'] = True; break
         if not all(results.values()):
-            print(f"      📋 Verification details for {ip} (class {class_id}):")
-            print(f"                                      Download class (1:{class_id} on {self.interface}): {'✓' if results['download_class'] else '✗'}")
-            print(f"                                      Upload class (2:{class_id} on {self.ifb_device}): {'✓' if results['upload_class'] else '✗'}")
-            print(f"                                      Download filter (prio {filter_prio} -> 1:{class_id}): {'✓' if results['download_filter'] else '✗'}")
-            print(f"                                      Upload filter (prio {filter_prio} -> 2:{class_id}): {'✓' if results['upload_filter'] else '✗'}")
-            if not results['download_filter']: print(f"                                      Output for 'tc filter show dev {self.interface} parent 1:':\n---\n{stdout_dl_filter}\n---");
-            if stderr_dl_filter: print(f"                                      Stderr: {stderr_dl_filter}")
-            if not results['upload_filter']: print(f"                                      Output for 'tc filter show dev {self.ifb_device} parent 2:':\n---\n{stdout_ul_filter}\n---");
-            if stderr_ul_filter: print(f"                                      Stderr: {stderr_ul_filter}")
+            # One line with the results; the (large) tc filter dumps only when debugging
+            tc_log.warning("📋 Limit verification failed for %s (class %s)", ip, class_id, extra={"fields": results})
+            if tc_log.isEnabledFor(logging.DEBUG):
+                if not results['download_filter']: tc_log.debug("tc filter show dev %s parent 1:\n%s%s", self.interface, stdout_dl_filter, f"\nstderr: {stderr_dl_filter}" if stderr_dl_filter else "")
+                if not results['upload_filter']: tc_log.debug("tc filter show dev %s parent 2:\n%s%s", self.ifb_device, stdout_ul_filter, f"\nstderr: {stderr_ul_filter}" if stderr_ul_filter else "")
         return all(results.values())
 
     def remove_device_limit(self, ip):
@@ -282,10 +371,10 @@ class BandwidthLimiter:
         if ip in self.ip_to_class:
             class_id = self.ip_to_class[ip]
             filter_prio = class_id # Filter prio IS the class_id
-            print(f"      🗑️  Removing limit for {ip} (class {class_id}, filter prio {filter_prio})")
+            tc_log.debug(f"🗑️  Removing limit for {ip} (class {class_id}, filter prio {filter_prio})")
         # --- End of MODIFIED ---
         else:
-             print(f"      ℹ️  No limit found for {ip} in internal state. Attempting removal of potential stale filters...")
+             tc_log.debug(f"ℹ️  No limit found for {ip} in internal state. Attempting removal of potential stale filters...")
 
         # Attempt filter removal regardless of internal state, using prio if known, otherwise by IP match
         if filter_prio:
@@ -297,22 +386,140 @@ class BandwidthLimiter:
 
         # Clean up the class and qdisc only if we knew the class_id
         if class_id:
-            print(f"      ... and removing class {class_id}")
+            tc_log.debug(f"... and removing class {class_id}")
+            parent_minor = self.ip_to_parent.get(ip, 1)
             self.run_command(['tc', 'qdisc', 'del', 'dev', self.interface, 'parent', f'1:{class_id}'], check=False)
-            self.run_command(['tc', 'class', 'del', 'dev', self.interface, 'parent', '1:1', 'classid', f'1:{class_id}'], check=False)
+            self.run_command(['tc', 'class', 'del', 'dev', self.interface, 'parent', f'1:{parent_minor}', 'classid', f'1:{class_id}'], check=False)
             self.run_command(['tc', 'qdisc', 'del', 'dev', self.ifb_device, 'parent', f'2:{class_id}'], check=False)
-            self.run_command(['tc', 'class', 'del', 'dev', self.ifb_device, 'parent', '2:1', 'classid', f'2:{class_id}'], check=False)
+            self.run_command(['tc', 'class', 'del', 'dev', self.ifb_device, 'parent', f'2:{parent_minor}', 'classid', f'2:{class_id}'], check=False)
 
         # Clean up internal state
         if ip in self.limits: del self.limits[ip]
         if ip in self.ip_to_class: del self.ip_to_class[ip]
+        self.ip_to_parent.pop(ip, None)
+
+        tc_log.info(f"✅ Limit removal commands executed for {ip}")
+        return True
 
-        print(f"      ✅ Limit removal commands executed for {ip}")
+    def change_device_limit(self, ip, download_kbps, upload_kbps, priority=5):
+        """Changes the rates of an existing device class in place (no filter/qdisc churn); adds it if missing."""
+        class_id = self.ip_to_class.get(ip)
+        if class_id is None or self.ip_to_parent.get(ip, 1) != self.device_parent(ip):
+            return self.add_device_limit(ip, download_kbps, upload_kbps, priority) # New, or moved in/out of a group
+        burst_kb = 15
+        parent_minor = self.ip_to_parent.get(ip, 1)
+        for dev, major, rate in ((self.interface, 1, download_kbps), (self.ifb_device, 2, upload_kbps)):
+            stdout, stderr, code = self.run_command(['tc', 'class', 'change', 'dev', dev,'parent', f'{major}:{parent_minor}', 'classid', f'{major}:{class_id}', 'htb','rate', f'{rate}kbit','ceil', f'{rate}kbit','burst', f'{burst_kb}k','cburst', f'{burst_kb}k','prio', str(priority)])
+            if code != 0:
+                tc_log.warning(f"⚠️  In-place change failed for {ip} ({stderr.strip()}). Re-adding class...")
+                return self.add_device_limit(ip, download_kbps, upload_kbps, priority)
+        self.limits[ip] = {'download': download_kbps,'upload': upload_kbps,'class_id': class_id,'priority': priority}
+        return True
+
+    # --- Device Groups (hierarchical shaping) ---
+    def device_parent(self, ip):
+        """Parent class minor for a device's own class: its group's inner class, or the root 1."""
+        for group_id, group in self.groups.items():
+            if group['created'] and ip in group['members']: return GROUP_CLASS_BASE + group_id
+        return 1
+
+    def _group_rates(self, group):
+        limit = group.get('limit')
+        if limit: return limit['download'], limit['upload'], limit.get('priority', 5)
+        return int(self.total_down_kbps), int(self.total_up_kbps), 5 # Uncapped: just a borrowing pool
+
+    def ensure_group(self, group_id, subnet=None):
+        """Creates the group's inner class, shared leaf and (for subnet groups) its single filter."""
+        group = self.groups.setdefault(group_id, {'subnet': subnet, 'members': set(), 'limit': None, 'created': False, 'member_filters': set()})
+        if group['created'] and group['subnet'] == subnet: return True
+        if group['created']: self.remove_group(group_id, forget=False)
+        group['subnet'] = subnet
+        if not self.tc_initialized: return False
+        inner = GROUP_CLASS_BASE + group_id; leaf = GROUP_LEAF_BASE + group_id; prio = GROUP_FILTER_PRIO_BASE + group_id
+        dl, ul, class_prio = self._group_rates(group)
+        tc_log.debug(f"🔧 Creating group {group_id} (class {inner}, shared leaf {leaf}){f' for {subnet}' if subnet else ''}: ↓ {dl} Kbps | ↑ {ul} Kbps")
+        for dev, major, rate, total, match_dir, qdisc_handle in ((self.interface, 1, dl, self.total_down_kbps, 'dst', f'{leaf}:'),
+                                                                 (self.ifb_device, 2, ul, self.total_up_kbps, 'src', f'{leaf + 1000}:')):
+            stdout, stderr, code = self.run_command(['tc', 'class', 'add', 'dev', dev, 'parent', f'{major}:1', 'classid', f'{major}:{inner}', 'htb', 'rate', f'{rate}kbit', 'ceil', f'{rate}kbit', 'burst', '15k', 'prio', str(class_prio)])
+            if code != 0: tc_log.error(f"❌ Failed to add group class {major}:{inner}: {stderr}"); return False
+            self.run_command(['tc', 'class', 'add', 'dev', dev, 'parent', f'{major}:{inner}', 'classid', f'{major}:{leaf}', 'htb', 'rate', '1kbit', 'ceil', f'{int(total)}kbit', 'burst', '15k', 'prio', '7'])
+            self.run_command(['tc', 'qdisc', 'add', 'dev', dev, 'parent', f'{major}:{leaf}', 'handle', qdisc_handle, 'sfq', 'perturb', '10'])
+            if subnet:
+                self.run_command(['tc', 'filter', 'add', 'dev', dev, 'protocol', 'ip', 'parent', f'{major}:', 'prio', str(prio), 'u32', 'match', 'ip', match_dir, subnet, 'flowid', f'{major}:{leaf}'])
+        group['created'] = True
+        group['member_filters'] = set()
         return True
 
+    def set_group_members(self, group_id, ips):
+        """
+        Updates group membership. Subnet groups already match in one filter; other
+        groups get one filter per member (rebuilt only when membership changes).
+        Members that have their own class are moved under the group's class.
+        """
+        group = self.groups.get(group_id)
+        if not group or not group['created']: return
+        ips = set(ips)
+        moved = (group['members'] ^ ips) & set(self.ip_to_class)
+        group['members'] = ips
+        if not group['subnet'] and group['member_filters'] != ips:
+            leaf = GROUP_LEAF_BASE + group_id; prio = GROUP_FILTER_PRIO_BASE + group_id
+            for dev, major in ((self.interface, 1), (self.ifb_device, 2)):
+                self.run_command(['tc', 'filter', 'del', 'dev', dev, 'parent', f'{major}:', 'prio', str(prio), 'protocol', 'ip', 'u32'], check=False)
+            for ip in sorted(ips):
+                self.run_command(['tc', 'filter', 'add', 'dev', self.interface, 'protocol', 'ip', 'parent', '1:', 'prio', str(prio), 'u32', 'match', 'ip', 'dst', f'{ip}/32', 'flowid', f'1:{leaf}'])
+                self.run_command(['tc', 'filter', 'add', 'dev', self.ifb_device, 'protocol', 'ip', 'parent', '2:', 'prio', str(prio), 'u32', 'match', 'ip', 'src', f'{ip}/32', 'flowid', f'2:{leaf}'])
+            group['member_filters'] = set(ips)
+        for ip in moved:
+            limit = self.limits.get(ip)
+            if limit: self.add_device_limit(ip, limit['download'], limit['upload'], limit.get('priority', 5)) # Re-parent
+
+    def set_group_limit(self, group_id, limit):
+        """Sets (or clears, with None) a group's cap. One 'tc class change' per direction."""
+        group = self.groups.setdefault(group_id, {'subnet': None, 'members': set(), 'limit': None, 'created': False, 'member_filters': set()})
+        group['limit'] = limit
+        if not group['created']: return True # Applied when the group is created
+        inner = GROUP_CLASS_BASE + group_id
+        dl, ul, class_prio = self._group_rates(group)
+        tc_log.debug(f"🔧 Group {group_id} cap: ↓ {dl} Kbps | ↑ {ul} Kbps")
+        ok = True
+        for dev, major, rate in ((self.interface, 1, dl), (self.ifb_device, 2, ul)):
+            _, stderr, code = self.run_command(['tc', 'class', 'change', 'dev', dev, 'parent', f'{major}:1', 'classid', f'{major}:{inner}', 'htb', 'rate', f'{rate}kbit', 'ceil', f'{rate}kbit', 'burst', '15k', 'prio', str(class_prio)])
+            if code != 0: tc_log.error(f"❌ Failed to change group class {major}:{inner}: {stderr}"); ok = False
+        return ok
+
+    def remove_group(self, group_id, forget=True):
+        """Deletes a group's filters and classes; members with their own class move back under the root."""
+        group = self.groups.get(group_id)
+        if not group: return True
+        members = set(group['members'])
+        if group['created']:
+            inner = GROUP_CLASS_BASE + group_id; leaf = GROUP_LEAF_BASE + group_id; prio = GROUP_FILTER_PRIO_BASE + group_id
+            tc_log.debug(f"🗑️  Removing group {group_id} (class {inner})")
+            group['created'] = False # Members re-parent to the root from here on
+            for ip in members & set(self.ip_to_class):
+                limit = self.limits.get(ip)
+                if limit: self.add_device_limit(ip, limit['download'], limit['upload'], limit.get('priority', 5))
+            for dev, major in ((self.interface, 1), (self.ifb_device, 2)):
+                self.run_command(['tc', 'filter', 'del', 'dev', dev, 'parent', f'{major}:', 'prio', str(prio), 'protocol', 'ip', 'u32'], check=False)
+                self.run_command(['tc', 'qdisc', 'del', 'dev', dev, 'parent', f'{major}:{leaf}'], check=False)
+                self.run_command(['tc', 'class', 'del', 'dev', dev, 'parent', f'{major}:{inner}', 'classid', f'{major}:{leaf}'], check=False)
+                self.run_command(['tc', 'class', 'del', 'dev', dev, 'parent', f'{major}:1', 'classid', f'{major}:{inner}'], check=False)
+        if forget: self.groups.pop(group_id, None)
+        else: group['members'] = set(); group['member_filters'] = set()
+        return True
+
+    def set_root_rate(self, download_kbps, upload_kbps):
+        """Changes the root classes' rates (the link capacity from the speed test)."""
+        self.run_command(['tc', 'class', 'change', 'dev', self.interface,'parent', '1:', 'classid', '1:1', 'htb','rate', f'{download_kbps}kbit', 'burst', '15k'])
+        self.run_command(['tc', 'class', 'change', 'dev', self.ifb_device,'parent', '2:', 'classid', '2:1', 'htb','rate', f'{upload_kbps}kbit', 'burst', '15k'])
+
+    def get_group_limit(self, group_id):
+        group = self.groups.get(group_id)
+        return group['limit'] if group else None
+
     def update_device_limit(self, ip, download_kbps, upload_kbps, priority=5):
         """Update bandwidth limit for a device - Uses robust add_device_limit"""
-        print(f"      🔄  Updating limit for {ip}...")
+        tc_log.debug(f"🔄  Updating limit for {ip}...")
         return self.add_device_limit(ip, download_kbps, upload_kbps, priority)
 
     def get_device_limit(self, ip):
@@ -327,7 +534,7 @@ class BandwidthLimiter:
 
     def cleanup_tc(self):
         """Remove all tc rules - IMPROVED"""
-        print("🧹 Cleaning up traffic control...")
+        tc_log.info("🧹 Cleaning up traffic control...")
         self.run_command(['tc', 'qdisc', 'del', 'dev', self.interface, 'root'], check=False)
         self.run_command(['tc', 'qdisc', 'del', 'dev', self.interface, 'ingress'], check=False)
         self.run_command(['tc', 'qdisc', 'del', 'dev', self.ifb_device, 'root'], check=False)
@@ -337,13 +544,101 @@ class BandwidthLimiter:
         self.tc_initialized = False
         self.limits = {}
         self.ip_to_class = {}
-        print("✅ Traffic control cleaned up")
+        self.ip_to_parent = {}
+        for group in self.groups.values(): group['created'] = False; group['member_filters'] = set()
+        tc_log.info("✅ Traffic control cleaned up")
+
+    def adopt_tc_state(self):
+        """
+        Warm start: rebuilds limits / ip_to_class / groups from the tc tree a
+        previous run left behind instead of tearing it down, so shaping and the
+        class counters keep running. Complete device and group classes are
+        adopted as they are (the next PolicyEngine.sync(full=True) retunes the
+        ones whose rates differ); half-built leftovers are deleted. Returns False
+        (nothing changed) if the base tree is missing: use setup_tc_qdisc() then.
+        """
+        tc_log.info(f"♻️ Adopting existing traffic control on {self.interface}...")
+        if not self.verify_tc_setup(): tc_log.info("ℹ️  No usable tc tree to adopt."); return False
+        devs = {1: self.interface, 2: self.ifb_device}
+        classes = {major: parse_tc_classes(self.run_command(['tc', 'class', 'show', 'dev', dev], check=False)[0]) for major, dev in devs.items()}
+        if any(1 not in classes[major] or 9999 not in classes[major] for major in devs): tc_log.info("ℹ️  Root/default classes missing, not adopting."); return False
+        filters = {major: {} for major in devs} # {major: {pref: [filter]}}
+        for major, dev in devs.items():
+            for entry in parse_tc_filters(self.run_command(['tc', 'filter', 'show', 'dev', dev, 'parent', f'{major}:'], check=False)[0]):
+                filters[major].setdefault(entry['pref'], []).append(entry)
+        direction = {1: 'dst', 2: 'src'}
+
+        def filter_networks(major, pref, flow_minor):
+            """Networks the filters at 'pref' send to major:flow_minor, or None if anything else is there."""
+            networks = set()
+            for entry in filters[major].get(pref, []):
+                if entry['flowid'] != f'{major}:{flow_minor}' or len(entry['matches']) != 1 or entry['matches'][0][0] != direction[major]: return None
+                networks.add(entry['matches'][0][1])
+            return networks
+
+        self.limits = {}; self.ip_to_class = {}; self.ip_to_parent = {}; self.groups = {}
+        self.total_down_kbps = classes[1][1]['rate'] or self.total_down_kbps; self.total_up_kbps = classes[2][1]['rate'] or self.total_up_kbps
+
+        # --- Groups: inner class under the root, shared leaf under it, filters at their prio ---
+        stale_groups = []
+        for inner in sorted({m for major in devs for m in classes[major] if GROUP_CLASS_BASE < m <= GROUP_CLASS_BASE + MAX_GROUPS}):
+            group_id = inner - GROUP_CLASS_BASE; leaf = GROUP_LEAF_BASE + group_id; prio = GROUP_FILTER_PRIO_BASE + group_id
+            complete = all(classes[m].get(inner) and classes[m][inner]['parent'] == 1 and classes[m].get(leaf) and classes[m][leaf]['parent'] == inner for m in devs)
+            dl_nets = filter_networks(1, prio, leaf); ul_nets = filter_networks(2, prio, leaf)
+            if not complete or dl_nets is None or dl_nets != ul_nets: stale_groups.append(group_id); continue
+            subnet = next(iter(dl_nets)) if len(dl_nets) == 1 and not next(iter(dl_nets)).endswith('/32') else None
+            member_ips = set() if subnet else {n[:-3] for n in dl_nets}
+            if not subnet and any(not n.endswith('/32') for n in dl_nets): stale_groups.append(group_id); continue
+            dl, ul = classes[1][inner], classes[2][inner]
+            limit = None
+            if (dl['rate'], ul['rate']) != (int(self.total_down_kbps), int(self.total_up_kbps)):
+                # Inner classes don't report their prio: the next sync re-sends it with one in-place change
+                limit = {'download': dl['rate'], 'upload': ul['rate'], 'priority': None}
+            self.groups[group_id] = {'subnet': subnet, 'members': set(member_ips), 'limit': limit, 'created': True, 'member_filters': member_ips}
+            for dev, major, handle in ((self.interface, 1, leaf), (self.ifb_device, 2, leaf + 1000)):
+                if not classes[major][leaf]['leaf']: self.run_command(['tc', 'qdisc', 'add', 'dev', dev, 'parent', f'{major}:{leaf}', 'handle', f'{handle}:', 'sfq', 'perturb', '10'], check=False)
+
+        # --- Devices: class M:<id> with a matching /32 filter at prio <id> on both devices ---
+        adopted_parents = {1} | {GROUP_CLASS_BASE + group_id for group_id in self.groups}
+        device_ids = {m for major in devs for m in list(classes[major]) + list(filters[major]) if DEVICE_CLASS_MIN <= m <= DEVICE_CLASS_MAX}
+        stale_devices = 0
+        for class_id in sorted(device_ids):
+            dl, ul = classes[1].get(class_id), classes[2].get(class_id)
+            dl_nets = filter_networks(1, class_id, class_id); ul_nets = filter_networks(2, class_id, class_id)
+            ip = next(iter(dl_nets))[:-3] if dl_nets and len(dl_nets) == 1 and next(iter(dl_nets)).endswith('/32') else None
+            if not (ip and dl and ul and dl_nets == ul_nets and dl['parent'] == ul['parent'] and dl['parent'] in adopted_parents and ip not in self.ip_to_class):
+                stale_devices += 1
+                for major, dev in devs.items():
+                    parent = (classes[major].get(class_id) or {}).get('parent') or 1
+                    self.run_command(['tc', 'filter', 'del', 'dev', dev, 'parent', f'{major}:', 'prio', str(class_id), 'protocol', 'ip', 'u32'], check=False)
+                    self.run_command(['tc', 'qdisc', 'del', 'dev', dev, 'parent', f'{major}:{class_id}'], check=False)
+                    self.run_command(['tc', 'class', 'del', 'dev', dev, 'parent', f'{major}:{parent}', 'classid', f'{major}:{class_id}'], check=False)
+                continue
+            self.ip_to_class[ip] = class_id
+            if dl['parent'] != 1:
+                self.ip_to_parent[ip] = dl['parent']; self.groups[dl['parent'] - GROUP_CLASS_BASE]['members'].add(ip)
+            # A ceil other than the rate was not set by us: leave the rate unknown so the next sync rewrites it
+            self.limits[ip] = {'download': dl['rate'] if dl['ceil'] == dl['rate'] else None, 'upload': ul['rate'] if ul['ceil'] == ul['rate'] else None, 'class_id': class_id, 'priority': dl['prio']}
+            for dev, major, handle in ((self.interface, 1, class_id), (self.ifb_device, 2, class_id + 1000)):
+                if not classes[major][class_id]['leaf']: self.run_command(['tc', 'qdisc', 'add', 'dev', dev, 'parent', f'{major}:{class_id}', 'handle', f'{handle}:', 'sfq', 'perturb', '10'], check=False)
+
+        # Stale groups last: their inner class can only go once the device classes under it are gone
+        for group_id in stale_groups:
+            inner = GROUP_CLASS_BASE + group_id; leaf = GROUP_LEAF_BASE + group_id; prio = GROUP_FILTER_PRIO_BASE + group_id
+            for major, dev in devs.items():
+                self.run_command(['tc', 'filter', 'del', 'dev', dev, 'parent', f'{major}:', 'prio', str(prio), 'protocol', 'ip', 'u32'], check=False)
+                self.run_command(['tc', 'qdisc', 'del', 'dev', dev, 'parent', f'{major}:{leaf}'], check=False)
+                self.run_command(['tc', 'class', 'del', 'dev', dev, 'parent', f'{major}:{inner}', 'classid', f'{major}:{leaf}'], check=False)
+                self.run_command(['tc', 'class', 'del', 'dev', dev, 'parent', f'{major}:1', 'classid', f'{major}:{inner}'], check=False)
+        self.tc_initialized = True
+        tc_log.info(f"✅ Adopted {len(self.limits)} device class(es) and {len(self.groups)} group(s); removed {stale_devices} stale device and {len(stale_groups)} stale group class(es)")
+        return True
 
     def run_command(self, command, shell=False, check=True, timeout=10):
         """Execute shell command"""
         try:
-            if shell: result = subprocess.run(command, shell=True, capture_output=True, text=True, check=check, timeout=timeout)
-            else: result = subprocess.run(command, capture_output=True, text=True, check=check, timeout=timeout)
+            if shell: result = run_subprocess(command, shell=True, capture_output=True, text=True, check=check, timeout=timeout)
+            else: result = run_subprocess(command, capture_output=True, text=True, check=check, timeout=timeout)
             return result.stdout.strip(), result.stderr.strip(), result.returncode
         except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
             stderr = str(e)
@@ -416,9 +711,278 @@ class BandwidthLimiter:
         print(stdout if stdout else "No filters")
         print(f"\n{'='*120}\n")
 
+class LimiterSet:
+    """
+    The BandwidthLimiters of all managed interfaces behind the BandwidthLimiter
+    API the policy engine, the accounting and the daemon use. Every interface
+    has its own tc tree and IFB, so its own class space; a device is shaped on
+    the interface it is attached to (the one whose network contains its address).
+    With a single interface this is a thin pass-through.
+    """
+    def __init__(self, limiters):
+        self.limiters = limiters    # {interface: BandwidthLimiter}, the hotspot interface first
+        self.primary = next(iter(limiters.values()))
+        self.network_index = PrefixIndex() # network -> interface, from HotspotManager.get_interface_networks()
+
+    def present(self):
+        """Limiters whose interface exists right now (a served radio can be unplugged or renamed)."""
+        return [l for l in self.limiters.values() if os.path.exists(f"/sys/class/net/{l.interface}")]
+
+    def interface_for(self, ip):
+        """The managed interface whose network contains 'ip', or None."""
+        return self.network_index.value(ip)
+
+    def limiter_for(self, ip):
+        """Where 'ip' is shaped now, else the interface whose network contains it, else the hotspot interface."""
+        for limiter in self.limiters.values():
+            if ip in limiter.ip_to_class: return limiter
+        return self.limiters.get(self.interface_for(ip), self.primary)
+
+    def classable(self, ips):
+        """The devices of 'ips' that have a device class or can still get one on their interface (earlier ones first)."""
+        free = {limiter.interface: len(limiter.free_class_ids()) for limiter in self.limiters.values()}
+        result = set()
+        for ip in ips:
+            if ip in self.ip_to_class: result.add(ip); continue
+            interface = self.limiters.get(self.interface_for(ip), self.primary).interface
+            if free[interface] > 0: free[interface] -= 1; result.add(ip)
+        return result
+
+    def _home(self, ip):
+        """The limiter a new or changed class for 'ip' goes to; a class left on another interface is removed first."""
+        current, home = self.limiter_for(ip), self.limiters.get(self.interface_for(ip))
+        if home is None: return current
+        if current is not home and ip in current.ip_to_class: current.remove_device_limit(ip) # The device moved
+        return home
+
+    # --- Merged state (read-only views, keyed by device IP / group id) ---
+    @property
+    def limits(self):
+        return ChainMap(*[l.limits for l in self.limiters.values()])
+
+    @property
+    def ip_to_class(self):
+        return ChainMap(*[l.ip_to_class for l in self.limiters.values()])
+
+    @property
+    def groups(self):
+        """{group_id: group}; 'members' is the union over the interfaces the group has classes on."""
+        merged = {}
+        for limiter in self.limiters.values():
+            for group_id, group in limiter.groups.items():
+                if group_id in merged: merged[group_id]['members'] |= group['members']
+                else: merged[group_id] = dict(group, members=set(group['members']))
+        return merged
+
+    @property
+    def tc_initialized(self):
+        present = self.present()
+        return bool(present) and all(l.tc_initialized for l in present)
+
+    @tc_initialized.setter
+    def tc_initialized(self, value):
+        for limiter in self.limiters.values(): limiter.tc_initialized = value
+
+    # --- Whole tree ---
+    def setup_tc_qdisc(self, total_bandwidth_down_kbps=100000, total_bandwidth_up_kbps=100000, missing_only=False):
+        """Sets up every present interface (missing_only: just those without a tc tree yet). The uplink capacity is the cap on each."""
+        for limiter in self.present():
+            if not (missing_only and limiter.tc_initialized): limiter.setup_tc_qdisc(total_bandwidth_down_kbps, total_bandwidth_up_kbps)
+
+    def adopt_tc_state(self):
+        """Adopts each present interface's tc tree. False if any could not be adopted (setup_tc_qdisc(missing_only=True) then)."""
+        return all([limiter.adopt_tc_state() for limiter in self.present()])
+
+    def cleanup_tc(self):
+        for limiter in self.limiters.values(): limiter.cleanup_tc()
+
+    def set_root_rate(self, download_kbps, upload_kbps):
+        for limiter in self.limiters.values():
+            if limiter.tc_initialized: limiter.set_root_rate(download_kbps, upload_kbps)
+
+    def get_tc_stats(self):
+        stats = {}
+        for limiter in self.limiters.values():
+            if limiter.tc_initialized: stats.update(limiter.get_tc_stats())
+        return stats
+
+    def show_tc_stats(self):
+        for limiter in self.limiters.values(): limiter.show_tc_stats()
+
+    # --- Per device: routed to its interface ---
+    def add_device_limit(self, ip, download_kbps, upload_kbps, priority=5):
+        return self._home(ip).add_device_limit(ip, download_kbps, upload_kbps, priority)
+
+    def change_device_limit(self, ip, download_kbps, upload_kbps, priority=5):
+        return self._home(ip).change_device_limit(ip, download_kbps, upload_kbps, priority)
+
+    def remove_device_limit(self, ip):
+        return self.limiter_for(ip).remove_device_limit(ip)
+
+    def verify_device_limit(self, ip, class_id):
+        return self.limiter_for(ip).verify_device_limit(ip, class_id)
+
+    def get_device_limit(self, ip):
+        return self.limits.get(ip)
+
+    # --- Groups: a group has classes on every interface, its cap applies per interface ---
+    def get_group_limit(self, group_id):
+        return self.primary.get_group_limit(group_id)
+
+    def set_group_limit(self, group_id, limit):
+        return all([limiter.set_group_limit(group_id, limit) for limiter in self.limiters.values()])
+
+# --- Effective Policy Engine ---
+# Layers in precedence order: the first layer that has an entry for a device wins.
+# 'group' only ever holds "group:<id>" keys (configured group caps).
+POLICY_LAYERS = ('quota', 'schedule', 'manual', 'group', 'adaptive')
+QUOTA_THROTTLE_LIMIT = {'download': 8, 'upload': 8, 'priority': 0}
+
+GROUP_KEY_PREFIX = 'group:'   # Policy keys for device groups: "group:<id>"
+
+def group_key(group_id):
+    return f"{GROUP_KEY_PREFIX}{group_id}"
+
+def parse_group_key(key):
+    """Returns the group id for a "group:<id>" key, or None for a device IP."""
+    if isinstance(key, str) and key.startswith(GROUP_KEY_PREFIX):
+        try: return int(key[len(GROUP_KEY_PREFIX):])
+        except ValueError: return None
+    return None
+
+def resolve_policy(layers, ip):
+    """
+    Pure precedence rule: returns the limit dict ({'download', 'upload', 'priority'})
+    of the highest layer that has an entry for 'ip', or None for unlimited.
+    A layer entry of None explicitly means "unlimited" and still shadows lower layers.
+    """
+    for name in POLICY_LAYERS:
+        layer = layers[name]
+        if ip in layer: return layer[ip]
+    return None
+
+class PolicyLayer(dict):
+    """A {ip: limit} dict that marks devices dirty in its engine whenever it changes."""
+    def __init__(self, engine, name):
+        super().__init__()
+        self.engine = engine
+        self.name = name
+
+    def __setitem__(self, ip, limit):
+        if ip in self and self.get(ip) == limit: return # Unchanged: keep the memoized result
+        super().__setitem__(ip, limit); self.engine.mark_dirty((ip,))
+
+    def __delitem__(self, ip):
+        super().__delitem__(ip); self.engine.mark_dirty((ip,))
+
+    def pop(self, ip, *default):
+        had = ip in self
+        value = super().pop(ip, *default)
+        if had: self.engine.mark_dirty((ip,))
+        return value
+
+    def setdefault(self, ip, limit=None):
+        if ip not in self: self[ip] = limit
+        return self[ip]
+
+    def update(self, *args, **kwargs):
+        for ip, limit in dict(*args, **kwargs).items(): self[ip] = limit
+
+    def clear(self):
+        ips = list(self.keys())
+        super().clear(); self.engine.mark_dirty(ips)
+
+class PolicyEngine:
+    """
+    Computes each device's effective tc limit from the prioritized layers
+    (quota throttle > schedule > manual > adaptive) and pushes only the devices
+    whose effective limit actually differs from what the limiter has applied.
+    """
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.lock = Lock()          # Guards dirty/effective
+        self.apply_lock = Lock()    # Serializes syncs (tc calls happen outside 'lock')
+        self.dirty = set()
+        self.effective = {}         # Memoized resolve_policy() results
+        self.layers = {name: PolicyLayer(self, name) for name in POLICY_LAYERS}
+
+    def mark_dirty(self, ips):
+        with self.lock:
+            for ip in ips:
+                self.dirty.add(ip); self.effective.pop(ip, None)
+
+    def set(self, layer, ip, limit):
+        self.layers[layer][ip] = limit
+
+    def clear(self, layer, ip):
+        self.layers[layer].pop(ip, None)
+
+    def replace(self, layer, mapping):
+        """Replaces a whole layer; only devices whose entry changed become dirty."""
+        current = self.layers[layer]
+        for ip in [ip for ip in current if ip not in mapping]: del current[ip]
+        for ip, limit in mapping.items():
+            if ip not in current or current[ip] != limit: current[ip] = limit
+
+    def resolve(self, ip):
+        with self.lock:
+            if ip in self.effective: return self.effective[ip]
+        limit = resolve_policy(self.layers, ip)
+        with self.lock: self.effective[ip] = limit
+        return limit
+
+    def source(self, ip):
+        """Name of the layer currently deciding this device's limit, or None."""
+        return next((name for name in POLICY_LAYERS if ip in self.layers[name]), None)
+
+    @staticmethod
+    def _same_limit(target, applied):
+        if target is None or applied is None: return target is None and applied is None
+        return (applied.get('download') == target['download'] and applied.get('upload') == target['upload']
+                and applied.get('priority') == target.get('priority', 5))
+
+    def sync(self, full=False):
+        """
+        Pushes dirty devices (or every known device with full=True, e.g. after tc
+        was rebuilt) to the limiter. Returns {ip: success} for devices that changed.
+        """
+        results = {}
+        with self.apply_lock:
+            if not self.limiter.tc_initialized: return results # Keep dirty until tc exists
+            with self.lock:
+                ips = set(self.dirty); self.dirty.clear()
+            if full:
+                ips.update(self.limiter.limits)
+                ips.update(group_key(group_id) for group_id in self.limiter.groups)
+                for layer in self.layers.values(): ips.update(layer)
+            for ip in sorted(ips):
+                target = self.resolve(ip)
+                group_id = parse_group_key(ip)
+                if group_id is not None:
+                    # Group caps are a single inner class: one in-place change
+                    if not self._same_limit(target, self.limiter.get_group_limit(group_id)):
+                        results[ip] = self.limiter.set_group_limit(group_id, target)
+                    continue
+                if self._same_limit(target, self.limiter.limits.get(ip)): continue
+                if target is None:
+                    results[ip] = self.limiter.remove_device_limit(ip)
+                elif ip in self.limiter.limits:
+                    # Class already exists: retune it in place
+                    results[ip] = self.limiter.change_device_limit(ip, target['download'], target['upload'], target.get('priority', 5))
+                else:
+                    results[ip] = self.limiter.add_device_limit(ip, target['download'], target['upload'], target.get('priority', 5))
+                if not results[ip]: self.mark_dirty((ip,)) # Retry on the next sync
+            return results
+
+# --- Block list ---
+BLOCK_INCREMENTAL_LIMIT = 32  # Changed networks above which one iptables-restore beats per-rule -D/-I
+
 class HotspotManager:
-    def __init__(self, interface="wlo1", ssid="MyBandwidthManager", password="12345678"):
+    def __init__(self, interface="wlo1", ssid="MyBandwidthManager", password="12345678", extra_interfaces=()):
         self.interface = interface
+        # The hotspot interface (nmcli) first, then served interfaces whose AP/DHCP is set up
+        # elsewhere (a second radio, a wired guest port): each gets its own IFB and tc tree
+        self.interfaces = [interface] + [i for i in dict.fromkeys(extra_interfaces) if i != interface]
         self.ssid = ssid
         self.password = password
         self.hotspot_name = "Hotspot"
@@ -427,7 +991,9 @@ class HotspotManager:
         self.tc_tracker = BandwidthTracker()    
         self.iptables_tracker = BandwidthTracker()    
         self.iptables_chain = "HOTSPOT_MONITOR"
-        self.bandwidth_limiter = BandwidthLimiter(interface)
+        self.bandwidth_limiter = LimiterSet({name: BandwidthLimiter(name, f'ifb{i}') for i, name in enumerate(self.interfaces)})
+        self.interface_networks = {} # {interface: (ip, cidr, ip_network)} as of the last device pass
+        self.network_index = PrefixIndex() # Those networks -> interface: "is this address ours, and where"
         self.available_download_kbps = 10000.0    
         self.available_upload_kbps = 10000.0      
         self.last_speedtest_time = 0
@@ -437,17 +1003,19 @@ class HotspotManager:
         self.speedtest_lock = Lock()
         
         self.device_quotas = {}
-        # --- "Source of Truth" for manual limits ---
-        self.manual_device_limits = {}
+        # --- Effective limits: quota > schedule > manual > adaptive ---
+        self.policy = PolicyEngine(self.bandwidth_limiter)
+        self.device_groups = {} # {group_id: {'name', 'match_type', 'match_value', 'limit_dl_kbps', 'limit_ul_kbps', 'priority'}}
         
-        self.last_raw_bytes = {} # {ip: {'rx': R, 'tx': T}}
+        self.last_raw_bytes = {} # {ip: {'rx': R, 'tx': T, 'source': counter read}}
         
         # --- NEW: Security State ---
         self.client_isolation_enabled = False
         self.access_control_mode = "allow_all" # "allow_all", "block_list", "allow_list"
         self.blocked_macs = set()
         self.allowed_macs = set()
-        self.ip_block_list = set() # *** NEW ***
+        self.ip_block_list = set() # *** NEW *** (property: keeps block_index in step)
+        self.applied_block_networks = None # blocked_networks as last loaded into the chains (None: unknown, reload in full)
         self.acl_chain = "HOTSPOT_ACL"
         self.isolation_chain = "HOTSPOT_ISOLATION"
         self.ip_block_chain = "HOTSPOT_IP_BLOCK" # *** NEW ***
@@ -462,12 +1030,117 @@ class HotspotManager:
         self.forecast_data = []
         # --- *** END NEW *** ---
 
-
-    def run_command(self, command, shell=False, check=True, timeout=10):
-        """Execute shell command and return output"""
+    # --- "Source of Truth" for manual limits (backed by the policy engine's 'manual' layer) ---
+    @property
+    def manual_device_limits(self):
+        return self.policy.layers['manual']
+
+    @manual_device_limits.setter
+    def manual_device_limits(self, limits):
+        self.policy.replace('manual', limits)
+
+    # --- IP block list (CIDR strings) and its lookup index ---
+    @property
+    def ip_block_list(self):
+        return self._ip_block_list
+
+    @ip_block_list.setter
+    def ip_block_list(self, ranges):
+        self._ip_block_list = set(ranges); self._block_index = self._blocked_networks = None
+
+    @property
+    def block_index(self):
+        """PrefixIndex over the block list (rebuilt on first use after a change); unparsable entries are left out."""
+        if self._block_index is None:
+            entries = []
+            for ip_range in self._ip_block_list:
+                try: entries.append((ipaddress.ip_network(ip_range, strict=False), ip_range))
+                except ValueError: pass
+            self._block_index = PrefixIndex(entries)
+        return self._block_index
+
+    @property
+    def blocked_networks(self):
+        """
+        {4: [networks], 6: [networks]}: the block list collapsed to the fewest CIDR
+        blocks covering the same addresses (collapse_addresses semantics: overlapping,
+        nested and adjacent entries merged), in address order. This is what the
+        block chains hold, two rules per network.
+        """
+        if self._blocked_networks is None:
+            networks = {4: [], 6: []}
+            for network, _ in self.block_index: networks[network.version].append(network)
+            self._blocked_networks = {version: collapse_networks(nets) for version, nets in networks.items()}
+        return self._blocked_networks
+
+    def blocked_by(self, ip):
+        """The block-list entry that covers 'ip' (the most specific one), or None."""
+        return self.block_index.value(ip)
+
+    # --- Device Groups ---
+    def set_device_groups(self, groups):
+        """Replaces the group definitions and publishes their caps in the 'group' policy layer."""
+        self.device_groups = {g['id']: g for g in groups if 0 < g['id'] <= MAX_GROUPS}
+        caps = {}
+        for group_id, g in self.device_groups.items():
+            if g.get('limit_dl_kbps') and g.get('limit_ul_kbps'):
+                caps[group_key(group_id)] = {'download': g['limit_dl_kbps'], 'upload': g['limit_ul_kbps'], 'priority': g.get('priority') if g.get('priority') is not None else 5}
+        self.policy.replace('group', caps)
+
+    @staticmethod
+    def match_group_members(group, devices):
+        """Returns the IPs in 'devices' that belong to 'group' (by subnet, MAC prefix or tag list)."""
+        match_type = group.get('match_type'); value = group.get('match_value') or ''
+        members = set()
+        if match_type == 'subnet':
+            try: network = ipaddress.ip_network(value, strict=False)
+            except ValueError: return members
+            for dev in devices:
+                try:
+                    if ipaddress.ip_address(dev['ip']) in network: members.add(dev['ip'])
+                except ValueError: pass
+        elif match_type == 'mac_prefix':
+            prefix = value.lower().replace('-', ':')
+            members = {dev['ip'] for dev in devices if (dev.get('mac') or '').lower().startswith(prefix)}
+        elif match_type == 'tag':
+            try: tagged = {str(t).lower() for t in json.loads(value)}
+            except (ValueError, TypeError): tagged = {t.strip().lower() for t in value.split(',') if t.strip()}
+            members = {dev['ip'] for dev in devices if dev['ip'] in tagged or (dev.get('mac') or '').lower() in tagged}
+        return members
+
+    def apply_device_groups(self, devices):
+        """
+        Creates/updates the group classes and memberships (tc work only when something
+        changed). Every interface has the group's classes; members are filtered on the
+        interface they are attached to. Runs under the policy engine's apply lock:
+        membership moves device classes, which a command's policy.sync may be doing too.
+        """
+        if not self.bandwidth_limiter.tc_initialized: return
+        assigned = set()
+        members_by_group = {}
+        for group_id in sorted(self.device_groups):
+            members_by_group[group_id] = self.match_group_members(self.device_groups[group_id], devices) - assigned # First group wins
+            assigned |= members_by_group[group_id]
+        with self.policy.apply_lock:
+            for name, limiter in self.bandwidth_limiter.limiters.items():
+                if not limiter.tc_initialized: continue
+                on_interface = {dev['ip'] for dev in devices if dev.get('interface', self.interface) == name}
+                for group_id, members in members_by_group.items():
+                    group = self.device_groups[group_id]
+                    subnet = group.get('match_value') if group.get('match_type') == 'subnet' else None
+                    if limiter.ensure_group(group_id, subnet): limiter.set_group_members(group_id, members & on_interface)
+                for group_id in [g for g in limiter.groups if g not in self.device_groups]:
+                    limiter.remove_group(group_id)
+
+    def refresh_quota_policy(self):
+        """Rebuilds the 'quota' layer from the throttled flags in device_quotas."""
+        self.policy.replace('quota', {ip: QUOTA_THROTTLE_LIMIT for ip, q in self.device_quotas.items() if q.get('is_throttled')})
+
+    def run_command(self, command, shell=False, check=True, timeout=10, input=None):
+        """Execute shell command and return output ('input' is written to its stdin)"""
         try:
-            if shell: result = subprocess.run(command, shell=True, capture_output=True, text=True, check=check, timeout=timeout)
-            else: result = subprocess.run(command, capture_output=True, text=True, check=check, timeout=timeout)
+            if shell: result = run_subprocess(command, shell=True, capture_output=True, text=True, check=check, timeout=timeout, input=input)
+            else: result = run_subprocess(command, capture_output=True, text=True, check=check, timeout=timeout, input=input)
             return result.stdout.strip(), result.stderr.strip(), result.returncode
         except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
             stderr = str(e)
@@ -476,21 +1149,21 @@ class HotspotManager:
 
     def check_dependencies(self):
         """Check for required external binaries"""
-        print("Checking dependencies...")
+        log.info("Checking dependencies...")
         try:
             stdout, stderr, code = self.run_command(['speedtest-cli', '--version'], check=False)
             if code != 0: raise FileNotFoundError
-            print("      ✓ speedtest-cli found")
+            log.debug("✓ speedtest-cli found")
         except FileNotFoundError:
-            print("❌ FATAL: 'speedtest-cli' is not installed or not in your PATH.")
-            print("Please install it: sudo apt install speedtest-cli OR pip install speedtest-cli")
+            log.error("❌ FATAL: 'speedtest-cli' is not installed or not in your PATH.")
+            log.info("Please install it: sudo apt install speedtest-cli OR pip install speedtest-cli")
             sys.exit(1)
 
     def check_sudo(self):
         """Check if running with sudo privileges"""
         if subprocess.run(['id', '-u'], capture_output=True, text=True).stdout.strip() != '0':
-            print("❌ This script requires sudo privileges!")
-            print(f"Run with: sudo {sys.argv[0]}")
+            log.error("❌ This script requires sudo privileges!")
+            log.info(f"Run with: sudo {sys.argv[0]}")
             sys.exit(1)
 
     def clear_screen(self):
@@ -522,69 +1195,97 @@ class HotspotManager:
 
     def setup_iptables_monitoring(self, network):
         """Setup iptables rules for traffic monitoring - FORWARD ONLY"""
-        print(f"🔧 Setting up (unlimited) traffic monitoring for {network}.0/24...")
+        fw_log.info(f"🔧 Setting up (unlimited) traffic monitoring for {network}...")
         self.run_command(['iptables', '-N', self.iptables_chain], check=False)
         self.run_command(['iptables', '-F', self.iptables_chain], check=False)
         # --- REVERTED: Insert at top (position 1) ---
         self.run_command(f"iptables -D FORWARD -j {self.iptables_chain} 2>/dev/null",shell=True, check=False)
         self.run_command(['iptables', '-I', 'FORWARD', '1', '-j', self.iptables_chain]) # Insert at 1st position
         # --- End of REVERTED ---
-        print("✅ iptables monitoring rules created (FORWARD only)")
+        fw_log.info("✅ iptables monitoring rules created (FORWARD only)")
         
     # --- NEW: Security Rules Setup ---
     def setup_security_rules(self):
         """Creates and links the iptables & ip6tables chains for security features."""
-        print(f"🔧 Setting up security chains (IPv4 & IPv6)...")
+        fw_log.info(f"🔧 Setting up security chains (IPv4 & IPv6)...")
         
         # --- First, completely clean up any existing setup ---
-        print("  Cleaning up any existing security chains...")
+        fw_log.debug("Cleaning up any existing security chains...")
         self.cleanup_security_rules()
         
         # --- IPv4 Chains ---
-        print("  Creating IPv4 chains...")
+        fw_log.debug("Creating IPv4 chains...")
         self.run_command(['iptables', '-N', self.acl_chain], check=False)
         self.run_command(['iptables', '-N', self.ip_block_chain], check=False)
         self.run_command(['iptables', '-N', self.isolation_chain], check=False)
         
         # --- IPv6 Chains ---
-        print("  Creating IPv6 chains...")
+        fw_log.debug("Creating IPv6 chains...")
         self.run_command(['ip6tables', '-N', self.acl_chain_v6], check=False)
         self.run_command(['ip6tables', '-N', self.ip_block_chain_v6], check=False)
         self.run_command(['ip6tables', '-N', self.isolation_chain_v6], check=False)
 
-        # --- Link IPv4 Chains (CORRECT ORDER) ---
-        print("  Linking IPv4 chains to FORWARD...")
-        # Position 2: IP Block first (checks all traffic from hotspot)
-        self.run_command(['iptables', '-I', 'FORWARD', '2', '-i', self.interface, 
-                        '-j', self.ip_block_chain])
-        # Position 3: Client Isolation (only for client-to-client traffic)
-        self.run_command(['iptables', '-I', 'FORWARD', '3', '-i', self.interface, 
-                        '-o', self.interface, '-j', self.isolation_chain])
-        # Position 4: ACL (checks remaining traffic)
-        self.run_command(['iptables', '-I', 'FORWARD', '4', '-i', self.interface, 
-                        '-j', self.acl_chain])
-
-        # --- Link IPv6 Chains ---
-        print("  Linking IPv6 chains to FORWARD...")
-        self.run_command(['ip6tables', '-I', 'FORWARD', '1', '-i', self.interface, 
-                        '-j', self.ip_block_chain_v6])
-        self.run_command(['ip6tables', '-I', 'FORWARD', '2', '-i', self.interface, 
-                        '-o', self.interface, '-j', self.isolation_chain_v6])
-        self.run_command(['ip6tables', '-I', 'FORWARD', '3', '-i', self.interface, 
-                        '-j', self.acl_chain_v6])
+        # --- Link the chains (CORRECT ORDER), per interface ---
+        # IPv4 from position 2 (the monitor chain is 1), IPv6 from 1. For each interface:
+        # IP Block first (all traffic from it), Client Isolation (client-to-client
+        # traffic only), then ACL (remaining traffic)
+        fw_log.debug("Linking security chains to FORWARD...")
+        for binary, links in self.security_links().items():
+            first = 2 if binary == 'iptables' else 1
+            for position, link in enumerate(links, first):
+                self.run_command([binary, '-I', 'FORWARD', str(position), *link.split()[2:]])
 
         # Apply rules to all chains
-        print("  Applying security policies...")
+        fw_log.debug("Applying security policies...")
         self.apply_client_isolation_rule()
         self.apply_access_control_rules()
         self.apply_ip_block_rules() 
-        print("✅ Security chains linked and rules applied.")
-
-
+        fw_log.info("✅ Security chains linked and rules applied.")
+
+    # --- Warm start: adopt what a previous run left in the kernel ---
+    @staticmethod
+    def _canonical_rule(chain, rule):
+        """A rule as 'iptables -S' prints it (upper-case MACs, addresses with a prefix length)."""
+        args = list(rule)
+        for i, arg in enumerate(args[:-1]):
+            if arg == '--mac-source': args[i + 1] = args[i + 1].upper()
+            elif arg in ('-s', '-d'):
+                try: args[i + 1] = str(ipaddress.ip_network(args[i + 1], strict=False))
+                except ValueError: pass
+        return " ".join(['-A', chain, *args])
+
+    def _listed_rules(self, binary, chain):
+        stdout, _, code = self.run_command([binary, '-S', chain], check=False)
+        return [line.strip() for line in stdout.splitlines() if line.startswith('-A ')] if code == 0 else None
+
+    def adopt_firewall_rules(self, network):
+        """
+        Keeps the monitoring and security chains of a previous run if they are
+        still linked into FORWARD in the right order: the monitoring counters
+        keep counting and only security chains whose content differs from the
+        stored state are reloaded. Anything missing is set up from scratch.
+        """
+        fw_log.info("♻️ Adopting existing iptables chains...")
+        forward = self._listed_rules('iptables', 'FORWARD') or []
+        forward6 = self._listed_rules('ip6tables', 'FORWARD') or []
+        monitor_link = f"-A FORWARD -j {self.iptables_chain}"
+        if forward[:1] != [monitor_link] or forward.count(monitor_link) != 1 or self._listed_rules('iptables', self.iptables_chain) is None:
+            self.setup_iptables_monitoring(network)
+        links = self.security_links()
+        chains = (self.ip_block_chain, self.isolation_chain, self.acl_chain, self.ip_block_chain_v6, self.isolation_chain_v6, self.acl_chain_v6)
+        if ([l for l in forward if l.endswith(chains)] != links['iptables'] or [l for l in forward6 if l.endswith(chains)] != links['ip6tables']):
+            fw_log.info("ℹ️  Security chains missing or out of order: rebuilding them.")
+            self.setup_security_rules(); return
+        for feature, apply in (('isolation', self.apply_client_isolation_rule), ('acl', self.apply_access_control_rules), ('ip_block', self.apply_ip_block_rules)):
+            wanted = self.security_chain_rules(feature)
+            if any(self._listed_rules(binary, chain) != [self._canonical_rule(chain, rule) for rule in rules] for (binary, chain), rules in wanted.items()):
+                apply()
+        self.applied_block_networks = self.blocked_networks # Matched, or just reloaded
+        fw_log.info("✅ Security chains adopted.")
 
     def cleanup_iptables_monitoring(self):
         """Remove iptables monitoring rules"""
-        print("🧹 Cleaning up iptables monitoring rules...")
+        fw_log.info("🧹 Cleaning up iptables monitoring rules...")
         self.run_command(f"iptables -D FORWARD -j {self.iptables_chain} 2>/dev/null", shell=True, check=False)
         self.run_command(['iptables', '-F', self.iptables_chain], check=False)
         self.run_command(['iptables', '-X', self.iptables_chain], check=False)
@@ -592,7 +1293,7 @@ class HotspotManager:
     # --- NEW: Security Rules Cleanup ---
     def cleanup_security_rules(self):
         """Removes all iptables & ip6tables security rules and chains."""
-        print("🧹 Cleaning up security rules (IPv4 & IPv6)...")
+        fw_log.info("🧹 Cleaning up security rules (IPv4 & IPv6)...")
         
         # --- IPv4 Cleanup ---
         # Remove all references from FORWARD (use while loop to handle multiple references)
@@ -612,14 +1313,11 @@ class HotspotManager:
             if code != 0:
                 break
                 
-        while True:
-            stdout, _, code = self.run_command(
-                f"iptables -D FORWARD -i {self.interface} -o {self.interface} -j {self.isolation_chain} 2>&1",
-                shell=True, check=False
-            )
-            if code != 0:
-                break
-        
+        # Per-interface links (FORWARD -i <interface> ...), IPv4 and IPv6
+        for binary, links in self.security_links().items():
+            for link in links:
+                while self.run_command([binary, '-D', *link.split()[1:]], check=False)[2] == 0: pass
+
         # Flush and delete chains
         self.run_command(['iptables', '-F', self.acl_chain], check=False)
         self.run_command(['iptables', '-F', self.ip_block_chain], check=False)
@@ -644,105 +1342,122 @@ class HotspotManager:
             )
             if code != 0:
                 break
-                
-        while True:
-            stdout, _, code = self.run_command(
-                f"ip6tables -D FORWARD -i {self.interface} -o {self.interface} -j {self.isolation_chain_v6} 2>&1",
-                shell=True, check=False
-            )
-            if code != 0:
-                break
-        
+
         self.run_command(['ip6tables', '-F', self.acl_chain_v6], check=False)
         self.run_command(['ip6tables', '-F', self.ip_block_chain_v6], check=False)
         self.run_command(['ip6tables', '-F', self.isolation_chain_v6], check=False)
         self.run_command(['ip6tables', '-X', self.acl_chain_v6], check=False)
         self.run_command(['ip6tables', '-X', self.ip_block_chain_v6], check=False)
         self.run_command(['ip6tables', '-X', self.isolation_chain_v6], check=False)
+        self.applied_block_networks = None
         
-        print("✅ Security rules cleaned up.")
+        fw_log.info("✅ Security rules cleaned up.")
+
+    def security_links(self):
+        """{binary: FORWARD rules linking the security chains}, in order and as 'iptables -S' prints them."""
+        links = {'iptables': [], 'ip6tables': []}
+        for interface in self.interfaces:
+            for binary, (block, isolation, acl) in (('iptables', (self.ip_block_chain, self.isolation_chain, self.acl_chain)),
+                                                    ('ip6tables', (self.ip_block_chain_v6, self.isolation_chain_v6, self.acl_chain_v6))):
+                links[binary] += [f"-A FORWARD -i {interface} -j {block}", f"-A FORWARD -i {interface} -o {interface} -j {isolation}", f"-A FORWARD -i {interface} -j {acl}"]
+        return links
+
+    # --- Security chain contents (one spec for applying and for warm-start comparison) ---
+    def security_chain_rules(self, feature):
+        """
+        {(binary, chain): [rule args]} that 'feature' ('isolation', 'acl' or 'ip_block')
+        puts in its IPv4 and IPv6 chains. Lists are built in sorted order so two
+        runs with the same state produce the same chains.
+        """
+        if feature == 'isolation':
+            rules = [['-j', 'DROP']] if self.client_isolation_enabled else [] # Disabled: empty chain, traffic falls through
+            return {('iptables', self.isolation_chain): rules, ('ip6tables', self.isolation_chain_v6): list(rules)}
+        if feature == 'acl':
+            rules = []
+            if self.access_control_mode == 'block_list':
+                rules = [['-m', 'mac', '--mac-source', mac, '-j', 'DROP'] for mac in sorted(self.blocked_macs)]
+            elif self.access_control_mode == 'allow_list':
+                rules = [['-m', 'mac', '--mac-source', mac, '-j', 'ACCEPT'] for mac in sorted(self.allowed_macs)] + [['-j', 'DROP']]
+            return {('iptables', self.acl_chain): rules, ('ip6tables', self.acl_chain_v6): [list(r) for r in rules]}
+        # The collapsed block list (address order), not the entries as typed.
+        # No final ACCEPT: traffic that is not dropped falls through to the next chain (isolation, ACL)
+        return {key: [rule for network in self.blocked_networks[version] for rule in self._block_rules(network)]
+                for key, version in self._block_chains().items()}
+
+    def _block_chains(self):
+        return {('iptables', self.ip_block_chain): 4, ('ip6tables', self.ip_block_chain_v6): 6}
+
+    @staticmethod
+    def _block_rules(network):
+        return [['-d', str(network), '-j', 'DROP'], ['-s', str(network), '-j', 'DROP']]
+
+    def load_security_chains(self, chain_rules):
+        """Flushes each chain and appends its rules."""
+        for (binary, chain), rules in chain_rules.items():
+            self.run_command([binary, '-F', chain], check=False)
+            for rule in rules: self.run_command([binary, '-A', chain, *rule])
+
+    def restore_security_chains(self, chain_rules):
+        """
+        Same result as load_security_chains, but one 'iptables-restore --noflush'
+        per binary: declaring a chain flushes it and the new rules are committed
+        in one transaction, however many there are. Falls back to rule-by-rule
+        if the restore fails.
+        """
+        for binary in ('iptables', 'ip6tables'):
+            chains = {chain: rules for (b, chain), rules in chain_rules.items() if b == binary}
+            if not chains: continue
+            lines = ['*filter'] + [f":{chain} - [0:0]" for chain in chains]
+            lines += [" ".join(['-A', chain, *rule]) for chain, rules in chains.items() for rule in rules]
+            _, stderr, code = self.run_command([f'{binary}-restore', '--noflush'], check=False, timeout=60, input="\n".join(lines + ['COMMIT', '']))
+            if code != 0:
+                fw_log.warning(f"⚠️ {binary}-restore failed ({stderr or code}): loading rule by rule")
+                self.load_security_chains({(binary, chain): rules for chain, rules in chains.items()})
 
     # --- NEW: Apply Client Isolation Rule ---
     def apply_client_isolation_rule(self):
         """Applies the iptables rule for client isolation based on state."""
-        print(f"Applying client isolation (IPv4 & IPv6): {'ENABLED' if self.client_isolation_enabled else 'DISABLED'}")
-        
-        # --- IPv4 ---
-        self.run_command(['iptables', '-F', self.isolation_chain], check=False)
-        if self.client_isolation_enabled:
-            # Only add DROP rule when enabled
-            self.run_command(['iptables', '-A', self.isolation_chain, '-j', 'DROP'])
-        # When disabled, leave chain empty (traffic falls through)
-        
-        # --- IPv6 ---
-        self.run_command(['ip6tables', '-F', self.isolation_chain_v6], check=False)
-        if self.client_isolation_enabled:
-            self.run_command(['ip6tables', '-A', self.isolation_chain_v6, '-j', 'DROP'])
-        # --- *** END NEW *** ---
+        fw_log.info(f"Applying client isolation (IPv4 & IPv6): {'ENABLED' if self.client_isolation_enabled else 'DISABLED'}")
+        self.load_security_chains(self.security_chain_rules('isolation'))
 
     # --- NEW: Apply Access Control Rules ---
     def apply_access_control_rules(self):
         """Applies the iptables rules for MAC block/allow lists."""
-        print(f"Applying Access Control Mode (IPv4 & IPv6): {self.access_control_mode}")
-        
-        # --- IPv4 ---
-        self.run_command(['iptables', '-F', self.acl_chain], check=False)
-        if self.access_control_mode == 'allow_all':
-            pass  # Empty chain
-        elif self.access_control_mode == 'block_list':
-            for mac in self.blocked_macs:
-                self.run_command(['iptables', '-A', self.acl_chain, '-m', 'mac', 
-                                '--mac-source', mac, '-j', 'DROP'])
-        elif self.access_control_mode == 'allow_list':
-            for mac in self.allowed_macs:
-                self.run_command(['iptables', '-A', self.acl_chain, '-m', 'mac', 
-                                '--mac-source', mac, '-j', 'ACCEPT'])
-            self.run_command(['iptables', '-A', self.acl_chain, '-j', 'DROP'])
-
-        # --- IPv6 ---
-        self.run_command(['ip6tables', '-F', self.acl_chain_v6], check=False)
-        if self.access_control_mode == 'allow_all':
-            pass
-        elif self.access_control_mode == 'block_list':
-            for mac in self.blocked_macs:
-                self.run_command(['ip6tables', '-A', self.acl_chain_v6, '-m', 'mac', 
-                                '--mac-source', mac, '-j', 'DROP'])
-        elif self.access_control_mode == 'allow_list':
-            for mac in self.allowed_macs:
-                self.run_command(['ip6tables', '-A', self.acl_chain_v6, '-m', 'mac', 
-                                '--mac-source', mac, '-j', 'ACCEPT'])
-            self.run_command(['ip6tables', '-A', self.acl_chain_v6, '-j', 'DROP'])
- # --- *** NEW: Apply IP Block Rules *** ---
-    def apply_ip_block_rules(self): 
-        """Applies the iptables & ip6tables rules for the IP block list."""
-        print(f"Applying IP Block List (IPv4 & IPv6): {self.ip_block_list}")
-        
-        # --- IPv4 ---
-        self.run_command(['iptables', '-F', self.ip_block_chain], check=False)
-        
-        # --- *** NEW: IPv6 ---
-        self.run_command(['ip6tables', '-F', self.ip_block_chain_v6], check=False)
+        fw_log.info(f"Applying Access Control Mode (IPv4 & IPv6): {self.access_control_mode}")
+        self.load_security_chains(self.security_chain_rules('acl'))
 
-        for ip_range in self.ip_block_list:
-            # Simple check: if it has a colon, it's IPv6.
-            if ':' in ip_range:
-                # --- NEW: IPv6 Rule ---
-                self.run_command(['ip6tables', '-A', self.ip_block_chain_v6, '-d', ip_range, '-j', 'DROP'])
-                self.run_command(['ip6tables', '-A', self.ip_block_chain_v6, '-s', ip_range, '-j', 'DROP'])
-            elif '.' in ip_range:
-                # --- Existing IPv4 Rule ---
-                self.run_command(['iptables', '-A', self.ip_block_chain, '-d', ip_range, '-j', 'DROP'])
-                self.run_command(['iptables', '-A', self.ip_block_chain, '-s', ip_range, '-j', 'DROP'])
-        
-        # --- FIX: We intentionally do NOT add an 'ACCEPT' rule here. ---
-        # Traffic that is not dropped will "fall through" to be processed
-        # by the next chain in the FORWARD list (e.g., isolation_chain).
-        
-        # --- FIX: REMOVED the final ACCEPT rules ---
-        # The lines below were the bug. By removing them, packets that are
-        # not dropped will fall through to the next chain (HOTSPOT_ACL).
-        # self.run_command(['iptables', '-A', self.ip_block_chain, '-j', 'ACCEPT'])
-        # self.run_command(['ip6tables', '-A', self.ip_block_chain_v6, '-j', 'ACCEPT'])
+    # --- *** NEW: Apply IP Block Rules *** ---
+    def apply_ip_block_rules(self):
+        """Applies the iptables & ip6tables rules for the IP block list."""
+        networks = self.blocked_networks
+        fw_log.info(f"Applying IP Block List (IPv4 & IPv6): {len(self.ip_block_list)} entries as {len(networks[4]) + len(networks[6])} networks")
+        self.restore_security_chains(self.security_chain_rules('ip_block'))
+        self.applied_block_networks = networks
+
+    def update_ip_block_rules(self):
+        """
+        Brings the block chains from applied_block_networks to blocked_networks
+        with as few commands as possible: rules of networks that left the
+        collapsed set are deleted, new ones are inserted at their sorted
+        position (so the chain stays identical to a full reload). Falls back
+        to a full reload if the chains' state is unknown, too much changed, or
+        a command failed (the positions would no longer match the chain).
+        """
+        applied, wanted = self.applied_block_networks, self.blocked_networks
+        if applied is None or sum(len(set(applied[v]) ^ set(wanted[v])) for v in (4, 6)) > BLOCK_INCREMENTAL_LIMIT:
+            self.apply_ip_block_rules(); return
+        for (binary, chain), version in self._block_chains().items():
+            keep = set(wanted[version])
+            commands = [[binary, '-D', chain, *rule] for network in applied[version] if network not in keep for rule in self._block_rules(network)]
+            old = set(applied[version])
+            commands += [[binary, '-I', chain, str(2 * i + offset), *rule] for i, network in enumerate(wanted[version]) if network not in old # Ascending: everything before position i is already in place
+                         for offset, rule in enumerate(self._block_rules(network), 1)]
+            for command in commands:
+                _, stderr, code = self.run_command(command, check=False)
+                if code != 0:
+                    fw_log.warning(f"⚠️ '{' '.join(command[:4])}' failed ({stderr or code}): reloading the block chains")
+                    self.applied_block_networks = None; self.apply_ip_block_rules(); return
+        self.applied_block_networks = wanted
 
     # --- NEW: Helper functions to be called by daemon ---
     def set_client_isolation(self, enabled: bool):
@@ -751,7 +1466,7 @@ class HotspotManager:
 
     def set_access_control_mode(self, mode: str):
         if mode not in ['allow_all', 'block_list', 'allow_list']:
-            print(f"Warning: Invalid AC mode '{mode}'. Defaulting to 'allow_all'.")
+            fw_log.warning(f"Warning: Invalid AC mode '{mode}'. Defaulting to 'allow_all'.")
             self.access_control_mode = 'allow_all'
         else:
             self.access_control_mode = mode
@@ -773,18 +1488,27 @@ class HotspotManager:
     def add_ip_to_block_list(self, ip_range: str):
         """Adds an IP/CIDR to the block list and applies rules."""
         if ip_range not in self.ip_block_list:
-            self.ip_block_list.add(ip_range)
-            self.apply_ip_block_rules()
-            print(f"Added {ip_range} to block list. Rules applied.")
+            self.ip_block_list = self.ip_block_list | {ip_range}
+            self.update_ip_block_rules()
+            fw_log.info(f"Added {ip_range} to block list. Rules applied.")
             return True
         return False
 
+    def add_ips_to_block_list(self, ip_ranges):
+        """Adds many IPs/CIDRs with one kernel update. Returns the ones that were not already listed."""
+        added = set(ip_ranges) - self.ip_block_list
+        if added:
+            self.ip_block_list = self.ip_block_list | added
+            self.update_ip_block_rules()
+            fw_log.info(f"Added {len(added)} ranges to block list. Rules applied.")
+        return added
+
     def remove_ip_from_block_list(self, ip_range: str):
         """Removes an IP/CIDR from the block list and applies rules."""
         if ip_range in self.ip_block_list:
-            self.ip_block_list.discard(ip_range)
-            self.apply_ip_block_rules()
-            print(f"Removed {ip_range} from block list. Rules applied.")
+            self.ip_block_list = self.ip_block_list - {ip_range}
+            self.update_ip_block_rules()
+            fw_log.info(f"Removed {ip_range} from block list. Rules applied.")
             return True
         return False
     # --- *** End of NEW *** ---
@@ -803,22 +1527,23 @@ class HotspotManager:
             self.run_command(['iptables', '-A', self.iptables_chain,'-d', ip, '-j', 'RETURN'], check=False)
             self.run_command(['iptables', '-A', self.iptables_chain,'-s', ip, '-j', 'RETURN'], check=False)
 
-    def get_iptables_stats(self, network_prefix):
-        """Get traffic statistics from iptables - ROBUST PARSER"""
+    def get_iptables_stats(self, networks):
+        """Get traffic statistics from iptables - ROBUST PARSER (networks: a PrefixIndex, or one network)"""
         stdout, _, _ = self.run_command(['iptables', '-L', self.iptables_chain, '-v', '-n', '-x'])
         stats = {}
-        if not network_prefix: return stats
+        if not networks: return stats
+        if not isinstance(networks, PrefixIndex): networks = PrefixIndex([networks])
         for line in stdout.split('\n'):
             parts = line.split()
             if len(parts) >= 9 and parts[0].isdigit():
                 try:
-                    bytes_count = int(parts[1]); source = parts[7]; dest = parts[8]
-                    if source.startswith(network_prefix):
-                        ip = source.split('/')[0]
+                    bytes_count = int(parts[1]); source = parts[7].split('/')[0]; dest = parts[8].split('/')[0]
+                    if source in networks:
+                        ip = source
                         if ip not in stats: stats[ip] = {'rx': 0, 'tx': 0}
                         stats[ip]['tx'] += bytes_count
-                    elif dest.startswith(network_prefix):
-                        ip = dest.split('/')[0]
+                    elif dest in networks:
+                        ip = dest
                         if ip not in stats: stats[ip] = {'rx': 0, 'tx': 0}
                         stats[ip]['rx'] += bytes_count
                 except (ValueError, IndexError): continue
@@ -826,7 +1551,7 @@ class HotspotManager:
 
     def detect_internet_interface(self):
         """Detect which network interface has internet connectivity"""
-        print("      🔍 Detecting internet interface...")
+        log.debug("🔍 Detecting internet interface...")
         # Get default route
         stdout, _, code = self.run_command(['ip', 'route', 'show', 'default'], check=False)
         if code == 0 and stdout:
@@ -836,7 +1561,7 @@ class HotspotManager:
                 internet_if = match.group(1)
                 # Don't use the hotspot interface itself
                 if internet_if != self.interface:
-                    print(f"      ✓ Found internet interface: {internet_if}")
+                    log.debug(f"✓ Found internet interface: {internet_if}")
                     return internet_if
         
         # Fallback: check all active interfaces
@@ -848,43 +1573,43 @@ class HotspotManager:
             # Check if interface is UP and has an IP
             stdout, _, code = self.run_command(['ip', 'addr', 'show', iface], check=False)
             if 'state UP' in stdout and 'inet ' in stdout:
-                print(f"      ✓ Found active interface: {iface}")
+                log.debug(f"✓ Found active interface: {iface}")
                 return iface
         
-        print("      ⚠️ No internet interface found")
+        log.warning("⚠️ No internet interface found")
         return None
 
     def turn_on_hotspot(self):
         """Enable WiFi hotspot"""
-        print(f"🔄 Turning ON hotspot '{self.ssid}'...")
-        print(f"    Disconnecting {self.interface}...")
+        log.info(f"🔄 Turning ON hotspot '{self.ssid}'...")
+        log.debug(f"Disconnecting {self.interface}...")
         self.run_command(['nmcli', 'device', 'disconnect', self.interface], check=False)
         self.run_command(['nmcli', 'connection', 'delete', self.hotspot_name], check=False)
         self.run_command(['nmcli', 'connection', 'delete', self.ssid], check=False)
         stdout, stderr, code = self.run_command(['nmcli', 'device', 'wifi', 'hotspot','ifname', self.interface,'ssid', self.ssid,'password', self.password])
         if code == 0:
-            print(f"✅ Hotspot '{self.ssid}' is now ACTIVE!")
-            print(f"    Password: {self.password}")
+            log.info(f"✅ Hotspot '{self.ssid}' is now ACTIVE!")
+            log.debug(f"Password: {self.password}")
             self.run_command(['sysctl', '-w', 'net.ipv4.ip_forward=1'])
-            print("✅ IP forwarding enabled")
+            log.info("✅ IP forwarding enabled")
             time.sleep(2)
-            _, _, network = self.get_hotspot_ip_range()
+            network = self.get_interface_networks().get(self.interface, (None, None, None))[2] # Also routes devices to their interface
             if network:
                 self.setup_iptables_monitoring(network)
                 self.setup_security_rules()
                 self.bandwidth_limiter.setup_tc_qdisc(self.available_download_kbps, self.available_upload_kbps)
-            print("    Running initial speedtest... (please wait, this can take a minute)")
-            self.run_speed_test()
-            print("    Initial speedtest complete.")
-            self.start_speedtest_worker()
+                self.policy.sync(full=True) # Fresh tc tree: re-apply every effective limit
+            # The initial speed test (up to 90s) runs on the worker: shaping starts at the
+            # last known capacity and the root rate is updated when the test finishes
+            self.start_speedtest_worker(run_now=True)
             return True
         else:
-            print(f"❌ Failed to start hotspot: {stderr}")
+            log.error(f"❌ Failed to start hotspot: {stderr}")
             return False
         
     def turn_off_hotspot(self):
         """Disable WiFi hotspot"""
-        print("🔄 Turning OFF hotspot...")
+        log.info("🔄 Turning OFF hotspot...")
         self._stop_speedtest_worker_thread() # Use renamed method
         self.cleanup_iptables_monitoring()
         self.cleanup_security_rules() # --- NEW ---
@@ -894,74 +1619,91 @@ class HotspotManager:
         # QUOTA: Clear last raw bytes on hotspot off
         self.last_raw_bytes.clear()
         self.manual_device_limits.clear() # Clear truth dict
-        print("✅ Hotspot is now OFF")
+        log.info("✅ Hotspot is now OFF")
         return True
 
     def run_speed_test(self):
         """Runs speedtest-cli and updates the total bandwidth"""
-        print("\n🚀 [Speedtest] Starting internet speed test... (this may take a minute)")
+        speed_log.info("🚀 [Speedtest] Starting internet speed test... (this may take a minute)")
+        SPEEDTEST_RUNNING.inc()
         try:
             stdout, stderr, code = self.run_command(['speedtest-cli', '--json'], timeout=90)
-            if code != 0: print(f"      ❌ [Speedtest] Failed. Error: {stderr}"); return
+            if code != 0: speed_log.error(f"❌ [Speedtest] Failed. Error: {stderr}"); SPEEDTEST_FAILURES.inc(); return
             results = json.loads(stdout)
             download_kbps = results.get('download', 0) / 1000.0
             upload_kbps = results.get('upload', 0) / 1000.0
-            if download_kbps == 0: print("      ⚠️ [Speedtest] Got 0 download speed. Will retry."); return
+            if download_kbps == 0: speed_log.warning("⚠️ [Speedtest] Got 0 download speed. Will retry."); SPEEDTEST_FAILURES.inc(); return
             with self.speedtest_lock:
                 self.available_download_kbps = download_kbps
                 self.available_upload_kbps = upload_kbps
                 self.last_speedtest_time = time.time()
-            print(f"      ✅ [Speedtest] Complete. New capacity: ↓ {self.available_download_kbps:.0f} Kbps | ↑ {self.available_upload_kbps:.0f} Kbps")
+            SPEEDTEST_LAST_SUCCESS.set(self.last_speedtest_time)
+            AVAILABLE_BANDWIDTH.set(download_kbps, direction="download"); AVAILABLE_BANDWIDTH.set(upload_kbps, direction="upload")
+            speed_log.info(f"✅ [Speedtest] Complete. New capacity: ↓ {self.available_download_kbps:.0f} Kbps | ↑ {self.available_upload_kbps:.0f} Kbps")
             self.update_root_tc_limits()
-        except subprocess.TimeoutExpired: print("      ❌ [Speedtest] Timed out.")
-        except json.JSONDecodeError: print("      ❌ [Speedtest] Failed to parse JSON.")
-        except Exception as e: print(f"      ❌ [Speedtest] An error occurred: {e}")
+        except subprocess.TimeoutExpired: speed_log.error("❌ [Speedtest] Timed out."); SPEEDTEST_FAILURES.inc()
+        except json.JSONDecodeError: speed_log.error("❌ [Speedtest] Failed to parse JSON."); SPEEDTEST_FAILURES.inc()
+        except Exception as e: speed_log.error(f"❌ [Speedtest] An error occurred: {e}"); SPEEDTEST_FAILURES.inc()
+        finally: SPEEDTEST_RUNNING.dec()
 
     def update_root_tc_limits(self):
         """Updates the root TC classes with new speedtest values"""
         if not self.bandwidth_limiter.tc_initialized: return
-        print("      🔄 [TC Update] Applying new speedtest results to root qdisc...")
+        log.debug("🔄 [TC Update] Applying new speedtest results to root qdisc...")
         with self.speedtest_lock: dl_kbps = int(self.available_download_kbps); ul_kbps = int(self.available_upload_kbps)
-        self.bandwidth_limiter.run_command(['tc', 'class', 'change', 'dev', self.interface,'parent', '1:', 'classid', '1:1', 'htb','rate', f'{dl_kbps}kbit', 'burst', '15k'])
-        self.bandwidth_limiter.run_command(['tc', 'class', 'change', 'dev', self.bandwidth_limiter.ifb_device,'parent', '2:', 'classid', '2:1', 'htb','rate', f'{ul_kbps}kbit', 'burst', '15k'])
-        print("      ✅ [TC Update] Root qdisc capacity updated.")
+        with self.policy.apply_lock: self.bandwidth_limiter.set_root_rate(dl_kbps, ul_kbps) # Runs on the speedtest thread, beside command syncs
+        log.info("✅ [TC Update] Root qdisc capacity updated.")
 
-    def _speedtest_worker(self):
-        """Background thread worker to run speedtests periodically"""
+    def _speedtest_worker(self, run_now=False):
+        """Background thread worker to run speedtests periodically ('run_now': one right away)"""
         while not self.stop_speedtest_worker.is_set():
             now = time.time()
-            if now - self.last_speedtest_time > self.speedtest_interval:
+            if run_now or now - self.last_speedtest_time > self.speedtest_interval:
+                run_now = False
                 Thread(target=self.run_speed_test, daemon=True).start()
             self.stop_speedtest_worker.wait(30)
 
-    def start_speedtest_worker(self):
+    def start_speedtest_worker(self, run_now=False):
         """Starts the background speedtest worker thread"""
-        print("Starting background speedtest worker...")
+        speed_log.info("Starting background speedtest worker...")
         self.stop_speedtest_worker.clear()
         # --- *** THIS IS THE FIX *** ---
-        self.speedtest_thread = Thread(target=self._speedtest_worker, daemon=True)
+        self.speedtest_thread = Thread(target=self._speedtest_worker, args=(run_now,), daemon=True)
         # --- *** END OF FIX *** ---
         self.speedtest_thread.start()
 
     # --- MODIFIED: Renamed method ---
     def _stop_speedtest_worker_thread(self): # Renamed this method
         """Stops the background speedtest thread"""
-        print("Stopping background speedtest worker...")
+        speed_log.info("Stopping background speedtest worker...")
         self.stop_speedtest_worker.set() # Set the Event flag
         if self.speedtest_thread and self.speedtest_thread.is_alive():
             self.speedtest_thread.join(timeout=2)
-        print("      Stopped.")
+        speed_log.debug("Stopped.")
 
     def get_hotspot_ip_range(self):
         """Get the IP address range of the hotspot interface"""
         stdout, _, _ = self.run_command(['ip', 'addr', 'show', self.interface])
         match = re.search(r'inet (\d+\.\d+\.\d+\.\d+)/(\d+)', stdout)
         if match:
-            ip = match.group(1); cidr = match.group(2); ip_parts = ip.split('.')
-            network = f"{ip_parts[0]}.{ip_parts[1]}.{ip_parts[2]}"
-            return ip, cidr, network
+            ip = match.group(1); cidr = match.group(2)
+            return ip, cidr, ipaddress.ip_network(f"{ip}/{cidr}", strict=False) # The real prefix, not just /24
         return None, None, None
 
+    def get_interface_networks(self):
+        """{interface: (ip, cidr, ip_network)} of the managed interfaces that have an IPv4 address (one 'ip addr' call)."""
+        stdout, _, _ = self.run_command(['ip', '-4', '-o', 'addr', 'show'], check=False)
+        networks = {}
+        for line in stdout.splitlines():
+            match = re.match(r'\d+:\s+(\S+)\s+inet (\d+\.\d+\.\d+\.\d+)/(\d+)', line)
+            if match and match.group(1) in self.interfaces and match.group(1) not in networks:
+                ip, cidr = match.group(2), match.group(3)
+                networks[match.group(1)] = (ip, cidr, ipaddress.ip_network(f"{ip}/{cidr}", strict=False))
+        if networks != self.interface_networks:
+            self.network_index = self.bandwidth_limiter.network_index = PrefixIndex((network, name) for name, (_, _, network) in networks.items())
+        self.interface_networks = networks
+        return networks
+
     def get_dhcp_leases(self):
         """Get DHCP leases from dnsmasq or NetworkManager"""
         devices = {}
@@ -980,16 +1722,71 @@ class HotspotManager:
         # This will only ping IPv4 addresses from the DHCP lease list
         if ':' in ip:
             return False # We are not currently tracking IPv6 clients actively
-        return subprocess.run(['ping', '-c', '1', '-W', '1', ip],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL).returncode == 0
+        return run_subprocess(['ping', '-c', '1', '-W', '1', ip],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL).returncode == 0
+
+    def _account_quota(self, key, rx_delta, tx_delta, now):
+        """
+        Adds this tick's usage to the quota of 'key' (a device IP or a "group:<id>" key),
+        handles period resets and throttling via the 'quota' policy layer.
+        Returns (status_str, seconds_elapsed_in_period).
+        """
+        quota = self.device_quotas[key]
+        is_throttled = quota.setdefault('is_throttled', False)
+        time_elapsed = now - quota['start_time']
+
+        # Check if period expired
+        if time_elapsed >= quota['period_seconds']:
+            quota_log.info(f"🔄 Quota period reset for {key}")
+            
+            if is_throttled:
+                quota_log.debug(f"Removing throttle for {key}.")
+                quota['is_throttled'] = False
+                is_throttled = False
+                self.policy.clear('quota', key) # Lower layers (schedule/manual) take over
+                
+            quota['start_time'] = now
+            quota['used_dl_bytes'] = 0
+            quota['used_ul_bytes'] = 0
+            time_elapsed = 0
+            quota['used_dl_bytes'] += rx_delta
+            quota['used_ul_bytes'] += tx_delta
+        else:
+            quota['used_dl_bytes'] += rx_delta
+            quota['used_ul_bytes'] += tx_delta
+
+        # Check if exceeded within the current period
+        exceeded_dl = quota['used_dl_bytes'] >= quota['limit_dl_bytes']
+        exceeded_ul = quota['used_ul_bytes'] >= quota['limit_ul_bytes']
+        
+        if exceeded_dl or exceeded_ul:
+            status = "🚫 Throttled"
+            if not is_throttled:
+                quota_log.error(f"🚨 Quota exceeded for {key}! Applying 8Kbps throttle.")
+                quota['is_throttled'] = True
+            self.policy.set('quota', key, QUOTA_THROTTLE_LIMIT) # No-op for the engine if already set
+        else:
+            if is_throttled:
+                quota_log.info(f"✅ Quota no longer exceeded for {key}. Removing throttle.")
+                quota['is_throttled'] = False
+            self.policy.clear('quota', key)
+                
+            status = "✅ OK"
+        return status, time_elapsed
 
     # QUOTA: Heavily modified to calculate deltas and update quotas
     def get_connected_devices_with_bandwidth(self):
         """Get connected devices with bandwidth information - HYBRID + QUOTA"""
-        hotspot_ip, cidr, network = self.get_hotspot_ip_range()
-        if not hotspot_ip: return [], hotspot_ip, network
+        # One pass over all managed interfaces: one address, neighbour, lease and iptables dump each
+        networks = self.get_interface_networks()
+        hotspot_ip, cidr, network = networks.get(self.interface, (None, None, None))
+        if not networks: return [], hotspot_ip, network
+        own_ips = {ip for ip, _, _ in networks.values()}
+        limiters = self.bandwidth_limiter
+        if limiters.primary.tc_initialized and not limiters.tc_initialized: # A served interface (re)appeared
+            limiters.setup_tc_qdisc(self.available_download_kbps, self.available_upload_kbps, missing_only=True)
 
         dhcp_devices = self.get_dhcp_leases()
-        stdout, _, _ = self.run_command(['ip', 'neigh', 'show', 'dev', self.interface])
+        stdout, _, _ = self.run_command(['ip', 'neigh', 'show'])
         
         current_devices_arp = {}
         for line in stdout.split('\n'):
@@ -998,21 +1795,26 @@ class HotspotManager:
                 if len(parts) >= 5:
                     ip = parts[0]; mac = parts[4] if parts[3] == 'lladdr' else 'N/A'
                     status = parts[-1] if len(parts) > 5 else 'UNKNOWN'
-                    # Only track IPv4 clients from our network
-                    if ip != hotspot_ip and ip.startswith(network) and ':' not in ip:
-                        current_devices_arp[ip] = {'ip': ip, 'mac': mac, 'arp_status': status, 'hostname': 'Unknown', 'active': False}
+                    # Only track IPv4 clients from our networks, seen on the interface of that network
+                    interface = limiters.interface_for(ip) if ':' not in ip else None
+                    if ip not in own_ips and interface and parts[1:3] == ['dev', interface]:
+                        current_devices_arp[ip] = {'ip': ip, 'mac': mac, 'arp_status': status, 'hostname': 'Unknown', 'active': False, 'interface': interface}
 
         # Combine ARP and DHCP, prioritizing DHCP for hostname/MAC
         combined_devices = current_devices_arp.copy()
         for ip, dev in dhcp_devices.items():
-            if ip != hotspot_ip and ip.startswith(network) and ':' not in ip:
+            interface = limiters.interface_for(ip) if ':' not in ip else None
+            if ip not in own_ips and interface:
                 if ip in combined_devices:
                     combined_devices[ip]['hostname'] = dev['hostname']
                     combined_devices[ip]['mac'] = dev['mac'] # DHCP MAC might be more reliable
                 else: # Device in DHCP but not ARP yet? Add it.
-                    combined_devices[ip] = {'ip': ip,'mac': dev['mac'],'arp_status': 'DHCP_ONLY','hostname': dev['hostname'],'active': False}
+                    combined_devices[ip] = {'ip': ip,'mac': dev['mac'],'arp_status': 'DHCP_ONLY','hostname': dev['hostname'],'active': False,'interface': interface}
 
         device_list = list(combined_devices.values())
+        self.apply_device_groups(device_list)
+        member_group = {ip: group_id for group_id, group in self.bandwidth_limiter.groups.items() for ip in group['members']}
+        group_usage = defaultdict(lambda: [0, 0]) # {group_id: [rx, tx]} this pass
         
         # Check activity and add to iptables monitoring
         threads = []
@@ -1025,7 +1827,7 @@ class HotspotManager:
 
         # Fetch raw byte counts NOW
         tc_raw_stats = self.bandwidth_limiter.get_tc_stats()
-        iptables_raw_stats = self.get_iptables_stats(network)
+        iptables_raw_stats = self.get_iptables_stats(self.network_index)
         
         now = time.time()
         
@@ -1051,7 +1853,12 @@ class HotspotManager:
                     current_raw_tx = iptables_raw_stats[ip].get('tx', 0)
 
             # --- Calculate Deltas for Quota ---
-            last_rx, last_tx = self.last_raw_bytes.get(ip, {'rx': 0, 'tx': 0}).values()
+            # A class added or removed (policy sync, adaptive engage/release) switches the device between its
+            # tc class counter and the iptables one: start from the new counter instead of charging its lifetime
+            source = ('tc', current_limit.get('class_id')) if device['has_current_limit'] else ('iptables', None)
+            last = self.last_raw_bytes.get(ip, {'rx': 0, 'tx': 0})
+            if last.get('source', source) != source: last = {'rx': current_raw_rx, 'tx': current_raw_tx}
+            last_rx, last_tx = last['rx'], last['tx']
             
             rx_delta = current_raw_rx - last_rx
             tx_delta = current_raw_tx - last_tx
@@ -1061,7 +1868,7 @@ class HotspotManager:
             if tx_delta < 0: tx_delta = current_raw_tx
 
             # Update last raw bytes for next calculation
-            self.last_raw_bytes[ip] = {'rx': current_raw_rx, 'tx': current_raw_tx}
+            self.last_raw_bytes[ip] = {'rx': current_raw_rx, 'tx': current_raw_tx, 'source': source}
 
             # --- Update Trackers (for speed/session totals) ---
             tracker = self.tc_tracker if device['has_current_limit'] else self.iptables_tracker
@@ -1075,6 +1882,9 @@ class HotspotManager:
             device['session_duration'] = now - stats['first_seen']
             device['rx_delta_bytes'] = rx_delta
             device['tx_delta_bytes'] = tx_delta
+            device['group_id'] = member_group.get(ip)
+            if device['group_id'] is not None:
+                group_usage[device['group_id']][0] += rx_delta; group_usage[device['group_id']][1] += tx_delta
 
             # --- Update and Check Quota ---
             device['quota_status'] = "N/A"
@@ -1086,68 +1896,7 @@ class HotspotManager:
 
             if ip in self.device_quotas:
                 quota = self.device_quotas[ip]
-                is_throttled = quota.setdefault('is_throttled', False)
-                time_elapsed = now - quota['start_time']
-
-                # Check if period expired
-                if time_elapsed >= quota['period_seconds']:
-                    print(f"🔄 Quota period reset for {ip}")
-                    
-                    if is_throttled:
-                        print(f"      Removing throttle for {ip}.")
-                        quota['is_throttled'] = False
-                        
-                        # --- MODIFIED: Read from "truth" dict ---
-                        manual_limit = self.manual_device_limits.get(ip)
-                        if manual_limit:
-                            print(f"      Restoring manual limit for {ip}.")
-                            self.bandwidth_limiter.add_device_limit(
-                                ip, manual_limit['download'], manual_limit['upload'], manual_limit['priority']
-                            )
-                        else:
-                            print(f"      No manual limit for {ip}. Removing all limits.")
-                            self.bandwidth_limiter.remove_device_limit(ip)
-                        # --- End of MODIFIED ---
-                        
-                    quota['start_time'] = now
-                    quota['used_dl_bytes'] = 0
-                    quota['used_ul_bytes'] = 0
-                    time_elapsed = 0
-                    quota['used_dl_bytes'] += rx_delta
-                    quota['used_ul_bytes'] += tx_delta
-                else:
-                    quota['used_dl_bytes'] += rx_delta
-                    quota['used_ul_bytes'] += tx_delta
-
-                # Check if exceeded within the current period
-                exceeded_dl = quota['used_dl_bytes'] >= quota['limit_dl_bytes']
-                exceeded_ul = quota['used_ul_bytes'] >= quota['limit_ul_bytes']
-                
-                if exceeded_dl or exceeded_ul:
-                    device['quota_status'] = "🚫 Throttled"
-                    if not is_throttled:
-                        print(f"🚨 Quota exceeded for {ip}! Applying 8Kbps throttle.")
-                        self.bandwidth_limiter.add_device_limit(ip, 8, 8, 0)
-                        quota['is_throttled'] = True
-                else:
-                    if is_throttled:
-                        print(f"✅ Quota no longer exceeded for {ip}. Removing throttle.")
-                        quota['is_throttled'] = False
-                        
-                        # --- MODIFIED: Read from "truth" dict ---
-                        manual_limit = self.manual_device_limits.get(ip)
-                        if manual_limit:
-                            print(f"      Restoring manual limit for {ip}.")
-                            self.bandwidth_limiter.add_device_limit(
-                                ip, manual_limit['download'], manual_limit['upload'], manual_limit['priority']
-                            )
-                        else:
-                            print(f"      No manual limit for {ip}. Removing all limits.")
-                            self.bandwidth_limiter.remove_device_limit(ip)
-                        # --- End of MODIFIED ---
-                        
-                    device['quota_status'] = "✅ OK"
-                
+                device['quota_status'], time_elapsed = self._account_quota(ip, rx_delta, tx_delta, now)
                 device['quota_dl_used_bytes'] = quota['used_dl_bytes']
                 device['quota_ul_used_bytes'] = quota['used_ul_bytes']
                 device['quota_dl_limit_bytes'] = quota['limit_dl_bytes']
@@ -1168,6 +1917,14 @@ class HotspotManager:
                 device['priority'] = None
             # --- End of MODIFIED ---
 
+        # --- Group quotas: every member's usage counts against the group's quota ---
+        for key in [k for k in self.device_quotas if parse_group_key(k) is not None]:
+            rx, tx = group_usage.get(parse_group_key(key), (0, 0))
+            self._account_quota(key, rx, tx, now)
+
+        # Push throttle changes from this pass (only devices whose effective limit changed)
+        if self.policy.dirty: self.policy.sync()
+
         return device_list, hotspot_ip, network
 
     # QUOTA: Modified display
@@ -1197,7 +1954,7 @@ class HotspotManager:
 
             print(f"✅ Hotspot: {self.ssid} | Interface: {self.interface}")
             devices, hotspot_ip, network = self.get_connected_devices_with_bandwidth()
-            if hotspot_ip: print(f"🌐 Network: {network}.0/24 | Gateway: {hotspot_ip}")
+            if hotspot_ip: print(f"🌐 Network: {network} | Gateway: {hotspot_ip}")
             
             with self.speedtest_lock: dl_kbps = self.available_download_kbps; ul_kbps = self.available_upload_kbps
             print(f"⚡ ISP Capacity: ↓ {dl_kbps:.0f} Kbps | ↑ {ul_kbps:.0f} Kbps")
@@ -1297,7 +2054,7 @@ class HotspotManager:
             self.last_raw_bytes.clear()
             devices, hotspot_ip, network = self.get_connected_devices_with_bandwidth()
             
-            if hotspot_ip: print(f"      Gateway IP: {hotspot_ip}"); print(f"      Network: {network}.0/24")
+            if hotspot_ip: print(f"      Gateway IP: {hotspot_ip}"); print(f"      Network: {network}")
             
             print("\n" + "=" * width)
             header = "{:<12} {:<16} {:<20} {:<6} {:<12} {:<12} {:<15} {:<20} {:<20} {:<10}"
@@ -1382,11 +2139,9 @@ class HotspotManager:
                             self.tc_tracker.reset_device(device['ip'])
                             self.iptables_tracker.reset_device(device['ip'])
                             
-                            # Apply to TC
-                            if self.bandwidth_limiter.add_device_limit(device['ip'], dl_k, ul_k, prio):
-                                # --- NEW: Save to "truth" dict ---
-                                self.manual_device_limits[device['ip']] = {'download': dl_k, 'upload': ul_k, 'priority': prio}
-                                # --- End of NEW ---
+                            # Save to "truth" dict, then apply to TC
+                            self.manual_device_limits[device['ip']] = {'download': dl_k, 'upload': ul_k, 'priority': prio}
+                            if self.policy.sync().get(device['ip'], True):
                                 print(f"\n✅ SUCCESS! Limit: ↓{dl_k}K | ↑{ul_k}K | Prio: {prio}")
                             else: print("❌ Failed to set limit")
                         except ValueError: print("❌ Invalid input (numbers only, prio 0-7).")
@@ -1402,10 +2157,8 @@ class HotspotManager:
                         self.tc_tracker.reset_device(device['ip'])
                         self.iptables_tracker.reset_device(device['ip'])
                         
-                        if self.bandwidth_limiter.remove_device_limit(device['ip']):
-                            # --- NEW: Remove from "truth" dict ---
-                            self.manual_device_limits.pop(device['ip'], None)
-                            # --- End of NEW ---
+                        self.manual_device_limits.pop(device['ip'], None)
+                        if self.policy.sync().get(device['ip'], True):
                             print(f"✅ Limit removed from {device['ip']}")
                         else: print(f"ℹ️ Limit removal command sent for {device['ip']} (may not have existed)")
                     else: print("❌ Invalid device number")
@@ -1419,30 +2172,22 @@ class HotspotManager:
                 try:
                     dl_k=int(dl); ul_k=int(ul); prio=int(p_str) if p_str else 5
                     if not 0 <= prio <= 7: raise ValueError("Invalid priority")
-                    count = 0
                     for dev in devices_sorted:
                         self.tc_tracker.reset_device(dev['ip']); self.iptables_tracker.reset_device(dev['ip'])
-                        if self.bandwidth_limiter.add_device_limit(dev['ip'], dl_k, ul_k, prio):
-                            # --- NEW: Save to "truth" dict ---
-                            self.manual_device_limits[dev['ip']] = {'download': dl_k, 'upload': ul_k, 'priority': prio}
-                            # --- End of NEW ---
-                            count += 1
+                        self.manual_device_limits[dev['ip']] = {'download': dl_k, 'upload': ul_k, 'priority': prio}
+                    results = self.policy.sync()
+                    count = sum(1 for dev in devices_sorted if results.get(dev['ip'], True))
                     print(f"✅ Limit applied to {count}/{len(devices_sorted)} devices")
                 except ValueError: print("❌ Invalid input.")
                 input("\nPress Enter...")
             elif choice == '4':
                 if input("Remove ALL limits? (yes/no): ").strip().lower() == 'yes':
-                    count = 0; 
-                    # --- MODIFIED: Iterate over "truth" dict ---
                     all_lims = list(self.manual_device_limits.keys())
                     for ip in all_lims:
-                    # --- End of MODIFIED ---
                         self.tc_tracker.reset_device(ip); self.iptables_tracker.reset_device(ip)
-                        if self.bandwidth_limiter.remove_device_limit(ip):
-                            # --- NEW: Remove from "truth" dict ---
-                            self.manual_device_limits.pop(ip, None)
-                            # --- End of NEW ---
-                            count += 1
+                    self.manual_device_limits.clear()
+                    results = self.policy.sync()
+                    count = sum(1 for ip in all_lims if results.get(ip, True))
                     print(f"✅ Removed limits for {count} devices")
                 else: print("❌ Cancelled")
                 input("\nPress Enter...")
@@ -1527,18 +2272,6 @@ class HotspotManager:
                             if dl_limit_bytes <= 0 or ul_limit_bytes <=0 or period_seconds <= 0:
                                 raise ValueError("Limits and time must be positive.")
 
-                            # --- MODIFIED: Restore from "truth" dict ---
-                            manual_limit = self.manual_device_limits.get(ip)
-                            if manual_limit:
-                                print(f"      Restoring manual limit for {ip} before applying quota.")
-                                self.bandwidth_limiter.add_device_limit(
-                                    ip, manual_limit['download'], manual_limit['upload'], manual_limit['priority']
-                                )
-                            else:
-                                print(f"      No manual limit for {ip}. Removing any existing (throttle) limits.")
-                                self.bandwidth_limiter.remove_device_limit(ip)
-                            # --- End of MODIFIED ---
-
                             self.device_quotas[ip] = {
                                 'limit_dl_bytes': dl_limit_bytes,
                                 'limit_ul_bytes': ul_limit_bytes,
@@ -1549,6 +2282,8 @@ class HotspotManager:
                                 'is_throttled': False
                             }
                             self.last_raw_bytes.pop(ip, None)
+                            # A fresh quota is never throttled: the manual limit (if any) takes over again
+                            self.refresh_quota_policy(); self.policy.sync()
 
                             print(f"\n✅ Quota set for {ip}: ↓{self.format_bytes(dl_limit_bytes)} | ↑{self.format_bytes(ul_limit_bytes)} | Period: {format_seconds(period_seconds)}")
 
@@ -1572,21 +2307,10 @@ class HotspotManager:
                         device = devices_sorted[dev_idx]
                         ip = device['ip']
                         
-                        # --- MODIFIED: Restore from "truth" dict ---
-                        manual_limit = self.manual_device_limits.get(ip)
-                        if manual_limit:
-                            print(f"      Restoring manual limit for {ip} after removing quota.")
-                            self.bandwidth_limiter.add_device_limit(
-                                ip, manual_limit['download'], manual_limit['upload'], manual_limit['priority']
-                            )
-                        else:
-                            print(f"      No manual limit for {ip}. Removing any existing (throttle) limits.")
-                            self.bandwidth_limiter.remove_device_limit(ip)
-                        # --- End of MODIFIED ---
-                        
                         if ip in self.device_quotas:
                             del self.device_quotas[ip]
                             self.last_raw_bytes.pop(ip, None)
+                            self.refresh_quota_policy(); self.policy.sync() # Restores the manual limit, if any
                             print(f"✅ Quota removed for {ip}.")
                         else:
                             print(f"ℹ️ No quota was set for {ip}.")
@@ -1659,7 +2383,7 @@ class HotspotManager:
 
     def setup_internet_sharing(self, internet_interface):
         """Setup NAT for internet sharing"""
-        print(f"\n🌐 Setting up internet sharing from {internet_interface}...")
+        fw_log.info(f"🌐 Setting up internet sharing from {internet_interface}...")
         
         # --- IPv4 NAT ---
         self.run_command(['iptables', '-t', 'nat', '-F', 'POSTROUTING'], check=False)
@@ -1680,7 +2404,7 @@ class HotspotManager:
         self.run_command(['ip6tables', '-A', 'FORWARD','-i', internet_interface, '-o', self.interface,'-m', 'state', '--state', 'RELATED,ESTABLISHED', '-j', 'ACCEPT'])
         # --- *** END NEW *** ---
 
-        print(f"✅ Internet sharing enabled from {internet_interface} to {self.interface} (IPv4 & IPv6)")
+        fw_log.info(f"✅ Internet sharing enabled from {internet_interface} to {self.interface} (IPv4 & IPv6)")
         _, _, network = self.get_hotspot_ip_range()
         if network: 
             self.setup_iptables_monitoring(network)
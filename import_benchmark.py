@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Cold-start import benchmark.
+
+Imports each entry point in a fresh interpreter under `python -X importtime`,
+repeats that a few times and reports the median total import time plus the
+modules that cost the most (self time). Heavy dependencies (pandas, prophet,
+redis, channels_redis) are imported where they are used, so none of them
+should show up here.
+
+Example:
+    python3 import_benchmark.py
+    python3 import_benchmark.py --modules web_daemon --max-ms 150   # exits 1 over budget
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# --- Configuration ---
+DEFAULT_MODULES = ['web_daemon', 'cli', 'hotspot_manager_core', 'model_trainer']
+DEFAULT_RUNS = 5
+DEFAULT_TOP = 8
+DEFAULT_BUDGET_MS = 250           # Per entry point, median of the runs
+HEAVY_MODULES = ('pandas', 'prophet', 'redis', 'channels_redis', 'numpy')  # Must not be imported at startup
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def parse_importtime(stderr):
+    """[(module, self us, cumulative us, depth)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match: rows.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return rows
+
+def measure(module, cwd):
+    """One fresh interpreter: (total ms of the top-level imports, {module: self us})."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit {result.returncode}")
+    rows = parse_importtime(result.stderr)
+    total_us = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+    return total_us / 1000, {name: self_us for name, self_us, _, _ in rows}
+
+def benchmark_module(module, args, cwd):
+    row = {'module': module}
+    try:
+        runs = [measure(module, cwd) for _ in range(args.runs)]
+    except RuntimeError as e:
+        row['error'] = str(e); return row
+    row['median_ms'] = statistics.median(total for total, _ in runs)
+    row['min_ms'] = min(total for total, _ in runs)
+    self_times = {}
+    for _, modules in runs:
+        for name, self_us in modules.items(): self_times.setdefault(name, []).append(self_us)
+    row['modules'] = len(self_times)
+    row['top'] = sorted(((name, statistics.median(times) / 1000) for name, times in self_times.items()), key=lambda item: item[1], reverse=True)[:args.top]
+    row['heavy'] = sorted(name for name in self_times if name.split('.')[0] in HEAVY_MODULES)
+    return row
+
+def print_report(report):
+    print("\n" + "=" * 90)
+    print(f"{'Entry point':<24} {'Median ms':>10} {'Min ms':>9} {'Modules':>8}  Heaviest (self ms)")
+    print("-" * 90)
+    for row in report:
+        if 'error' in row:
+            print(f"{row['module']:<24} ERROR: {row['error']}"); continue
+        heaviest = ", ".join(f"{name} {ms:.1f}" for name, ms in row['top'][:3])
+        print(f"{row['module']:<24} {row['median_ms']:>10.1f} {row['min_ms']:>9.1f} {row['modules']:>8}  {heaviest}")
+        for name, ms in row['top'][3:]: print(f"{'':<55}{name} {ms:.1f}")
+    print("=" * 90)
+
+def check_budgets(report, args):
+    """Returns a list of budget violations (empty if everything is within budget)."""
+    failures = []
+    for row in report:
+        if 'error' in row:
+            failures.append(f"{row['module']}: import failed ({row['error']})"); continue
+        if args.max_ms is not None and row['median_ms'] > args.max_ms:
+            failures.append(f"{row['module']}: {row['median_ms']:.0f}ms > {args.max_ms:.0f}ms")
+        if row['heavy']:
+            failures.append(f"{row['module']}: imports {', '.join(row['heavy'])} at startup")
+    return failures
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time of the hotspot entry points.")
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES, help="Modules to import (run from the project directory)")
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help="Fresh interpreters per module (the median is reported)")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help="Slowest modules (self time) listed per entry point")
+    parser.add_argument('--max-ms', type=float, default=DEFAULT_BUDGET_MS, help="Fail if a median import time exceeds this")
+    parser.add_argument('--json', dest='json_out', help="Also write the report as JSON to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    report = [benchmark_module(module, args, cwd) for module in args.modules]
+
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, 'w') as f: json.dump(report, f, indent=2)
+        print(f"Report written to {args.json_out}")
+
+    failures = check_budgets(report, args)
+    if failures:
+        print("\n❌ Budget violations:")
+        for failure in failures: print(f"  - {failure}")
+        return 1
+    print("\n✅ All entry points within budget.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
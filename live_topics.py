@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import time
+from delta_publisher import DeltaPublisher
+from hotspot_logging import get_logger
+
+log = get_logger("live")
+
+# --- Configuration ---
+LIVE_INTERVALS = (1, 2, 5, 10, 30)   # Update intervals (seconds) a subscriber can get; requests round up
+HEARTBEAT_SECONDS = 10               # Daemon heartbeat: consumers renew their subscriptions on it
+SUBSCRIPTION_TTL = 3 * HEARTBEAT_SECONDS + 5  # Subscriptions of consumers that stopped renewing expire
+INTERVAL_SLACK = 0.5                 # The main loop tick drifts a little; don't skip a beat for it
+
+PERIODIC_TOPICS = ('summary', 'devices')   # Plus 'device:<ip>', built every interval
+EVENT_TOPICS = ('security', 'forecast')    # Pushed when they change, interval ignored
+DEVICE_TOPIC_PREFIX = 'device:'
+
+
+def valid_topic(topic):
+    if not isinstance(topic, str): return False
+    if topic.startswith(DEVICE_TOPIC_PREFIX): return len(topic) > len(DEVICE_TOPIC_PREFIX)
+    return topic in PERIODIC_TOPICS or topic in EVENT_TOPICS
+
+
+def quantize_interval(seconds):
+    """Rounds a requested minimum interval up to the nearest supported one."""
+    try: seconds = float(seconds)
+    except (TypeError, ValueError): return LIVE_INTERVALS[0]
+    for interval in LIVE_INTERVALS:
+        if seconds <= interval: return interval
+    return LIVE_INTERVALS[-1]
+
+
+def stream_name(topic, interval):
+    """Identifies one (topic, rate) stream; event topics have a single stream."""
+    return topic if topic in EVENT_TOPICS else f"{topic}@{interval}"
+
+
+def stream_group(stream):
+    """Channel layer group of a stream (group names allow only [a-zA-Z0-9_.-])."""
+    return "live." + stream.replace(':', '-').replace('@', '.')
+
+
+class DemandRegistry:
+    """
+    Which consumer channel wants which topics at which interval. Consumers send
+    their full subscription set (idempotent) whenever it changes and on every
+    heartbeat; sets that are not renewed expire, so a crashed consumer cannot
+    keep views alive forever.
+    """
+    def __init__(self):
+        self.subscriptions = {}   # { channel_name: {topic: interval} }
+        self.renewed = {}         # { channel_name: monotonic time of the last update }
+        self.client_stats = {}    # { channel_name: lag/drop metrics the consumer reported }
+
+    def update(self, channel_name, topics, now=None, stats=None):
+        """Replaces a channel's subscriptions. Returns the streams it did not have before."""
+        now = time.monotonic() if now is None else now
+        if stats: self.client_stats[channel_name] = stats
+        wanted = {}
+        for topic, interval in (topics or {}).items():
+            if valid_topic(topic): wanted[topic] = 0 if topic in EVENT_TOPICS else quantize_interval(interval)
+        before = {stream_name(t, i) for t, i in self.subscriptions.get(channel_name, {}).items()}
+        if wanted:
+            self.subscriptions[channel_name] = wanted
+            self.renewed[channel_name] = now
+        else:
+            self.drop(channel_name)
+        return {stream_name(t, i) for t, i in wanted.items()} - before
+
+    def drop(self, channel_name):
+        self.subscriptions.pop(channel_name, None)
+        self.renewed.pop(channel_name, None)
+        self.client_stats.pop(channel_name, None)
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        for channel_name in [c for c, t in self.renewed.items() if now - t > SUBSCRIPTION_TTL]:
+            log.info(f"📡 Subscriptions of {channel_name} expired")
+            self.drop(channel_name)
+
+    def idle(self):
+        return not self.subscriptions
+
+    def wants(self, topic):
+        return any(topic in topics for topics in self.subscriptions.values())
+
+    def streams(self):
+        """{(topic, interval)} of every periodic stream somebody is subscribed to."""
+        return {(t, i) for topics in self.subscriptions.values() for t, i in topics.items() if t not in EVENT_TOPICS}
+
+
+class LiveStreams:
+    """
+    One DeltaPublisher per demanded (topic, interval), so a client asking for an
+    update every 10s gets deltas against what it saw 10s ago. Streams nobody
+    wants any more are dropped (a new one starts with a fresh epoch).
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.publishers = {}   # { (topic, interval): DeltaPublisher }
+        self.last_sent = {}    # { (topic, interval): monotonic }
+
+    def publisher(self, topic, interval):
+        key = (topic, interval)
+        if key not in self.publishers:
+            self.publishers[key] = DeltaPublisher(topic=topic, stream=stream_name(topic, interval))
+        return self.publishers[key]
+
+    def due(self, now=None):
+        """Periodic streams to publish this tick, as (topic, interval) pairs."""
+        now = time.monotonic() if now is None else now
+        demanded = self.registry.streams()
+        for key in [k for k in self.publishers if k not in demanded]:
+            del self.publishers[key]; self.last_sent.pop(key, None)
+        due = []
+        for key in sorted(demanded):
+            if now - self.last_sent.get(key, float('-inf')) >= key[1] - INTERVAL_SLACK:
+                self.last_sent[key] = now
+                due.append(key)
+        return due
+
+    def snapshot_event(self, stream):
+        """Snapshot of one periodic stream (created empty if it does not exist yet)."""
+        topic, _, interval = stream.rpartition('@')
+        return self.publisher(topic, quantize_interval(interval)).snapshot_event()
@@ -182,8 +182,8 @@ async function startWebDaemon() {
 
         daemonProcess.stdout.on('data', (data) => {
             console.log(`Daemon: ${data}`);
-            if (data.toString().includes('Command listener started') || 
-                data.toString().includes('Data daemon running')) {
+            // The daemon prints its ready marker once it accepts commands
+            if (!hasStarted && data.toString().includes('HOTSPOT_DAEMON_READY')) {
                 hasStarted = true;
                 resolve();
             }
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import bisect
+import functools
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+# --- Configuration ---
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs: return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'): return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """One metric family; samples are keyed by label values (in the order of 'labels')."""
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.lock = Lock()   # Updated from the event loop and from asyncio.to_thread workers
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels): raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock: items = sorted(self.values.items()) or ([((), 0)] if not self.labels else [])
+        for key, value in items: lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock: self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock: self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock: self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None: counts = self.values[key] = [[0] * len(self.buckets), 0.0, 0] # per-bucket, sum, count
+            if index < len(self.buckets): counts[0][index] += 1
+            counts[1] += value; counts[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try: yield
+        finally: self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock: items = sorted((key, ([*counts[0]], counts[1], counts[2])) for key, counts in self.values.items())
+        for key, (buckets, total, count) in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, buckets):
+                cumulative += hits
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide metric families, rendered in the Prometheus text exposition
+    format. Declaring a metric twice returns the existing one, so modules can
+    declare what they use at import time.
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None: metric = self.metrics[name] = cls(name, help_text, labels, **kwargs)
+        if not isinstance(metric, cls): raise ValueError(f"{name} is already a {metric.kind}")
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        with self.lock: metrics = [self.metrics[name] for name in sorted(self.metrics)]
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# --- Shared hot-path metrics (used by several modules) ---
+SUBPROCESS_SECONDS = REGISTRY.histogram("hotspot_subprocess_seconds", "External command run time (spawn to exit), by binary.", ("binary",))
+SUBPROCESS_FAILURES = REGISTRY.counter("hotspot_subprocess_failures_total", "External commands that exited non-zero or timed out, by binary.", ("binary",))
+SQLITE_SECONDS = REGISTRY.histogram("hotspot_sqlite_seconds", "SQLite query time including connect/commit, by operation.", ("op", "query"))
+
+
+def timed_db(op):
+    """Decorator for the DB helper functions: records their latency as op='read'/'write', query=<function name>."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with SQLITE_SECONDS.time(op=op, query=func.__name__): return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class TimedChannelLayer:
+    """Wraps a channel layer to record send/group_send latency by message type; everything else passes through."""
+    def __init__(self, layer):
+        self.layer = layer
+        self.publish_seconds = REGISTRY.histogram("hotspot_channel_layer_publish_seconds", "Channel layer send/group_send latency, by call and message type.", ("call", "type"))
+
+    def __getattr__(self, name):
+        return getattr(self.layer, name)
+
+    async def send(self, channel, message):
+        with self.publish_seconds.time(call="send", type=message.get("type", "")): return await self.layer.send(channel, message)
+
+    async def group_send(self, group, message):
+        with self.publish_seconds.time(call="group_send", type=message.get("type", "")): return await self.layer.group_send(group, message)
+
+
+async def serve_metrics(host, port, registry=REGISTRY):
+    """Minimal HTTP server answering GET /metrics with the text exposition format."""
+    import asyncio # Only the daemon serves metrics; the CLI imports this module too
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)).strip(): pass # Headers are not needed
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split('?')[0] == "/metrics":
+                status, content_type, body = "200 OK", CONTENT_TYPE, registry.render().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError): pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
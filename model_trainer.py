@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 
 import sqlite3
-import pandas as pd
-from prophet import Prophet
 from datetime import datetime, timedelta
 import traceback
+# pandas and prophet take seconds to import: they are imported where they are used,
+# after the cheap checks (e.g. whether there is enough data to train at all)
 
 # --- Configuration ---
 DB_FILE = 'hotspot_usage.db'
@@ -14,6 +14,8 @@ AGGREGATION_MINUTES = 15
 TRAIN_DAYS = 14
 # We will predict 48 hours into the future
 PREDICT_HOURS = 48
+# Need a minimum amount of data to train
+MIN_TRAINING_POINTS = 100
 
 def init_db():
     """
@@ -120,6 +122,19 @@ def aggregate_data():
         if conn:
             conn.close()
 
+def fit_prophet_forecast(df, periods_to_predict):
+    """
+    Fits Prophet on a 'ds'/'y' dataframe and returns the forecast dataframe
+    (ds, yhat, yhat_lower, yhat_upper) extended by 'periods_to_predict' buckets.
+    """
+    from prophet import Prophet
+    # Prophet will automatically find daily and weekly patterns (seasonality)
+    m = Prophet(daily_seasonality=True, weekly_seasonality=True)
+    m.fit(df)
+    freq_str = f'{AGGREGATION_MINUTES}min' # e.g., '15min'
+    future_df = m.make_future_dataframe(periods=periods_to_predict, freq=freq_str)
+    return m.predict(future_df)
+
 def train_and_forecast():
     """
     Trains the Prophet model on the 'usage_summary' table
@@ -134,32 +149,26 @@ def train_and_forecast():
         # Load aggregated data for training
         # We rename columns to 'ds' (timestamp) and 'y' (value) as Prophet requires
         start_date = (datetime.now() - timedelta(days=TRAIN_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute("SELECT COUNT(*) FROM usage_summary WHERE timestamp > ?", (start_date,))
+        points = cursor.fetchone()[0]
+        if points < MIN_TRAINING_POINTS:
+            print(f"Not enough data to train (found {points} points). Need at least {MIN_TRAINING_POINTS}.")
+            print("Run your hotspot for a day or two and try again.")
+            return
+
+        import pandas as pd
         df = pd.read_sql_query(
             "SELECT timestamp as ds, total_rx_bytes as y FROM usage_summary WHERE timestamp > ?", 
             conn,
             params=(start_date,)
         )
 
-        if len(df) < 100: # Need a minimum amount of data to train
-            print(f"Not enough data to train (found {len(df)} points). Need at least 100.")
-            print("Run your hotspot for a day or two and try again.")
-            return
-
         print(f"Training Prophet model with {len(df)} data points...")
         
-        # Train the Prophet model
-        # Prophet will automatically find daily and weekly patterns (seasonality)
-        m = Prophet(daily_seasonality=True, weekly_seasonality=True)
-        m.fit(df)
-        
-        print("Training complete. Generating forecast...")
-
-        # Generate the forecast
+        # Train the Prophet model and generate the forecast
         periods_to_predict = int((PREDICT_HOURS * 60) / AGGREGATION_MINUTES)
-        freq_str = f'{AGGREGATION_MINUTES}min' # e.g., '15min'
-        
-        future_df = m.make_future_dataframe(periods=periods_to_predict, freq=freq_str)
-        forecast_df = m.predict(future_df)
+        forecast_df = fit_prophet_forecast(df, periods_to_predict)
+        print("Training complete. Forecast generated.")
         
         # Save the forecast to the database
         now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
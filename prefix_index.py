@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import ipaddress
+from bisect import bisect_right
+
+_NETWORK_TYPES = (ipaddress.IPv4Network, ipaddress.IPv6Network)
+_ADDRESS_TYPES = (ipaddress.IPv4Address, ipaddress.IPv6Address)
+
+
+def parse_network(value):
+    """An ip_network from a network, address or string ('10.0.0.5' -> 10.0.0.5/32; host bits are dropped)."""
+    if isinstance(value, _NETWORK_TYPES): return value
+    return ipaddress.ip_network(value, strict=False)
+
+
+def _last_address(network):
+    """int(network.broadcast_address) without the (slow) cached properties."""
+    return int(network.network_address) | ((1 << (network.max_prefixlen - network.prefixlen)) - 1)
+
+
+def collapse_networks(networks):
+    """
+    ipaddress.collapse_addresses() for one IP version, on integer intervals:
+    overlapping, nested and adjacent networks are merged and each merged range
+    is cut into the fewest CIDR blocks. Same result (in address order), several
+    times faster on large lists: networks that were not merged are reused.
+    """
+    intervals = sorted(((int(n.network_address), _last_address(n), n) for n in networks), key=lambda row: (row[0], -row[1]))
+    merged = []
+    for first, last, network in intervals:
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]: merged[-1][1] = last; merged[-1][2] = None # Grew past its network
+        else: merged.append([first, last, network])
+    collapsed = []
+    for first, last, network in merged:
+        if network is not None: collapsed.append(network); continue # Not merged with anything that grew it: keep the object
+        kind = type(intervals[0][2]); bits = intervals[0][2].max_prefixlen
+        while first <= last:
+            size = min((first & -first) or (1 << bits), 1 << ((last - first + 1).bit_length() - 1)) # Largest aligned block that fits
+            collapsed.append(kind((first, bits - size.bit_length() + 1)))
+            first += size
+    return collapsed
+
+
+class PrefixIndex:
+    """
+    Longest-prefix lookups over a set of networks (IPv4 and IPv6) as a sorted
+    interval list: each network is an integer [first, last] address range,
+    sorted by start, with its nearest enclosing network precomputed. CIDR
+    blocks are either nested or disjoint, so a lookup is one bisect plus a walk
+    up at most one nesting chain, whatever the number of networks.
+
+    Entries are networks or (network, value) pairs. Immutable: build a new
+    index when the networks change (n log n).
+    """
+    def __init__(self, entries=()):
+        rows = {4: [], 6: []}
+        for entry in entries:
+            network, value = entry if isinstance(entry, tuple) else (entry, None)
+            network = parse_network(network)
+            rows[network.version].append((int(network.network_address), _last_address(network), network, value))
+        self.tables = {}
+        for version, table in rows.items():
+            table.sort(key=lambda row: (row[0], -row[1])) # Enclosing networks before the ones inside them
+            parents = []; chain = []
+            for i, (first, last, _, _) in enumerate(table):
+                while chain and table[chain[-1]][1] < first: chain.pop()
+                parents.append(chain[-1] if chain else -1)
+                chain.append(i)
+            self.tables[version] = ([row[0] for row in table], [row[1] for row in table], parents, [(row[2], row[3]) for row in table])
+
+    def __len__(self):
+        return sum(len(starts) for starts, _, _, _ in self.tables.values())
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        """(network, value) pairs, IPv4 first, in address order."""
+        for version in (4, 6): yield from self.tables[version][3]
+
+    def networks(self):
+        return [network for network, _ in self]
+
+    def lookup(self, address):
+        """(network, value) of the most specific network containing 'address', or None (also for unparsable input)."""
+        if not isinstance(address, _ADDRESS_TYPES):
+            try: address = ipaddress.ip_address(address)
+            except ValueError: return None
+        starts, ends, parents, items = self.tables[address.version]
+        value = int(address)
+        i = bisect_right(starts, value) - 1
+        while i >= 0 and ends[i] < value: i = parents[i]
+        return items[i] if i >= 0 else None
+
+    def value(self, address, default=None):
+        found = self.lookup(address)
+        return found[1] if found else default
+
+    def __contains__(self, address):
+        return self.lookup(address) is not None
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import json
+import time
+from hotspot_logging import get_logger
+
+log = get_logger("readmodel")
+
+# --- Configuration ---
+READ_MODEL_PREFIX = "hotspot:read:"   # Must match monitor/consumers.py
+READ_MODEL_TTL = 60                   # Seconds a model outlives the daemon's last keep_alive() (crash, kill -9)
+
+
+class ReadModelPublisher:
+    """
+    Keeps versioned read models (device list, security state, schedules, groups,
+    forecast) in Redis hashes, so the dashboard consumers can answer request_*
+    messages without a round trip through the daemon's command queue.
+
+    Each hash holds the ready-to-send client message ('message'), a 'version'
+    that goes up on every change and the 'updated' time. Unchanged models are
+    not rewritten; keep_alive() renews their expiry instead, so the models of a
+    daemon that died without clear() vanish after READ_MODEL_TTL. Redis errors are reported and otherwise ignored: consumers
+    fall back to asking the daemon. Disabled (no-op) without Redis, e.g. on the
+    Unix socket channel layer. The Redis client is created (and imported) on
+    first use, so constructing a publisher at import time costs nothing.
+    """
+    def __init__(self, host='localhost', port=6379, enabled=True):
+        self.host = host
+        self.port = port
+        self.enabled = enabled
+        self.redis = None
+        self.last = {}   # { name: message text last written }
+        self.renewed = float('-inf') # monotonic time of the last keep_alive() round
+
+    def _client(self):
+        if self.redis is None and self.enabled:
+            import redis.asyncio as aioredis # Ships with channels_redis
+            self.redis = aioredis.Redis(host=self.host, port=self.port)
+        return self.redis
+
+    async def publish(self, name, message):
+        """Stores 'message' (a dict in the client's format) as read model 'name'. Returns True if it changed."""
+        if self._client() is None: return False
+        text = json.dumps(message)
+        if self.last.get(name) == text: return False
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hincrby(READ_MODEL_PREFIX + name, 'version', 1)
+                pipe.hset(READ_MODEL_PREFIX + name, mapping={'message': text, 'updated': time.time()})
+                pipe.expire(READ_MODEL_PREFIX + name, READ_MODEL_TTL)
+                await pipe.execute()
+        except Exception as e:
+            log.warning(f"⚠️ Read model '{name}' not published: {e}")
+            return False
+        self.last[name] = text
+        return True
+
+    async def keep_alive(self):
+        """Renews the expiry of every published model (call it every tick; it only talks to Redis every TTL/3)."""
+        now = time.monotonic()
+        if not self.last or now - self.renewed < READ_MODEL_TTL / 3: return
+        self.renewed = now
+        names = list(self.last)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for name in names: pipe.expire(READ_MODEL_PREFIX + name, READ_MODEL_TTL)
+                renewed = await pipe.execute()
+        except Exception as e:
+            log.warning(f"⚠️ Could not renew read models: {e}"); return
+        for name, alive in zip(names, renewed):
+            if not alive: self.last.pop(name, None) # Gone (expired, Redis restarted): the next publish() rewrites it
+
+    async def clear(self):
+        """Removes every read model (daemon shutdown: consumers go back to asking the daemon)."""
+        if not self.last: return
+        try:
+            await self.redis.delete(*(READ_MODEL_PREFIX + name for name in self.last))
+        except Exception as e:
+            log.warning(f"⚠️ Could not clear read models: {e}")
+        self.last = {}
+
+    async def close(self):
+        if self.redis is None: return
+        close = getattr(self.redis, 'aclose', None) or self.redis.close
+        await close()
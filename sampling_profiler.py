@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from hotspot_logging import get_logger
+
+# --- Configuration ---
+SAMPLE_INTERVAL = 0.01       # 100 Hz: a few hundred microseconds of work per second under load
+MAX_STACK_DEPTH = 64         # Deeper stacks keep their innermost frames
+MAX_STACKS = 50000           # Distinct folded stacks kept; the rest are counted as [truncated]
+DUMP_SIGNAL = getattr(signal, 'SIGUSR2', None)
+DUMP_DIR = os.environ.get("HOTSPOT_PROFILE_DIR", ".")
+
+log = get_logger("profiler")
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that is safe to leave running: a daemon thread wakes
+    every 'interval' seconds, grabs every other thread's current stack with
+    sys._current_frames() and counts it as a folded stack ('root;caller;leaf').
+    Nothing is hooked into the profiled code, so the overhead does not grow
+    with the amount of work being done.
+
+    Stacks are grouped by thread name and, on the thread running an attached
+    asyncio loop, by the task that was running (its coroutine name). dump()
+    writes flamegraph.pl / speedscope compatible folded stacks plus a
+    per-function self/total time report.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()     # { folded stack: samples }
+        self.samples = 0
+        self.truncated = 0
+        self.started = None
+        self.last_sample = None
+        self.loops = {}             # { thread ident: asyncio loop } for per-task attribution
+        self.labels = {}            # { code object: label } (cache, labels are built once)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def attach_loop(self, loop=None):
+        """Attributes samples of the thread running 'loop' to the asyncio task that was running."""
+        import asyncio # Only needed with a loop attached (the CLI has none)
+        self.loops[threading.get_ident()] = loop or asyncio.get_running_loop()
+
+    def start(self):
+        if self.thread: return
+        self.started = time.time()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+        log.info(f"🔬 Sampling profiler running ({1 / self.interval:.0f} Hz)")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread: self.thread.join(timeout=1)
+        self.thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, frame in frames.items():
+                    if ident != own: self._record(names.get(ident, str(ident)), ident, frame)
+                self.samples += 1; self.last_sample = time.time()
+            del frames
+
+    def _record(self, thread_name, ident, frame):
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            label = self.labels.get(frame.f_code)
+            if label is None: label = self.labels[frame.f_code] = _frame_label(frame.f_code)
+            stack.append(label)
+            frame = frame.f_back
+        root = [f"thread:{thread_name}"]
+        loop = self.loops.get(ident)
+        if loop is not None:
+            try: task = sys.modules['asyncio'].current_task(loop) # Safe from another thread; a stale answer only mislabels one sample
+            except RuntimeError: task = None
+            if task is not None: root.append(f"task:{getattr(task.get_coro(), '__qualname__', task.get_name())}")
+            else: root.append("task:<event loop>")
+        folded = ";".join(root + stack[::-1])
+        if folded in self.stacks or len(self.stacks) < MAX_STACKS: self.stacks[folded] += 1
+        else: self.truncated += 1
+
+    def reset(self):
+        with self.lock: self.stacks.clear(); self.samples = 0; self.truncated = 0; self.started = time.time()
+
+    def sample_seconds(self):
+        """Wall time one sample stands for (measured: the sampler thread wakes up late under load)."""
+        if not self.samples or not self.last_sample: return self.interval
+        return (self.last_sample - self.started) / self.samples
+
+    def function_times(self):
+        """{function: (self seconds, total seconds)}: leaf samples and samples with the function anywhere on the stack."""
+        with self.lock: stacks = list(self.stacks.items())
+        self_samples = Counter(); total_samples = Counter(); seconds = self.sample_seconds()
+        for folded, count in stacks:
+            frames = [f for f in folded.split(";") if not f.startswith(("thread:", "task:"))]
+            if not frames: continue
+            self_samples[frames[-1]] += count
+            for function in set(frames): total_samples[function] += count # Recursion counts once per sample
+        return {f: (self_samples[f] * seconds, total * seconds) for f, total in total_samples.items()}
+
+    def dump(self, directory=DUMP_DIR, prefix="profile"):
+        """Writes <prefix>-<time>.folded (flamegraph input) and .txt (top functions). Returns the two paths."""
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        folded_path = os.path.join(directory, f"{prefix}-{stamp}.folded")
+        report_path = os.path.join(directory, f"{prefix}-{stamp}.txt")
+        with self.lock: stacks = sorted(self.stacks.items()); samples = self.samples; truncated = self.truncated
+        with open(folded_path, "w") as f:
+            for folded, count in stacks: f.write(f"{folded} {count}\n")
+            if truncated: f.write(f"[truncated] {truncated}\n")
+        times = self.function_times()
+        elapsed = (self.last_sample or time.time()) - (self.started or time.time())
+        with open(report_path, "w") as f:
+            f.write(f"# {samples} samples at {1 / self.interval:.0f} Hz over {elapsed:.0f}s ({len(stacks)} distinct stacks, {truncated} truncated)\n")
+            f.write(f"# {'self s':>9} {'total s':>9}  function\n")
+            for function, (self_s, total_s) in sorted(times.items(), key=lambda item: item[1][0], reverse=True)[:200]:
+                f.write(f"  {self_s:9.2f} {total_s:9.2f}  {function}\n")
+        log.info(f"🔬 Profile written: {folded_path}, {report_path}")
+        return folded_path, report_path
+
+    def install_signal_handler(self, loop=None, sig=DUMP_SIGNAL):
+        """Dumps on 'sig' (SIGUSR2 by default): via the event loop if given, else as a plain signal handler."""
+        if sig is None: return # Not available on this platform
+        dump = lambda: threading.Thread(target=self.dump, name="profile-dump", daemon=True).start() # File I/O off the hot thread
+        if loop is not None: loop.add_signal_handler(sig, dump)
+        else: signal.signal(sig, lambda signum, frame: dump())
+        log.info(f"🔬 Send {signal.Signals(sig).name} to process {os.getpid()} to write a profile")
+
+
+def profiling_requested(argv=None):
+    """True if '--profile' was given on the command line (and removes it, so it does not confuse other parsing)."""
+    argv = sys.argv if argv is None else argv
+    if "--profile" not in argv: return False
+    argv.remove("--profile")
+    return True
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import heapq
+from datetime import datetime, timedelta, time as dt_time
+from hotspot_logging import get_logger
+
+log = get_logger("schedule")
+
+# How far ahead next_transition() looks for a real state change before it
+# settles for a plain re-check (a week covers every repeat rule)
+LOOKAHEAD_DAYS = 8
+ALL_DAYS = frozenset(range(7))
+
+
+class CompiledSchedule:
+    """
+    A schedule row parsed once into times, dates and the set of weekdays it
+    repeats on. Evaluation matches the original checker exactly: the end time
+    is inclusive, an overnight window (start > end) is judged against the
+    current date's repeat rule, and custom_days use JS weekday numbers (0 = Sunday).
+    Raises ValueError/TypeError/KeyError on malformed rows.
+    """
+    __slots__ = ('schedule', 'id', 'device_ip', 'start_time', 'end_time', 'overnight',
+                 'first_date', 'last_date', 'weekdays', 'never')
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.id = schedule['id']
+        self.device_ip = schedule['device_ip']
+        self.start_time = dt_time.fromisoformat(schedule['start_time'])
+        self.end_time = dt_time.fromisoformat(schedule['end_time'])
+        self.overnight = self.start_time > self.end_time
+        start_date = datetime.strptime(schedule['start_date'], '%Y-%m-%d').date() if schedule.get('start_date') else None
+        end_date = datetime.strptime(schedule['end_date'], '%Y-%m-%d').date() if schedule.get('end_date') else None
+        self.first_date = start_date
+        self.last_date = end_date
+        self.never = False
+
+        repeat_mode = schedule['repeat_mode']
+        if repeat_mode == 'once':
+            # Only ever active on its start date
+            self.weekdays = ALL_DAYS
+            self.never = start_date is None
+            if start_date and (end_date is None or start_date < end_date): self.last_date = start_date
+        elif repeat_mode == 'daily': self.weekdays = ALL_DAYS
+        elif repeat_mode == 'weekdays': self.weekdays = frozenset(range(5))
+        elif repeat_mode == 'weekends': self.weekdays = frozenset((5, 6))
+        elif repeat_mode == 'custom':
+            # JS getDay() -> Python weekday(): Sunday 0 -> 6, Monday 1 -> 0, ...
+            self.weekdays = frozenset((d - 1) % 7 for d in (schedule.get('custom_days') or []) if isinstance(d, int))
+        else:
+            self.weekdays = frozenset()
+        if not self.weekdays or (self.first_date and self.last_date and self.first_date > self.last_date):
+            self.never = True
+
+    def day_active(self, day):
+        return (not self.never
+                and (self.first_date is None or day >= self.first_date)
+                and (self.last_date is None or day <= self.last_date)
+                and day.weekday() in self.weekdays)
+
+    def time_active(self, t):
+        if self.overnight: return t >= self.start_time or t <= self.end_time
+        return self.start_time <= t <= self.end_time
+
+    def is_active(self, now):
+        return self.day_active(now.date()) and self.time_active(now.time())
+
+    def next_transition(self, now):
+        """
+        Returns the first instant after 'now' at which is_active() flips, or None
+        if it never changes again. The state can only change at a start time, just
+        after an end time (end is inclusive) or at midnight (repeat rules).
+        """
+        if self.never: return None
+        today = now.date()
+        if self.last_date is not None and today > self.last_date: return None
+        if self.first_date is not None and today < self.first_date:
+            # Nothing can be active before the first date
+            today = self.first_date
+            if self.is_active(datetime.combine(today, dt_time.min)): return datetime.combine(today, dt_time.min)
+
+        current = self.is_active(now)
+        candidates = []
+        for offset in range(LOOKAHEAD_DAYS):
+            day = today + timedelta(days=offset)
+            candidates.append(datetime.combine(day, self.start_time))
+            candidates.append(datetime.combine(day, self.end_time) + timedelta(seconds=1))
+            candidates.append(datetime.combine(day + timedelta(days=1), dt_time.min))
+        candidates.sort()
+        for instant in candidates:
+            if instant > now and self.is_active(instant) != current:
+                return instant
+        if self.last_date is not None and candidates[-1].date() > self.last_date: return None
+        return candidates[-1]   # No change within the look-ahead: just re-check then
+
+
+class ScheduleTimeline:
+    """
+    All enabled schedules, compiled, plus a min-heap of their next transition
+    instants so the scheduler can sleep until exactly the next change.
+    """
+    def __init__(self):
+        self.compiled = {}   # { schedule_id: CompiledSchedule }
+        self._heap = []      # [(instant, schedule_id)]
+
+    def rebuild(self, schedules, now=None):
+        """Recompiles every enabled schedule. Invalid rows are reported once and skipped."""
+        now = now or datetime.now()
+        self.compiled = {}
+        self._heap = []
+        for schedule in schedules:
+            if not schedule.get('is_enabled'): continue
+            try:
+                compiled = CompiledSchedule(schedule)
+            except (ValueError, TypeError, KeyError):
+                log.warning(f"⚠️ Invalid time/date format for schedule ID {schedule.get('id')}. Skipping.")
+                continue
+            self.compiled[compiled.id] = compiled
+            instant = compiled.next_transition(now)
+            if instant: self._heap.append((instant, compiled.id))
+        heapq.heapify(self._heap)
+
+    def get(self, schedule_id):
+        return self.compiled.get(schedule_id)
+
+    def next_wakeup(self):
+        """The earliest pending transition, or None if nothing is scheduled to change."""
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None):
+        """Pops every transition at or before 'now' and returns the set of affected device IPs."""
+        now = now or datetime.now()
+        devices = set()
+        while self._heap and self._heap[0][0] <= now:
+            _, schedule_id = heapq.heappop(self._heap)
+            compiled = self.compiled.get(schedule_id)
+            if not compiled: continue
+            devices.add(compiled.device_ip)
+            instant = compiled.next_transition(now)
+            if instant: heapq.heappush(self._heap, (instant, schedule_id))
+        return devices
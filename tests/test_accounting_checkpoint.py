@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+import accounting_checkpoint as ckpt
+
+
+RECORDS = {
+    '10.42.0.5': {'raw': (ckpt.SOURCE_TC, 15, 3, 7, 123456789, 987654321),
+                  'tc': (1, 2, 3, 4, 1700000000.5, 1700000100.25),
+                  'quota': (1700000000.0, 5 * 2 ** 30, 2 ** 20, 1)},
+    '10.42.0.9': {'raw': (ckpt.SOURCE_IPTABLES, 0, 3, 0, 2 ** 64 - 1, 0), 'ipt': (0, 0, 0, 0, 0.0, 0.0)},
+    'fe80::1': {},
+}
+
+
+def test_round_trip():
+    saved_at, records = ckpt.decode_checkpoint(ckpt.encode_checkpoint(RECORDS, saved_at=1700000200.0))
+    assert saved_at == 1700000200.0
+    assert records == RECORDS
+
+
+def test_every_truncation_is_rejected():
+    data = ckpt.encode_checkpoint(RECORDS)
+    for length in range(len(data)):
+        with pytest.raises(ValueError):
+            ckpt.decode_checkpoint(data[:length])
+
+
+def test_corruption_is_rejected():
+    data = bytearray(ckpt.encode_checkpoint(RECORDS))
+    for position in (0, 10, len(data) // 2, len(data) - 1):
+        corrupt = bytearray(data); corrupt[position] ^= 0x01
+        with pytest.raises(ValueError):
+            ckpt.decode_checkpoint(bytes(corrupt))
+
+
+def test_foreign_version_is_rejected(monkeypatch):
+    monkeypatch.setattr(ckpt, '_VERSION', ckpt._VERSION + 1)
+    data = ckpt.encode_checkpoint(RECORDS)
+    monkeypatch.undo()
+    with pytest.raises(ValueError, match="version"):
+        ckpt.decode_checkpoint(data)
+
+
+def test_write_and_read_file(tmp_path):
+    path = str(tmp_path / 'accounting.ckpt')
+    assert ckpt.read_checkpoint(path) is None
+    assert ckpt.write_checkpoint(RECORDS, path)
+    saved_at, records = ckpt.read_checkpoint(path)
+    assert records == RECORDS and abs(time.time() - saved_at) < 60
+    with open(path, 'r+b') as f: f.truncate(20)
+    assert ckpt.read_checkpoint(path) is None
+
+
+def test_old_checkpoint_is_ignored(tmp_path):
+    path = tmp_path / 'accounting.ckpt'
+    path.write_bytes(ckpt.encode_checkpoint(RECORDS, saved_at=time.time() - ckpt.MAX_CHECKPOINT_AGE - 60))
+    assert ckpt.read_checkpoint(str(path)) is None
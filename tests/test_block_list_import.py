@@ -0,0 +1,37 @@
+from block_list_import import BlockListParser, normalize_entry
+
+
+def test_normalize_entry():
+    assert normalize_entry('10.0.0.7/24') == '10.0.0.0/24'
+    assert normalize_entry('10.0.0.7/32') == '10.0.0.7'
+    assert normalize_entry(' "1.2.3.4" ') == '1.2.3.4'
+    assert normalize_entry('2a03::1/64') == '2a03::/64'
+    for invalid in ('1.2.3.4/40', 'foo.bar', '12', '', '300.1.1.1'):
+        assert normalize_entry(invalid) is None
+
+
+def test_parser_formats_and_stats():
+    lines = [
+        '\ufeff# Threat list v1',
+        'ip,first_seen,reason',
+        '1.2.3.4,2024-01-01,scanner',
+        '5.6.7.0/24 ; SBL123',
+        '',
+        '2001:db8::/32   # documentation range',
+        '1.2.3.4',          # Duplicate
+        '5.6.7.8/24',       # Same network as line 4 once normalized
+        'garbage line',
+    ]
+    parser = BlockListParser()
+    entries = [entry for chunk in parser.chunks(lines) for entry in chunk]
+    assert entries == ['1.2.3.4', '5.6.7.0/24', '2001:db8::/32']
+    assert parser.stats() == {'lines': len(lines), 'entries': 3, 'skipped': 2, 'duplicates': 2}
+
+
+def test_parser_chunks_and_dedup_across_calls():
+    parser = BlockListParser(chunk_size=3)
+    chunks = list(parser.chunks(f'10.0.0.{i}' for i in range(10)))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+    # A second upload chunk sees the entries of the first one
+    assert list(parser.chunks(['10.0.0.1', '10.0.0.99'])) == [['10.0.0.99']]
+    assert parser.stats()['duplicates'] == 1
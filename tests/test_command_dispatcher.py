@@ -0,0 +1,66 @@
+import asyncio
+
+from command_dispatcher import CommandDispatcher
+
+
+def route(message):
+    """Like web_daemon.route_command: lane, coalesce key, exclusive."""
+    return message.get('lane', 'default'), message.get('key'), message.get('exclusive', False)
+
+
+def run_dispatcher(messages, handler_delay=0.01):
+    async def main():
+        log = []
+        async def handler(message):
+            log.append(('start', message['id']))
+            await asyncio.sleep(message.get('delay', handler_delay))
+            if message.get('fail'): raise RuntimeError("boom")
+            log.append(('end', message['id']))
+        dispatcher = CommandDispatcher(handler, route)
+        for message in messages: dispatcher.submit(message)
+        while dispatcher.workers: await asyncio.gather(*list(dispatcher.workers.values()))
+        return log, dispatcher
+    return asyncio.run(main())
+
+
+def test_lane_runs_in_arrival_order():
+    log, _ = run_dispatcher([{'id': i, 'lane': 'ip:1'} for i in range(5)])
+    assert log == [(event, i) for i in range(5) for event in ('start', 'end')]
+
+
+def test_lanes_run_concurrently():
+    log, _ = run_dispatcher([{'id': 'slow', 'lane': 'a', 'delay': 0.05}, {'id': 'fast', 'lane': 'b'}])
+    assert log.index(('end', 'fast')) < log.index(('end', 'slow'))
+
+
+def test_queued_command_is_coalesced():
+    log, dispatcher = run_dispatcher([{'id': 'running', 'lane': 'ip:1'}, {'id': 'old', 'lane': 'ip:1', 'key': 'limit'},
+                                      {'id': 'other', 'lane': 'ip:1'}, {'id': 'new', 'lane': 'ip:1', 'key': 'limit'}])
+    # The newest payload takes the superseded one's place in the lane
+    assert [i for event, i in log if event == 'start'] == ['running', 'new', 'other']
+    assert dispatcher.snapshot()['commands'][None]['coalesced'] == 1
+
+
+def test_exclusive_waits_for_shared_and_holds_off_new_ones():
+    async def main():
+        log = []
+        async def handler(message):
+            log.append(('start', message['id'])); await asyncio.sleep(0.02); log.append(('end', message['id']))
+        dispatcher = CommandDispatcher(handler, route)
+        dispatcher.submit({'id': 'shared', 'lane': 'a'})
+        await asyncio.sleep(0) # 'shared' holds the lock
+        dispatcher.submit({'id': 'toggle', 'lane': 'lifecycle', 'exclusive': True})
+        await asyncio.sleep(0)
+        dispatcher.submit({'id': 'later', 'lane': 'b'})
+        while dispatcher.workers: await asyncio.gather(*list(dispatcher.workers.values()))
+        return log
+    log = asyncio.run(main())
+    assert log.index(('end', 'shared')) < log.index(('start', 'toggle'))
+    assert log.index(('end', 'toggle')) < log.index(('start', 'later'))
+
+
+def test_failing_command_is_counted_and_lane_continues():
+    log, dispatcher = run_dispatcher([{'id': 'bad', 'fail': True}, {'id': 'good'}])
+    assert ('end', 'good') in log
+    assert dispatcher.snapshot()['commands'][None]['errors'] == 1
+    assert dispatcher.queue_depth() == 0 and not dispatcher.lanes
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("msgpack") # Ships with channels_redis
+
+from delta_publisher import DeltaPublisher, decode_frame, encode_frame
+
+
+def test_deltas_carry_only_changes():
+    publisher = DeltaPublisher(topic='devices')
+    first = publisher.publish({'status': 'ON', 'devices': [{'ip': '10.0.0.2', 'rx': 1}, {'ip': '10.0.0.3', 'rx': 5}]})
+    assert first['seq'] == 1 and first['fields'] == {'status': 'ON'} and set(first['devices']) == {'10.0.0.2', '10.0.0.3'}
+    assert publisher.publish({'status': 'ON', 'devices': [{'ip': '10.0.0.2', 'rx': 1}, {'ip': '10.0.0.3', 'rx': 5}]}) is None
+    delta = publisher.publish({'status': 'ON', 'devices': [{'ip': '10.0.0.3', 'rx': 6}, {'ip': '10.0.0.4', 'rx': 0}]})
+    assert delta == {'epoch': publisher.epoch, 'seq': 2, 'devices': {'10.0.0.3': {'rx': 6}, '10.0.0.4': {'ip': '10.0.0.4', 'rx': 0}}, 'removed': ['10.0.0.2']}
+
+
+def test_snapshot_keeps_first_seen_order():
+    publisher = DeltaPublisher()
+    publisher.publish({'devices': [{'ip': 'b'}, {'ip': 'a'}]})
+    publisher.publish({'devices': [{'ip': 'a', 'x': 1}, {'ip': 'c'}, {'ip': 'b'}]})
+    snapshot = publisher.snapshot()
+    assert snapshot['seq'] == 2
+    assert [device['ip'] for device in snapshot['data']['devices']] == ['b', 'a', 'c']
+
+
+@pytest.mark.parametrize("size", [10, 5000])
+def test_frame_round_trip(size):
+    message = {'type': 'delta', 'seq': 7, 'devices': {str(i): {'rx': i} for i in range(size)}}
+    frame = encode_frame(message)
+    assert decode_frame(frame) == message
+    assert frame[0] == (1 if size > 100 else 0) # Large frames are deflated
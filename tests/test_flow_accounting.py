@@ -0,0 +1,55 @@
+import random
+from collections import Counter
+
+from flow_accounting import FlowAccounting, SpaceSaving, parse_conntrack
+from prefix_index import PrefixIndex
+
+
+def test_space_saving_bounds():
+    rng = random.Random(1)
+    exact = Counter()
+    sketch = SpaceSaving(capacity=16)
+    for _ in range(20000):
+        key = f"heavy{rng.randrange(4)}" if rng.random() < 0.5 else f"tail{rng.randrange(5000)}"
+        weight = rng.randint(1, 1500)
+        exact[key] += weight; sketch.add(key, weight)
+    assert len(sketch) <= 16 and sketch.total == sum(exact.values())
+    for key, count, error in sketch.top(16):
+        assert exact[key] <= count <= exact[key] + error # Overestimate by at most 'error'
+    # Every key above total/capacity is guaranteed to be kept
+    heavy = {key for key, count in exact.items() if count > sketch.total / 16}
+    assert heavy and heavy <= set(sketch.counts)
+
+
+def test_space_saving_exact_below_capacity():
+    sketch = SpaceSaving(capacity=4)
+    for key, weight in (('a', 5), ('b', 3), ('a', 2), ('c', 1)):
+        sketch.add(key, weight)
+    assert sketch.top(2) == [('a', 7, 0), ('b', 3, 0)]
+
+
+PROC_LINE = ("ipv4     2 tcp      6 431999 ESTABLISHED src=10.42.0.5 dst=1.1.1.1 sport=50000 dport=443 packets=10 bytes={orig} "
+             "src=1.1.1.1 dst=10.42.0.5 sport=443 dport=50000 packets=12 bytes={reply} [ASSURED] mark=0 use=1")
+
+
+def test_parse_conntrack():
+    lines = [PROC_LINE.format(orig=100, reply=900),
+             "icmp     1 29 src=10.42.0.5 dst=8.8.8.8 type=8 code=0 id=77 packets=1 bytes=84 src=8.8.8.8 dst=10.42.0.5 type=0 code=0 id=77 packets=1 bytes=84 mark=0 use=1",
+             "tcp      6 10 CLOSE src=10.42.0.5 dst=1.1.1.1 sport=1 dport=2 src=1.1.1.1 dst=10.42.0.5 sport=2 dport=1 mark=0 use=1", # Accounting off
+             "garbage"]
+    assert list(parse_conntrack(lines)) == [('tcp', '10.42.0.5', '1.1.1.1', '50000', '443', 100, 900),
+                                            ('icmp', '10.42.0.5', '8.8.8.8', '77', None, 84, 84)]
+
+
+def test_first_poll_is_a_baseline():
+    flows = FlowAccounting()
+    networks = PrefixIndex(['10.42.0.0/24'])
+    def poll(orig, reply):
+        flows._read = lambda consume: consume([PROC_LINE.format(orig=orig, reply=reply)])
+        return flows.poll(networks)
+    assert poll(10 ** 9, 10 ** 9) == 1
+    assert flows.top('10.42.0.5') == [] # Lifetime bytes of a connection open at start are not charged
+    poll(10 ** 9 + 100, 10 ** 9 + 400)
+    assert flows.top('10.42.0.5') == [{"remote": '1.1.1.1', "port": 443, "proto": 'tcp', "bytes": 500, "error": 0}]
+    poll(50, 50) # Tuple reused by a new connection: counted from zero
+    assert flows.top('10.42.0.5')[0]['bytes'] == 600
@@ -0,0 +1,64 @@
+import ipaddress
+import random
+
+import pytest
+
+from prefix_index import PrefixIndex, collapse_networks, parse_network
+
+
+def random_networks(rng, version, count):
+    bits = 32 if version == 4 else 128
+    kind = ipaddress.IPv4Network if version == 4 else ipaddress.IPv6Network
+    base = 0x0A000000 if version == 4 else 0x20010DB8 << 96 # Clustered, so networks overlap, nest and touch
+    span = 1 << (16 if version == 4 else 20)
+    networks = []
+    for _ in range(count):
+        prefix = rng.randint(bits - 12, bits)
+        networks.append(kind((base + rng.randrange(span), prefix), strict=False))
+    return networks
+
+
+@pytest.mark.parametrize("version", [4, 6])
+@pytest.mark.parametrize("seed", range(20))
+def test_collapse_matches_ipaddress(version, seed):
+    rng = random.Random(seed)
+    networks = random_networks(rng, version, rng.randint(1, 300))
+    assert collapse_networks(networks) == list(ipaddress.collapse_addresses(networks))
+
+
+def test_collapse_edge_cases():
+    net = ipaddress.ip_network
+    assert collapse_networks([net('0.0.0.0/0'), net('10.0.0.0/8')]) == [net('0.0.0.0/0')]
+    assert collapse_networks([net('10.0.0.0/25'), net('10.0.0.128/25')]) == [net('10.0.0.0/24')]
+    assert collapse_networks([net('10.0.0.1/32'), net('10.0.0.2/32')]) == [net('10.0.0.1/32'), net('10.0.0.2/32')]
+    assert collapse_networks([net('255.255.255.255/32'), net('255.255.255.254/32')]) == [net('255.255.255.254/31')]
+    assert collapse_networks([net('::/0'), net('::1/128')]) == [net('::/0')]
+
+
+def brute_force_lookup(entries, address):
+    matches = [(network, value) for network, value in entries if network.version == address.version and address in network]
+    return max(matches, key=lambda match: match[0].prefixlen) if matches else None
+
+
+@pytest.mark.parametrize("version", [4, 6])
+@pytest.mark.parametrize("seed", range(10))
+def test_lookup_is_longest_prefix(version, seed):
+    rng = random.Random(seed)
+    entries = list({network: i for i, network in enumerate(random_networks(rng, version, 200))}.items())
+    index = PrefixIndex(entries)
+    assert len(index) == len(entries)
+    for network, _ in rng.sample(entries, 50):
+        for address in (network.network_address, network.broadcast_address, network.network_address - 1, network.broadcast_address + 1):
+            assert index.lookup(address) == brute_force_lookup(entries, address)
+
+
+def test_lookup_mixed_versions_and_bad_input():
+    index = PrefixIndex([('10.0.0.0/8', 'lan'), ('10.1.0.0/16', 'guest'), ('2001:db8::/32', 'v6')])
+    assert index.value('10.1.2.3') == 'guest'
+    assert index.value('10.2.0.1') == 'lan'
+    assert index.value('2001:db8::1') == 'v6'
+    assert index.value('11.0.0.1', 'none') == 'none'
+    assert index.lookup('not an address') is None
+    assert '10.255.255.255' in index and '9.255.255.255' not in index
+    assert index.networks() == [parse_network('10.0.0.0/8'), parse_network('10.1.0.0/16'), parse_network('2001:db8::/32')]
+    assert not PrefixIndex()
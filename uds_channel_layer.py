@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import os
+import struct
+import uuid
+import msgpack # Ships with channels_redis; the layer itself needs no Redis server
+from channels.exceptions import ChannelFull # type: ignore
+from channels.layers import BaseChannelLayer # type: ignore
+
+# --- Configuration ---
+DEFAULT_SOCKET_PATH = "/tmp/hotspot_channels.sock"
+MAX_FRAME_BYTES = 16 * 1024 * 1024   # Larger frames mean a corrupt stream: drop the connection
+RECONNECT_SECONDS = 1.0              # Client retry delay while the daemon (hub) is down
+HUB_NODE = "hub"
+
+log = logging.getLogger("hotspot.channels") # Also imported by Django, which has no hotspot_logging setup
+
+_HEADER = struct.Struct("!I")   # Every frame: 4-byte big-endian length, then a msgpack list [op, *args]
+
+
+async def read_frame(reader):
+    size, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if size > MAX_FRAME_BYTES: raise ValueError(f"frame of {size} bytes")
+    return msgpack.unpackb(await reader.readexactly(size), raw=False, strict_map_key=False)
+
+
+def write_frame(writer, *frame):
+    body = msgpack.packb(list(frame), use_bin_type=True)
+    writer.write(_HEADER.pack(len(body)) + body)
+
+
+def channel_node(channel):
+    """Which process owns a channel: new_channel() names are 'specific.<node>!<token>'."""
+    return channel.partition("!")[0].rpartition(".")[2]
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    """
+    Channel layer over a Unix domain socket for single-host deployments: the
+    daemon runs the hub (serve=True), Daphne connects to it as a client. Only
+    the API this app uses is implemented: new_channel, send, receive,
+    group_add/group_discard/group_send, flush and close.
+
+    Channel names carry the node (process) that owns them, so the hub forwards
+    a message straight to that process; group membership lives in the hub and
+    is dropped when a client disconnects. Clients reconnect on their own and
+    re-register their groups, so either side can restart. Messages are
+    process-to-process only: nothing is stored while the hub is down.
+    """
+    extensions = ["groups", "flush"]
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, serve=False, expiry=60, capacity=100, channel_capacity=None, group_expiry=86400):
+        super().__init__(expiry=expiry, capacity=capacity)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = path
+        self.serve = serve
+        self.group_expiry = group_expiry  # Accepted for config compatibility; membership ends with the connection
+        self.node = HUB_NODE if serve else uuid.uuid4().hex[:12]
+        self.queues = {}        # { channel: asyncio.Queue } of this process's channels
+        self.groups = {}        # Hub: { group: {channel} }
+        self.peers = {}         # Hub: { node: StreamWriter }
+        self.memberships = set()  # Client: (group, channel) to re-register after a reconnect
+        self.server = None
+        self.writer = None      # Client connection to the hub
+        self.reader_task = None
+        self.connect_lock = None
+        self.retry_handle = None
+        self.closed = False
+
+    # --- Channel layer API ---
+    async def new_channel(self, prefix="specific."):
+        channel = f"{prefix}{self.node}!{uuid.uuid4().hex}"
+        self._queue(channel)
+        return channel
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        if self.serve or channel_node(channel) == self.node: await self._route(channel, message, raise_full=True)
+        else: await self._to_hub("send", channel, message)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        if not self.serve: await self._connect() # Deliveries need a connection; retried in the background while the hub is down
+        return await self._queue(channel).get()
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        if self.serve: self.groups.setdefault(group, set()).add(channel); return
+        self.memberships.add((group, channel))
+        await self._to_hub("group_add", group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        if self.serve: self._discard(group, channel); return
+        self.memberships.discard((group, channel))
+        await self._to_hub("group_discard", group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        if not self.serve: await self._to_hub("group_send", group, message); return
+        for channel in list(self.groups.get(group, ())): await self._route(channel, message)
+
+    async def flush(self):
+        self.queues = {}; self.groups = {}; self.memberships = set()
+
+    async def close(self):
+        self.closed = True
+        if self.retry_handle: self.retry_handle.cancel()
+        if self.reader_task: self.reader_task.cancel()
+        if self.writer: self.writer.close()
+        for writer in list(self.peers.values()): writer.close()
+        if self.server:
+            self.server.close(); await self.server.wait_closed()
+            if os.path.exists(self.path): os.unlink(self.path)
+        self.server = self.writer = self.reader_task = self.retry_handle = None
+
+    # --- Local delivery ---
+    def _queue(self, channel):
+        queue = self.queues.get(channel)
+        if queue is None: queue = self.queues[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    async def _route(self, channel, message, raise_full=False):
+        """Delivers to a local queue or (hub) forwards to the owning client. Full channels drop, like group_send on Redis."""
+        node = channel_node(channel)
+        if node == self.node:
+            try: self._queue(channel).put_nowait(message)
+            except asyncio.QueueFull:
+                if raise_full: raise ChannelFull(channel)
+            return
+        writer = self.peers.get(node)
+        if writer is None: return # Owner disconnected: nobody will ever read this channel
+        try:
+            write_frame(writer, "deliver", channel, message)
+            await writer.drain()
+        except (ConnectionError, RuntimeError): self._drop_peer(node)
+
+    def _discard(self, group, channel):
+        members = self.groups.get(group)
+        if members is None: return
+        members.discard(channel)
+        if not members: del self.groups[group]
+
+    # --- Hub (daemon side) ---
+    async def start(self):
+        """Binds the socket. Called by the daemon before it uses the layer."""
+        if os.path.exists(self.path): os.unlink(self.path) # Left over from a crash
+        self.server = await asyncio.start_unix_server(self._serve_client, path=self.path)
+        os.chmod(self.path, 0o660)
+        # The daemon runs under sudo: let the user who started it (and runs Daphne) connect
+        if os.environ.get("SUDO_UID"): os.chown(self.path, int(os.environ["SUDO_UID"]), int(os.environ.get("SUDO_GID", -1)))
+        log.info(f"🔌 Channel layer listening on {self.path}")
+
+    async def _serve_client(self, reader, writer):
+        node = None
+        try:
+            while True:
+                op, *args = await read_frame(reader)
+                if op == "hello":
+                    node = args[0]; self.peers[node] = writer
+                elif op == "send":
+                    await self._route(args[0], args[1])
+                elif op == "group_add":
+                    self.groups.setdefault(args[0], set()).add(args[1])
+                elif op == "group_discard":
+                    self._discard(args[0], args[1])
+                elif op == "group_send":
+                    for channel in list(self.groups.get(args[0], ())): await self._route(channel, args[1])
+        except (asyncio.IncompleteReadError, ConnectionError): pass
+        except Exception as e: log.warning(f"⚠️ Channel layer client error: {e}")
+        finally:
+            if node: self._drop_peer(node)
+            writer.close()
+
+    def _drop_peer(self, node):
+        writer = self.peers.pop(node, None)
+        if writer: writer.close()
+        for group in list(self.groups):
+            for channel in [c for c in self.groups[group] if channel_node(c) == node]: self._discard(group, channel)
+
+    # --- Client (Daphne side) ---
+    async def _connect(self):
+        """The connection to the hub, connecting once if there is none. None while the hub (daemon) is down."""
+        if self.writer is not None and not self.writer.is_closing(): return self.writer
+        if self.connect_lock is None: self.connect_lock = asyncio.Lock()
+        async with self.connect_lock:
+            if self.writer is None or self.writer.is_closing():
+                try: reader, writer = await asyncio.open_unix_connection(self.path)
+                except OSError:
+                    self.writer = None; self._retry_later(); return None
+                write_frame(writer, "hello", self.node)
+                for group, channel in self.memberships: write_frame(writer, "group_add", group, channel)
+                await writer.drain()
+                self.writer = writer
+                self.reader_task = asyncio.create_task(self._read_hub(reader))
+        return self.writer
+
+    def _retry_later(self):
+        """Reconnects in the background while this process has channels waiting for messages."""
+        if self.retry_handle is not None or self.closed or not self.queues: return
+        def retry():
+            self.retry_handle = None
+            asyncio.ensure_future(self._connect())
+        self.retry_handle = asyncio.get_running_loop().call_later(RECONNECT_SECONDS, retry)
+
+    async def _to_hub(self, *frame):
+        writer = await self._connect()
+        if writer is None: return # Nobody to deliver to; group_add is replayed on connect
+        try:
+            write_frame(writer, *frame)
+            await writer.drain()
+        except (ConnectionError, RuntimeError):
+            writer.close() # Reconnected (and groups re-registered) on the next call; this message is lost
+
+    async def _read_hub(self, reader):
+        writer = self.writer
+        try:
+            while True:
+                op, channel, message = await read_frame(reader)
+                if op == "deliver":
+                    try: self._queue(channel).put_nowait(message)
+                    except asyncio.QueueFull: pass
+        except (asyncio.IncompleteReadError, ConnectionError): pass
+        finally:
+            writer.close()
+            if self.writer is writer: self.writer = None
+            self._retry_later()